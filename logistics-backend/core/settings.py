@@ -134,6 +134,12 @@ STATIC_URL = 'static/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Registro das execucoes do otimizador gravado em segundo plano (desligue para gravar na propria requisicao)
+LOGISTICS_EXECUCOES_ASSINCRONAS = config('LOGISTICS_EXECUCOES_ASSINCRONAS', default=True, cast=bool)
+
+# Segundos ate o grafo de conflitos entre familias ser recompilado mesmo sem sinal de alteracao
+LOGISTICS_GRAFO_RESTRICOES_VALIDADE_S = config('LOGISTICS_GRAFO_RESTRICOES_VALIDADE_S', default=60, cast=int)
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
@@ -1,6 +1,7 @@
 from django.contrib import admin
 from logistics.models import (
     Familia,
+    OtimizacaoExecucao,
     Pedido,
     PedidoRestricaoGrupo,
     Produto,
@@ -10,14 +11,78 @@ from logistics.models import (
     RotaPedido,
     RotaTrajeto,
 )
+from logistics.services.totais import recalcular_estatisticas_rotas, recalcular_totais
+
+
+class ProdutoPedidoAdmin(admin.ModelAdmin):
+    # Itens editados aqui fora dos fluxos da API: mantem os totais do pedido em dia.
+    def save_model(self, request, obj, form, change):
+        pedido_anterior = form.initial.get("pedido") if change else None
+        super().save_model(request, obj, form, change)
+        recalcular_totais(pedido_ids={obj.pedido_id, pedido_anterior} - {None})
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        recalcular_totais(pedido_ids=[obj.pedido_id])
+
+    def delete_queryset(self, request, queryset):
+        pedido_ids = set(queryset.values_list("pedido_id", flat=True))
+        super().delete_queryset(request, queryset)
+        recalcular_totais(pedido_ids=pedido_ids)
+
+
+class PedidoAdmin(admin.ModelAdmin):
+    # Totais so leitura: sao gravados apenas por services.totais, a partir dos itens.
+    readonly_fields = Pedido.CAMPOS_DESNORMALIZADOS
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        recalcular_totais(pedido_ids=[obj.pk])
+
+    # Os RotaPedido do pedido caem em cascata: as rotas afetadas sao lidas antes de apagar.
+    def delete_model(self, request, obj):
+        rota_ids = set(obj.rotas.values_list("rota_id", flat=True))
+        super().delete_model(request, obj)
+        recalcular_estatisticas_rotas(rota_ids=rota_ids)
+
+    def delete_queryset(self, request, queryset):
+        rota_ids = set(RotaPedido.objects.filter(pedido__in=queryset).values_list("rota_id", flat=True))
+        super().delete_queryset(request, queryset)
+        recalcular_estatisticas_rotas(rota_ids=rota_ids)
+
+
+class RotaAdmin(admin.ModelAdmin):
+    readonly_fields = Rota.CAMPOS_DESNORMALIZADOS
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        recalcular_estatisticas_rotas(rota_ids=[obj.pk])
+
+
+class RotaPedidoAdmin(admin.ModelAdmin):
+    def save_model(self, request, obj, form, change):
+        rota_anterior = form.initial.get("rota") if change else None
+        super().save_model(request, obj, form, change)
+        recalcular_estatisticas_rotas(rota_ids={obj.rota_id, rota_anterior} - {None})
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        recalcular_estatisticas_rotas(rota_ids=[obj.rota_id])
+
+    def delete_queryset(self, request, queryset):
+        rota_ids = set(queryset.values_list("rota_id", flat=True))
+        super().delete_queryset(request, queryset)
+        recalcular_estatisticas_rotas(rota_ids=rota_ids)
+
 
 # Registrar os models no admin
 admin.site.register(Familia)
 admin.site.register(Produto)
-admin.site.register(Pedido)
-admin.site.register(ProdutoPedido)
+admin.site.register(Pedido, PedidoAdmin)
+admin.site.register(ProdutoPedido, ProdutoPedidoAdmin)
 admin.site.register(PedidoRestricaoGrupo)
 admin.site.register(RestricaoFamilia)
-admin.site.register(Rota)
-admin.site.register(RotaPedido)
+admin.site.register(Rota, RotaAdmin)
+admin.site.register(RotaPedido, RotaPedidoAdmin)
 admin.site.register(RotaTrajeto)
+admin.site.register(OtimizacaoExecucao)
@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class CoursesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'logistics'
+
+    def ready(self):
+        # Invalidacao do grafo de conflitos entre familias (services.grafo_restricoes).
+        from . import signals  # noqa: F401
+        # Cache compartilhado exigido pelo cancelamento de otimizacoes (manage.py check --deploy).
+        from . import checks  # noqa: F401
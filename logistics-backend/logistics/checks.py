@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+# Backends cujo conteudo nao e visto pelos outros processos do servidor.
+CACHES_LOCAIS = {
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+}
+
+
+@register(Tags.caches, deploy=True)
+def verificar_cache_compartilhado(app_configs, **kwargs):
+    """
+    O cancelamento de otimizacoes (services.cancelamento) marca a execucao no cache padrao;
+    com cache local ao processo o DELETE so alcanca execucoes do mesmo worker.
+    """
+    backend = settings.CACHES.get("default", {}).get("BACKEND", "")
+    if backend not in CACHES_LOCAIS:
+        return []
+    return [
+        Warning(
+            "O cache padrao nao e compartilhado entre processos; o cancelamento de otimizacoes "
+            "so funciona quando a API roda em um unico processo.",
+            hint="Configure CACHES['default'] com Redis, Memcached ou DatabaseCache.",
+            obj=backend,
+            id="logistics.W001",
+        )
+    ]
@@ -34,7 +34,9 @@ class PedidoFilter(filters.FilterSet):
     data_inicio = filters.DateFilter(field_name="dtpedido", lookup_expr="gte")
     data_fim = filters.DateFilter(field_name="dtpedido", lookup_expr="lte")
     disponivel_para_rota = filters.BooleanFilter(method="filter_disponivel_para_rota")
-    familias = filters.BaseInFilter(field_name="itens__produto__familia__id", lookup_expr="in")
+    familias = filters.BaseInFilter(field_name="itens__produto__familia__id", lookup_expr="in", distinct=True)
+    peso_min = filters.NumberFilter(field_name="peso_total", lookup_expr="gte")
+    peso_max = filters.NumberFilter(field_name="peso_total", lookup_expr="lte")
 
     pedido_base = filters.NumberFilter(method="filter_por_raio")
     raio_km = filters.NumberFilter(method="filter_por_raio")
@@ -79,20 +81,21 @@ class PedidoFilter(filters.FilterSet):
 
             pedidos_com_distancia = {}
 
-            for pedido in queryset:
-                if pedido.id == pedido_base_id:
-                    pedidos_com_distancia[pedido.id] = 0
+            # So as coordenadas: percorrer o queryset completo dispararia anotacoes e prefetches.
+            for pedido_id, latitude, longitude in queryset.values_list("id", "latitude", "longitude"):
+                if pedido_id == pedido_base_id:
+                    pedidos_com_distancia[pedido_id] = 0
                     continue
 
                 distancia = self.calcular_distancia_km(
                     float(pedido_base.latitude),
                     float(pedido_base.longitude),
-                    float(pedido.latitude),
-                    float(pedido.longitude),
+                    float(latitude),
+                    float(longitude),
                 )
 
                 if distancia <= raio_km:
-                    pedidos_com_distancia[pedido.id] = round(distancia, 2)
+                    pedidos_com_distancia[pedido_id] = round(distancia, 2)
 
             if pedido_base_id not in pedidos_com_distancia:
                 pedidos_com_distancia[pedido_base_id] = 0
@@ -115,6 +118,8 @@ class PedidoFilter(filters.FilterSet):
             "data_fim",
             "disponivel_para_rota",
             "familias",
+            "peso_min",
+            "peso_max",
             "pedido_base",
             "raio_km",
         ]
@@ -0,0 +1,213 @@
+import json
+import mmap
+import os
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from .matriz_distancias import BYTES_POR_VALOR, MatrizDistancias
+
+ENV_CAMINHO = "LOGISTICS_DISTANCIAS_PATH"
+CASAS_DECIMAIS_PADRAO = 6  # mesma precisao dos campos latitude/longitude de Pedido
+
+# Recebe (origens, destinos) e devolve a tabela len(origens) x len(destinos) em km.
+TabelaFn = Callable[[List[Tuple[float, float]], List[Tuple[float, float]]], List[List[float]]]
+
+
+class ArmazemDistancias:
+    """
+    Matriz de distancias pre-computada para todos os locais conhecidos, em disco.
+
+    Dois arquivos: `<caminho>` guarda os valores float64 de uma matriz quadrada de
+    `capacidade` x `capacidade` (linha i comeca em i * capacidade), lida via mmap;
+    `<caminho>.json` guarda capacidade, metrica e a lista de locais (a posicao na
+    lista e o indice do local na matriz). Locais novos entram como linhas e colunas
+    acrescentadas no fim; so quando a capacidade estoura o arquivo e reescrito.
+    """
+
+    def __init__(self, caminho: str, somente_leitura: bool = True):
+        self.caminho = caminho
+        self.somente_leitura = somente_leitura
+        with open(self._caminho_indice, encoding="utf-8") as arq:
+            meta = json.load(arq)
+        self.capacidade: int = meta["capacidade"]
+        self.metrica: str = meta.get("metrica", "osrm")
+        self.casas_decimais: int = meta.get("casas_decimais", CASAS_DECIMAIS_PADRAO)
+        self.locais: List[str] = meta["locais"]
+        self._indice_por_local: Dict[str, int] = {local: i for i, local in enumerate(self.locais)}
+        self._abrir_dados()
+
+    @classmethod
+    def criar(
+        cls,
+        caminho: str,
+        capacidade: int = 1024,
+        metrica: str = "osrm",
+        casas_decimais: int = CASAS_DECIMAIS_PADRAO,
+    ) -> "ArmazemDistancias":
+        """Cria um armazem vazio (sobrescreve arquivos existentes) e o abre para escrita."""
+        capacidade = max(1, int(capacidade))
+        with open(caminho, "wb") as arq:
+            arq.truncate(capacidade * capacidade * BYTES_POR_VALOR)
+        cls._gravar_indice(caminho, capacidade, metrica, casas_decimais, [])
+        return cls(caminho, somente_leitura=False)
+
+    @property
+    def _caminho_indice(self) -> str:
+        return f"{self.caminho}.json"
+
+    @staticmethod
+    def _gravar_indice(caminho: str, capacidade: int, metrica: str, casas_decimais: int, locais: List[str]) -> None:
+        # Grava em arquivo temporario e troca de uma vez: leitores nunca veem um indice pela metade.
+        temporario = f"{caminho}.json.tmp"
+        with open(temporario, "w", encoding="utf-8") as arq:
+            json.dump(
+                {"capacidade": capacidade, "metrica": metrica, "casas_decimais": casas_decimais, "locais": locais},
+                arq,
+            )
+        os.replace(temporario, f"{caminho}.json")
+
+    def _abrir_dados(self) -> None:
+        self._arquivo = open(self.caminho, "rb" if self.somente_leitura else "r+b")
+        acesso = mmap.ACCESS_READ if self.somente_leitura else mmap.ACCESS_WRITE
+        self._mmap = mmap.mmap(self._arquivo.fileno(), 0, access=acesso)
+        self._valores = memoryview(self._mmap).cast("d")
+        if len(self._valores) != self.capacidade * self.capacidade:
+            # Indice e dados de geracoes diferentes (arquivo sendo reescrito pelo pre-calculo).
+            self.fechar()
+            raise ValueError("Arquivo de distancias nao corresponde ao indice.")
+
+    def fechar(self) -> None:
+        if self._valores is not None:
+            self._valores.release()
+            self._valores = None
+            self._mmap.close()
+            self._arquivo.close()
+
+    def __len__(self) -> int:
+        return len(self.locais)
+
+    def chave(self, lat: float, lon: float) -> str:
+        return f"{round(float(lat), self.casas_decimais)},{round(float(lon), self.casas_decimais)}"
+
+    def indice(self, lat: float, lon: float) -> Optional[int]:
+        return self._indice_por_local.get(self.chave(lat, lon))
+
+    def __contains__(self, ponto: Tuple[float, float]) -> bool:
+        return self.indice(*ponto) is not None
+
+    def distancia(self, i: int, j: int) -> float:
+        return self._valores[i * self.capacidade + j]
+
+    def submatriz(self, pontos: Sequence[Tuple[float, float]]) -> Optional[MatrizDistancias]:
+        """
+        Fatia a matriz dos `pontos` (na ordem dada) para a memoria compartilhada, sem rede
+        e sem recalculo. Retorna None se algum ponto ainda nao estiver no armazem.
+        """
+        indices = [self.indice(lat, lon) for lat, lon in pontos]
+        if not indices or any(idx is None for idx in indices):
+            return None
+        valores = self._valores
+        capacidade = self.capacidade
+        matriz = MatrizDistancias.criar(len(indices))
+        for i, origem in enumerate(indices):
+            base = origem * capacidade
+            matriz.definir_linha(i, [valores[base + destino] for destino in indices])
+        return matriz
+
+    def _crescer(self, necessario: int) -> None:
+        # Reescreve a matriz com passo maior; as linhas existentes sao copiadas uma a uma.
+        nova_capacidade = max(necessario, self.capacidade * 2)
+        temporario = f"{self.caminho}.tmp"
+        with open(temporario, "wb") as arq:
+            arq.truncate(nova_capacidade * nova_capacidade * BYTES_POR_VALOR)
+        with open(temporario, "r+b") as arq, mmap.mmap(arq.fileno(), 0) as destino_mmap:
+            destino = memoryview(destino_mmap).cast("d")
+            n = len(self.locais)
+            for i in range(n):
+                destino[i * nova_capacidade : i * nova_capacidade + n] = self._valores[
+                    i * self.capacidade : i * self.capacidade + n
+                ]
+            destino.release()
+        self.fechar()
+        os.replace(temporario, self.caminho)
+        self.capacidade = nova_capacidade
+        self._abrir_dados()
+
+    def adicionar(self, pontos: Sequence[Tuple[float, float]], tabela_fn: TabelaFn, bloco: int = 100) -> int:
+        """
+        Acrescenta os pontos ainda desconhecidos. Calcula apenas o que falta: novos x todos
+        e antigos x novos, em blocos de ate `bloco` x `bloco` (limite usual do OSRM /table).
+        Retorna quantos locais foram adicionados.
+        """
+        if self.somente_leitura:
+            raise ValueError("Armazem aberto somente para leitura.")
+
+        novos: List[Tuple[float, float]] = []
+        vistos_em_ordem: List[str] = []
+        vistos = set()
+        for lat, lon in pontos:
+            chave = self.chave(lat, lon)
+            if chave not in self._indice_por_local and chave not in vistos:
+                vistos.add(chave)
+                vistos_em_ordem.append(chave)
+                novos.append(tuple(map(float, chave.split(","))))
+        if not novos:
+            return 0
+
+        antigos = len(self.locais)
+        total = antigos + len(novos)
+        if total > self.capacidade:
+            self._crescer(total)
+
+        todos = [tuple(map(float, local.split(","))) for local in self.locais] + novos
+        bloco = max(1, bloco)
+
+        def _faixas(inicio: int, fim: int) -> List[range]:
+            return [range(i, min(i + bloco, fim)) for i in range(inicio, fim, bloco)]
+
+        # Todos x novos (colunas novas) e novos x antigos (linhas novas); antigos x antigos ja estao no arquivo.
+        pares = [(o, d) for o in _faixas(0, total) for d in _faixas(antigos, total)]
+        pares += [(o, d) for o in _faixas(antigos, total) for d in _faixas(0, antigos)]
+        for origens, destinos in pares:
+            tabela = tabela_fn([todos[i] for i in origens], [todos[j] for j in destinos])
+            for linha, i in zip(tabela, origens):
+                base = i * self.capacidade
+                for valor, j in zip(linha, destinos):
+                    self._valores[base + j] = float(valor)
+
+        self._mmap.flush()
+        self.locais.extend(vistos_em_ordem)
+        for idx in range(antigos, total):
+            self._indice_por_local[self.locais[idx]] = idx
+        self._gravar_indice(self.caminho, self.capacidade, self.metrica, self.casas_decimais, self.locais)
+        return len(novos)
+
+
+_armazens_abertos: Dict[str, Tuple[float, ArmazemDistancias]] = {}
+
+
+def abrir_armazem_padrao() -> Optional[ArmazemDistancias]:
+    """
+    Armazem configurado em LOGISTICS_DISTANCIAS_PATH, aberto para leitura e reaproveitado
+    entre requisicoes; reaberto quando o indice e regravado pelo comando de pre-calculo.
+    """
+    caminho = os.getenv(ENV_CAMINHO)
+    if not caminho:
+        return None
+    try:
+        versao = os.path.getmtime(f"{caminho}.json")
+    except OSError:
+        return None
+
+    aberto = _armazens_abertos.get(caminho)
+    if aberto is not None and aberto[0] == versao:
+        return aberto[1]
+    if aberto is not None:
+        # Indice regravado: solta o mmap da geracao anterior antes de reabrir.
+        del _armazens_abertos[caminho]
+        aberto[1].fechar()
+    try:
+        armazem = ArmazemDistancias(caminho)
+    except (OSError, ValueError, KeyError):
+        return None
+    _armazens_abertos[caminho] = (versao, armazem)
+    return armazem
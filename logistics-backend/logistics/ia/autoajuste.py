@@ -0,0 +1,197 @@
+import itertools
+import math
+import os
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from .genetic_algorithm import algoritmo_genetico, avaliar_rota
+from .heuristicas import busca_local, construir_vizinho_mais_proximo
+from .indice_espacial import IndiceEspacial
+from .matriz_distancias import MatrizDistancias
+from .utils import calcular_distancia
+
+GRADE_PADRAO = {
+    "tamanho_pop": [50, 100, 200],
+    "num_geracoes": [100, 300, 500],
+    "taxa_crossover": [0.7, 0.9],
+    "taxa_mutacao": [0.1, 0.2, 0.3],
+}
+ETA_HALVING = 3  # a cada rodada sobra 1/ETA das configuracoes
+
+Instancia = Tuple[List[Tuple[float, float]], Tuple[float, float]]
+
+
+def gerar_configuracoes(grade: Dict[str, Sequence[Any]]) -> List[Dict[str, Any]]:
+    nomes = list(grade)
+    return [dict(zip(nomes, valores)) for valores in itertools.product(*(grade[nome] for nome in nomes))]
+
+
+def matriz_da_instancia(instancia: Instancia) -> MatrizDistancias:
+    """Matriz Haversine (pedidos + deposito no fim) compartilhada por todas as avaliacoes da instancia."""
+    pedidos_coords, deposito_coords = instancia
+    pontos = list(pedidos_coords) + [deposito_coords]
+    matriz = MatrizDistancias.criar(len(pontos))
+    for i, ponto in enumerate(pontos):
+        matriz.definir_linha(i, (calcular_distancia(ponto, outro) for outro in pontos))
+    return matriz
+
+
+def custo_referencia(instancia: Instancia, matriz: MatrizDistancias) -> float:
+    """Vizinho mais proximo + 2-opt: a escala de cada instancia, para comparar custos entre instancias."""
+    pedidos_coords, deposito_coords = instancia
+    indice = IndiceEspacial(pedidos_coords)
+    distancia_fn = matriz.funcao_distancia()
+    rota = construir_vizinho_mais_proximo(pedidos_coords, deposito_coords, indice)
+    rota = busca_local(rota, distancia_fn, len(pedidos_coords), indice.listas_candidatas(10))
+    return avaliar_rota(rota, pedidos_coords, deposito_coords, distancia_fn, len(pedidos_coords))
+
+
+def avaliar_configuracao(
+    tarefa: Tuple[int, Dict[str, Any], int, Instancia, MatrizDistancias, float, int]
+) -> Tuple[int, int, float, float]:
+    """
+    Executa o GA de uma configuracao numa instancia (roda nos processos do pool).
+    A matriz chega por referencia: o worker se anexa ao bloco do processo pai.
+    """
+    id_config, configuracao, id_instancia, instancia, matriz, referencia, seed = tarefa
+    pedidos_coords, deposito_coords = instancia
+    inicio = time.perf_counter()
+    try:
+        resultado = algoritmo_genetico(
+            pedidos_coords,
+            deposito_coords,
+            distancia_fn=matriz,
+            deposito_idx=len(pedidos_coords),
+            random_seed=seed,
+            calcular_limite_inferior=False,
+            **configuracao,
+        )
+    finally:
+        if not matriz.dono:
+            matriz.fechar()
+    tempo = time.perf_counter() - inicio
+    custo_relativo = resultado["distancia_total_km"] / referencia if referencia else 1.0
+    return id_config, id_instancia, custo_relativo, tempo
+
+
+def _executar(tarefas: List[tuple], processos: int) -> List[Tuple[int, int, float, float]]:
+    if processos > 1 and len(tarefas) > 1:
+        with ProcessPoolExecutor(max_workers=min(processos, len(tarefas))) as executor:
+            return list(executor.map(avaliar_configuracao, tarefas, chunksize=max(1, len(tarefas) // (4 * processos))))
+    return [avaliar_configuracao(tarefa) for tarefa in tarefas]
+
+
+def _placar(
+    resultados: Dict[int, Dict[int, Tuple[float, float]]], candidatas: Sequence[int], orcamento_s: Optional[float]
+) -> List[Tuple[int, float, float, bool]]:
+    # Configuracoes dentro do orcamento de tempo primeiro; entre elas, menor custo relativo medio.
+    placar = []
+    for id_config in candidatas:
+        medidas = list(resultados[id_config].values())
+        custo = statistics.fmean(m[0] for m in medidas)
+        tempo = statistics.fmean(m[1] for m in medidas)
+        dentro = orcamento_s is None or tempo <= orcamento_s
+        placar.append((id_config, custo, tempo, dentro))
+    placar.sort(key=lambda item: (not item[3], round(item[1], 6), item[2]))
+    return placar
+
+
+def ajustar_parametros(
+    instancias: List[Instancia],
+    configuracoes: List[Dict[str, Any]],
+    estrategia: str = "halving",
+    orcamento_s: Optional[float] = None,
+    processos: Optional[int] = None,
+    seed: int = 42,
+    progresso: Optional[Callable[[str], None]] = None,
+) -> Dict[str, Any]:
+    """
+    Escolhe a configuracao do GA com menor custo medio (relativo ao vizinho mais proximo
+    + 2-opt de cada instancia) cujo tempo medio cabe em `orcamento_s`.
+
+    "grade" avalia todas as configuracoes em todas as instancias; "halving" (successive
+    halving) comeca com todas em poucas instancias e, a cada rodada, mantem 1/ETA_HALVING
+    das melhores e multiplica as instancias avaliadas, ate sobrar uma ou acabarem as instancias.
+    """
+    if not instancias or not configuracoes:
+        raise ValueError("Sao necessarias instancias e configuracoes para o ajuste.")
+    processos = processos or os.cpu_count() or 1
+    matrizes: List[MatrizDistancias] = []
+    try:
+        matrizes.extend(matriz_da_instancia(instancia) for instancia in instancias)
+        return _ajustar(instancias, matrizes, configuracoes, estrategia, orcamento_s, processos, seed, progresso)
+    finally:
+        for matriz in matrizes:
+            matriz.liberar()
+
+
+def _ajustar(
+    instancias: List[Instancia],
+    matrizes: List[MatrizDistancias],
+    configuracoes: List[Dict[str, Any]],
+    estrategia: str,
+    orcamento_s: Optional[float],
+    processos: int,
+    seed: int,
+    progresso: Optional[Callable[[str], None]],
+) -> Dict[str, Any]:
+    referencias = [custo_referencia(instancia, matriz) for instancia, matriz in zip(instancias, matrizes)]
+    resultados: Dict[int, Dict[int, Tuple[float, float]]] = {i: {} for i in range(len(configuracoes))}
+
+    def _avaliar(candidatas: Sequence[int], num_instancias: int) -> None:
+        tarefas = [
+            (
+                id_config,
+                configuracoes[id_config],
+                id_inst,
+                instancias[id_inst],
+                matrizes[id_inst],
+                referencias[id_inst],
+                seed + id_inst,
+            )
+            for id_config in candidatas
+            for id_inst in range(num_instancias)
+            if id_inst not in resultados[id_config]
+        ]
+        for id_config, id_inst, custo, tempo in _executar(tarefas, processos):
+            resultados[id_config][id_inst] = (custo, tempo)
+
+    candidatas = list(range(len(configuracoes)))
+    if estrategia == "grade":
+        _avaliar(candidatas, len(instancias))
+        rodadas = 1
+    else:
+        rodadas_possiveis = max(1, math.ceil(math.log(len(configuracoes), ETA_HALVING)))
+        num_instancias = max(1, len(instancias) // ETA_HALVING ** (rodadas_possiveis - 1))
+        rodadas = 0
+        while True:
+            rodadas += 1
+            _avaliar(candidatas, num_instancias)
+            if progresso:
+                progresso(f"rodada {rodadas}: {len(candidatas)} configuracoes x {num_instancias} instancias")
+            if len(candidatas) == 1 or num_instancias >= len(instancias):
+                break
+            placar = _placar(resultados, candidatas, orcamento_s)
+            candidatas = [item[0] for item in placar[: max(1, len(candidatas) // ETA_HALVING)]]
+            num_instancias = min(len(instancias), num_instancias * ETA_HALVING)
+
+    id_melhor, custo, tempo, dentro = _placar(resultados, candidatas, orcamento_s)[0]
+    return {
+        "parametros": dict(configuracoes[id_melhor]),
+        "custo_relativo": round(custo, 4),
+        "tempo_medio_s": round(tempo, 3),
+        "dentro_orcamento": dentro,
+        "avaliacoes": sum(len(medidas) for medidas in resultados.values()),
+        "rodadas": rodadas,
+    }
+
+
+def limites_faixas(tamanhos: Sequence[int]) -> List[Optional[int]]:
+    """Limite superior de cada faixa: media geometrica entre tamanhos vizinhos; a ultima e aberta."""
+    ordenados = sorted(tamanhos)
+    limites: List[Optional[int]] = [
+        int(math.sqrt(atual * proximo)) for atual, proximo in zip(ordenados, ordenados[1:])
+    ]
+    return limites + [None]
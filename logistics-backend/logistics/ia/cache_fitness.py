@@ -0,0 +1,72 @@
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+
+class CacheFitness:
+    """
+    Cache LRU limitado para o custo de rotas ja avaliadas.
+
+    A chave e a rota normalizada: o deposito fixa o inicio e o fim do percurso,
+    entao a rotacao ja e canonica; quando a metrica e simetrica (Haversine),
+    a rota e o seu inverso tem o mesmo custo e compartilham a mesma entrada.
+    """
+
+    def __init__(self, capacidade: int = 4096, simetrica: bool = True):
+        self.capacidade = max(1, int(capacidade))
+        self.simetrica = simetrica
+        self._valores: "OrderedDict[Tuple[int, ...], float]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.remocoes = 0
+
+    def chave(self, rota: List[int]) -> Tuple[int, ...]:
+        # Comparar as pontas basta para escolher um sentido unico (os genes sao distintos).
+        if self.simetrica and len(rota) > 1 and rota[0] > rota[-1]:
+            return tuple(reversed(rota))
+        return tuple(rota)
+
+    def obter(self, chave: Tuple[int, ...]) -> Optional[float]:
+        valor = self._valores.get(chave)
+        if valor is None:
+            self.misses += 1
+            return None
+        self._valores.move_to_end(chave)
+        self.hits += 1
+        return valor
+
+    def guardar(self, chave: Tuple[int, ...], valor: float) -> None:
+        self._valores[chave] = valor
+        self._valores.move_to_end(chave)
+        if len(self._valores) > self.capacidade:
+            self._valores.popitem(last=False)
+            self.remocoes += 1
+
+    def limpar(self) -> None:
+        self._valores.clear()
+
+    def __len__(self) -> int:
+        return len(self._valores)
+
+    def exportar(self) -> Dict[str, object]:
+        """Entradas em ordem LRU (mais antiga primeiro) e contadores, para checkpoints."""
+        return {
+            "chaves": list(self._valores.keys()),
+            "valores": list(self._valores.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+            "remocoes": self.remocoes,
+        }
+
+    def restaurar(self, chaves: List[Tuple[int, ...]], valores: List[float], hits=0, misses=0, remocoes=0) -> None:
+        self._valores = OrderedDict(zip(chaves, valores))
+        self.hits, self.misses, self.remocoes = hits, misses, remocoes
+
+    def estatisticas(self) -> Dict[str, float]:
+        consultas = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "remocoes": self.remocoes,
+            "entradas": len(self._valores),
+            "taxa_acerto": round(self.hits / consultas * 100, 2) if consultas else 0,
+        }
@@ -0,0 +1,32 @@
+import threading
+from typing import Callable, Optional
+
+VERIFICAR_A_CADA = 5  # geracoes/iteracoes entre consultas ao token
+
+
+class TokenCancelamento:
+    """
+    Pedido de cancelamento cooperativo para uma otimizacao em andamento.
+
+    `cancelar()` pode ser chamado de outra thread (ex.: endpoint, desconexao do cliente);
+    `verificar`, quando informado, consulta uma fonte externa (ex.: cache compartilhado
+    entre workers) e so e chamado pelos motores a cada VERIFICAR_A_CADA geracoes.
+    """
+
+    def __init__(self, verificar: Optional[Callable[[], bool]] = None):
+        self._evento = threading.Event()
+        self._verificar = verificar
+
+    def cancelar(self) -> None:
+        self._evento.set()
+
+    @property
+    def cancelado(self) -> bool:
+        if not self._evento.is_set() and self._verificar is not None and self._verificar():
+            self._evento.set()
+        return self._evento.is_set()
+
+
+def deve_cancelar(token: Optional[TokenCancelamento], iteracao: int) -> bool:
+    """True quando ha token, e hora de consulta-lo e ele foi acionado."""
+    return token is not None and iteracao % VERIFICAR_A_CADA == 0 and token.cancelado
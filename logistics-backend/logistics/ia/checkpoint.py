@@ -0,0 +1,118 @@
+import json
+import os
+import struct
+import sys
+import zlib
+from array import array
+from typing import Any, Dict, Optional
+
+MAGICO = b"GACP"
+VERSAO = 1
+# Vetores grandes vao em binario; o restante do estado (escalares, seletor, assinatura) em JSON.
+CAMPOS_VETORES = {
+    "populacao": "I",
+    "historico_melhor": "d",
+    "historico_media": "d",
+    "melhor_rota": "I",
+    "rng_estado": "I",
+    "cache_chaves": "I",
+    "cache_valores": "d",
+}
+
+
+def serializar_estado(estado: Dict[str, Any]) -> bytes:
+    """
+    Estado do GA em binario compacto: MAGICO + versao + zlib(cabecalho JSON + vetores).
+    `populacao` e `cache_chaves` sao listas de rotas (achatadas); `rng_estado` e o
+    retorno de `random.Random.getstate()`. Nao usa pickle: carregar um checkpoint nunca executa codigo.
+    """
+    estado = dict(estado)
+    versao_rng, estado_rng, gauss_rng = estado.pop("rng_estado")
+    vetores = {
+        "populacao": [gene for rota in estado.pop("populacao") for gene in rota],
+        "historico_melhor": estado.pop("historico_melhor"),
+        "historico_media": estado.pop("historico_media"),
+        "melhor_rota": estado.pop("melhor_rota") or [],
+        "rng_estado": estado_rng,
+        "cache_chaves": [gene for chave in estado.get("cache_chaves", []) for gene in chave],
+        "cache_valores": estado.pop("cache_valores", []),
+    }
+    estado.pop("cache_chaves", None)
+    cabecalho = {
+        **estado,
+        "rng_versao": versao_rng,
+        "rng_gauss": gauss_rng,
+        "byteorder": sys.byteorder,
+        "tamanhos": {nome: len(valores) for nome, valores in vetores.items()},
+    }
+    bruto_cabecalho = json.dumps(cabecalho, separators=(",", ":")).encode("utf-8")
+    partes = [struct.pack("<I", len(bruto_cabecalho)), bruto_cabecalho]
+    for nome, tipo in CAMPOS_VETORES.items():
+        partes.append(array(tipo, vetores[nome]).tobytes())
+    return MAGICO + bytes([VERSAO]) + zlib.compress(b"".join(partes), 6)
+
+
+def desserializar_estado(dados: bytes) -> Dict[str, Any]:
+    if dados[:4] != MAGICO or len(dados) < 5 or dados[4] != VERSAO:
+        raise ValueError("Checkpoint com formato ou versao desconhecidos.")
+    corpo = zlib.decompress(dados[5:])
+    (tamanho_cabecalho,) = struct.unpack_from("<I", corpo)
+    inicio = 4 + tamanho_cabecalho
+    cabecalho = json.loads(corpo[4:inicio].decode("utf-8"))
+
+    vetores = {}
+    for nome, tipo in CAMPOS_VETORES.items():
+        valores = array(tipo)
+        fim = inicio + cabecalho["tamanhos"][nome] * valores.itemsize
+        valores.frombytes(corpo[inicio:fim])
+        if cabecalho["byteorder"] != sys.byteorder:
+            valores.byteswap()
+        vetores[nome] = valores
+        inicio = fim
+    if inicio != len(corpo):
+        raise ValueError("Checkpoint truncado ou corrompido.")
+
+    estado = {k: v for k, v in cabecalho.items() if k not in ("rng_versao", "rng_gauss", "byteorder", "tamanhos")}
+    num_pedidos = estado["assinatura"]["num_pedidos"]
+    estado["populacao"] = _fatiar(vetores["populacao"], num_pedidos)
+    estado["historico_melhor"] = vetores["historico_melhor"].tolist()
+    estado["historico_media"] = vetores["historico_media"].tolist()
+    estado["melhor_rota"] = vetores["melhor_rota"].tolist() or None
+    estado["rng_estado"] = (cabecalho["rng_versao"], tuple(vetores["rng_estado"]), cabecalho["rng_gauss"])
+    estado["cache_chaves"] = [tuple(chave) for chave in _fatiar(vetores["cache_chaves"], num_pedidos)]
+    estado["cache_valores"] = vetores["cache_valores"].tolist()
+    return estado
+
+
+def _fatiar(valores: array, tamanho: int) -> list:
+    if not tamanho:
+        return []
+    return [valores[i : i + tamanho].tolist() for i in range(0, len(valores), tamanho)]
+
+
+def salvar_checkpoint(caminho: str, estado: Dict[str, Any]) -> None:
+    # Escrita atomica: um worker reciclado no meio da gravacao deixa o checkpoint anterior intacto.
+    temporario = f"{caminho}.tmp"
+    with open(temporario, "wb") as arq:
+        arq.write(serializar_estado(estado))
+    os.replace(temporario, caminho)
+
+
+def carregar_checkpoint(caminho: str) -> Optional[Dict[str, Any]]:
+    """Estado salvo em `caminho`, ou None se nao existir. Arquivos invalidos levantam ValueError."""
+    try:
+        with open(caminho, "rb") as arq:
+            dados = arq.read()
+    except FileNotFoundError:
+        return None
+    try:
+        return desserializar_estado(dados)
+    except (zlib.error, struct.error, KeyError, UnicodeDecodeError) as exc:
+        raise ValueError(f"Checkpoint invalido em {caminho}: {exc}") from exc
+
+
+def remover_checkpoint(caminho: str) -> None:
+    try:
+        os.remove(caminho)
+    except FileNotFoundError:
+        pass
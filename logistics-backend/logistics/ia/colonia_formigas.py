@@ -0,0 +1,158 @@
+import random
+import time
+from typing import Callable, List, Optional, Tuple
+
+from .cancelamento import TokenCancelamento, deve_cancelar
+from .heuristicas import busca_local, construir_vizinho_mais_proximo
+from .indice_espacial import IndiceEspacial
+from .matriz_distancias import MatrizDistancias
+from .metaheuristicas import _montar_resultado, _preparar_metrica, _resultado_trivial
+
+LISTA_CANDIDATOS_K = 15
+ALFA = 1.0  # peso do feromonio
+BETA = 2.0  # peso da visibilidade (1 / distancia)
+EVAPORACAO = 0.1
+
+
+def colonia_formigas(
+    pedidos_coords: List[Tuple[float, float]],
+    deposito_coords: Tuple[float, float],
+    num_geracoes: int = 500,
+    distancia_fn: Optional[Callable[[int, int], float]] = None,
+    deposito_idx: Optional[int] = None,
+    random_seed: Optional[int] = None,
+    num_formigas: Optional[int] = None,
+    cancelamento: Optional[TokenCancelamento] = None,
+) -> dict:
+    """
+    Colonia de formigas MAX-MIN (MMAS) com listas candidatas.
+
+    A cada iteracao a informacao de escolha (feromonio^ALFA * visibilidade^BETA) e
+    calculada uma vez para toda a colonia; cada formiga sai do deposito e sorteia o
+    proximo pedido entre os candidatos ainda livres, recorrendo ao melhor pedido livre
+    quando todos os candidatos ja foram visitados. A melhor formiga da iteracao passa
+    por busca local e deposita feromonio, que fica limitado a [tau_min, tau_max].
+    """
+    inicio_tempo = time.time()
+    rng = random.Random(random_seed if random_seed is not None else random.random())
+    n = len(pedidos_coords)
+    if n < 3:
+        return _resultado_trivial(pedidos_coords, deposito_coords, inicio_tempo)
+
+    dist, idx_deposito, simetrica = _preparar_metrica(pedidos_coords, deposito_coords, distancia_fn, deposito_idx)
+    # Nos 0..n-1 sao os pedidos e o no n e o deposito. Uma MatrizDistancias ja nesse formato
+    # (deposito no fim) e lida direto, sem copia; senao (ex.: Haversine) monta-se uma para a execucao.
+    if isinstance(distancia_fn, MatrizDistancias) and idx_deposito == n and len(distancia_fn) == n + 1:
+        matriz, propria = distancia_fn, False
+    else:
+        nos = list(range(n)) + [idx_deposito]
+        matriz, propria = MatrizDistancias.criar(n + 1), True
+        for i, a in enumerate(nos):
+            matriz.definir_linha(i, (dist(a, b) for b in nos))
+    dist_nos = matriz.funcao_distancia()
+
+    def custo(rota: List[int]) -> float:
+        total = dist_nos(n, rota[0]) + dist_nos(rota[-1], n)
+        for a, b in zip(rota, rota[1:]):
+            total += dist_nos(a, b)
+        return total
+
+    try:
+        # Visibilidade ja elevada a BETA: so o feromonio muda entre iteracoes.
+        visibilidade = [
+            [(1.0 / valor if valor > 0 else 1e6) ** BETA for valor in matriz.linha(i)] for i in range(n + 1)
+        ]
+
+        indice = IndiceEspacial(pedidos_coords)
+        candidatos = indice.listas_candidatas(LISTA_CANDIDATOS_K)
+        candidatos_nos = candidatos + [indice.k_mais_proximos_do_ponto(*deposito_coords, LISTA_CANDIDATOS_K)]
+
+        melhor_rota = construir_vizinho_mais_proximo(pedidos_coords, deposito_coords)
+        melhor_custo = custo(melhor_rota)
+        tau_max = 1.0 / (EVAPORACAO * melhor_custo)
+        tau_min = tau_max / (2 * n)
+        feromonio = [[tau_max] * (n + 1) for _ in range(n + 1)]
+
+        num_formigas = num_formigas or min(n, 25)
+        num_geracoes = max(1, int(num_geracoes))
+        historico_melhor = [melhor_custo]
+        historico_media = []
+        iteracoes_sem_melhora = 0
+        max_sem_melhora = max(50, num_geracoes // 2)
+        criterio_parada = "geracoes"
+
+        for iteracao in range(num_geracoes):
+            escolha = [
+                [(t**ALFA) * v for t, v in zip(linha_tau, linha_vis)]
+                for linha_tau, linha_vis in zip(feromonio, visibilidade)
+            ]
+
+            melhor_iteracao, custo_iteracao = None, float("inf")
+            soma_custos = 0.0
+            for _ in range(num_formigas):
+                livres = bytearray(b"\x01") * n
+                atual = n
+                rota = []
+                for _ in range(n):
+                    linha = escolha[atual]
+                    opcoes = [c for c in candidatos_nos[atual] if livres[c]]
+                    if opcoes:
+                        proximo = rng.choices(opcoes, weights=[linha[c] for c in opcoes])[0]
+                    else:
+                        proximo = max((j for j in range(n) if livres[j]), key=linha.__getitem__)
+                    livres[proximo] = 0
+                    rota.append(proximo)
+                    atual = proximo
+                valor = custo(rota)
+                soma_custos += valor
+                if valor < custo_iteracao:
+                    melhor_iteracao, custo_iteracao = rota, valor
+
+            melhor_iteracao = busca_local(melhor_iteracao, dist_nos, n, candidatos, simetrica=simetrica)
+            custo_iteracao = custo(melhor_iteracao)
+            if custo_iteracao < melhor_custo - 1e-9:
+                melhor_rota, melhor_custo = melhor_iteracao, custo_iteracao
+                tau_max = 1.0 / (EVAPORACAO * melhor_custo)
+                tau_min = tau_max / (2 * n)
+                iteracoes_sem_melhora = 0
+            else:
+                iteracoes_sem_melhora += 1
+
+            # Evapora, deposita pela melhor da iteracao (alternando com a melhor global) e aplica os limites.
+            depositante, custo_depositante = (
+                (melhor_rota, melhor_custo) if iteracao % 5 == 4 else (melhor_iteracao, custo_iteracao)
+            )
+            persistencia = 1.0 - EVAPORACAO
+            feromonio = [[max(tau_min, t * persistencia) for t in linha] for linha in feromonio]
+            reforco = 1.0 / custo_depositante
+            caminho = [n] + depositante + [n]
+            # Em metrica assimetrica (ex.: OSRM) o arco a->b nao diz nada sobre b->a.
+            for a, b in zip(caminho, caminho[1:]):
+                feromonio[a][b] = min(tau_max, feromonio[a][b] + reforco)
+                if simetrica:
+                    feromonio[b][a] = feromonio[a][b]
+
+            historico_melhor.append(melhor_custo)
+            historico_media.append(soma_custos / num_formigas)
+            if iteracoes_sem_melhora > max_sem_melhora:
+                criterio_parada = "estagnacao"
+                break
+            if deve_cancelar(cancelamento, iteracao):
+                criterio_parada = "cancelado"
+                break
+    finally:
+        if propria:
+            matriz.liberar()
+
+    return _montar_resultado(
+        [idx_deposito] + melhor_rota,
+        pedidos_coords,
+        deposito_coords,
+        distancia_fn,
+        deposito_idx,
+        historico_melhor,
+        historico_media,
+        iteracao + 1,
+        criterio_parada,
+        inicio_tempo,
+    )
@@ -0,0 +1,308 @@
+import logging
+import math
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .cancelamento import TokenCancelamento
+from .genetic_algorithm import (
+    _construir_matriz_osrm,
+    algoritmo_genetico,
+    avaliar_rota,
+)
+from .heuristicas import busca_local, construir_vizinho_mais_proximo
+from .indice_espacial import IndiceEspacial
+from .matriz_distancias import MatrizDistancias
+from .utils import criar_distancia_fn_coordenadas
+
+logger = logging.getLogger(__name__)
+
+LISTA_CANDIDATOS_K = 10
+# Teto de processos do pool (a decomposicao roda dentro da requisicao HTTP).
+ENV_MAX_PROCESSOS = "LOGISTICS_DECOMPOSICAO_MAX_PROCESSOS"
+MAX_PROCESSOS_PADRAO = 4
+INTERVALO_CANCELAMENTO_S = 0.5  # espera maxima entre consultas ao token enquanto os setores rodam
+
+
+def limite_processos() -> int:
+    try:
+        limite = int(os.getenv(ENV_MAX_PROCESSOS, MAX_PROCESSOS_PADRAO))
+    except ValueError:
+        limite = MAX_PROCESSOS_PADRAO
+    return max(1, min(limite, os.cpu_count() or 1))
+
+
+def agrupar_por_setores(
+    coordenadas: List[Tuple[float, float]],
+    deposito: Tuple[float, float],
+    tamanho_cluster: int,
+) -> List[List[int]]:
+    """
+    Varredura angular (sweep) em torno do deposito: ordena os pedidos pelo angulo
+    polar e fatia a sequencia em setores com no maximo `tamanho_cluster` pedidos.
+    Os setores saem na ordem angular, que tambem e a ordem de costura.
+    """
+    if not coordenadas:
+        return []
+    lat_dep, lon_dep = deposito
+    cos_dep = math.cos(math.radians(lat_dep))
+
+    def _angulo(idx: int) -> float:
+        lat, lon = coordenadas[idx]
+        return math.atan2(lat - lat_dep, (lon - lon_dep) * cos_dep)
+
+    ordenados = sorted(range(len(coordenadas)), key=_angulo)
+
+    # Comeca a varredura no maior vao angular para nao partir um grupo de pedidos ao meio.
+    angulos = [_angulo(idx) for idx in ordenados]
+    if len(angulos) > 1:
+        vaos = [angulos[i + 1] - angulos[i] for i in range(len(angulos) - 1)]
+        vaos.append(angulos[0] + 2 * math.pi - angulos[-1])
+        inicio = (vaos.index(max(vaos)) + 1) % len(ordenados)
+        ordenados = ordenados[inicio:] + ordenados[:inicio]
+
+    num_clusters = math.ceil(len(ordenados) / max(1, tamanho_cluster))
+    tamanho_base, sobra = divmod(len(ordenados), num_clusters)
+    clusters = []
+    pos = 0
+    for c in range(num_clusters):
+        tamanho = tamanho_base + (1 if c < sobra else 0)
+        clusters.append(ordenados[pos : pos + tamanho])
+        pos += tamanho
+    return clusters
+
+
+def _otimizar_cluster(tarefa: Dict[str, Any], cancelamento: Optional[TokenCancelamento] = None) -> Dict[str, Any]:
+    """
+    Otimiza um setor isolado (deposito -> setor -> deposito); executado nos processos do pool.
+    O token so e repassado na execucao sequencial (ele nao atravessa processos).
+    """
+    coords = tarefa["coordenadas"]
+    deposito = tarefa["deposito"]
+    if len(coords) < 3:
+        # Setor trivial: nenhuma distancia e consultada, entao nao conta para `osrm_usado`.
+        return {"rota": list(range(len(coords))), "osrm_usado": None}
+
+    matriz = None
+    distancia_fn = None
+    deposito_idx = None
+    osrm_usado = False
+    osrm = tarefa.get("osrm")
+    if tarefa.get("matriz"):
+        # Anexa-se (sem copia) a matriz global do processo pai; `indices` leva o indice local
+        # de cada pedido do setor (e do deposito, no fim) para a linha da matriz global.
+        matriz = MatrizDistancias.anexar(*tarefa["matriz"])
+        dist_global = matriz.funcao_distancia()
+        indices = tarefa["indices"]
+
+        def distancia_fn(a: int, b: int) -> float:
+            return dist_global(indices[a], indices[b])
+
+        deposito_idx = len(coords)
+        osrm_usado = tarefa["matriz_osrm"]
+    elif osrm:
+        # Sem matriz global: o OSRM /table tem limite de pontos, entao cada setor busca a sua.
+        matriz = _construir_matriz_osrm(pontos=coords, deposito=deposito, **osrm)
+        if matriz is not None:
+            distancia_fn = matriz.funcao_distancia()
+            deposito_idx = len(coords)
+            osrm_usado = True
+
+    try:
+        candidatos = IndiceEspacial(coords).listas_candidatas(LISTA_CANDIDATOS_K)
+        rota_inicial = busca_local(
+            construir_vizinho_mais_proximo(coords, deposito),
+            distancia_fn or criar_distancia_fn_coordenadas(coords, deposito),
+            len(coords),
+            candidatos,
+            simetrica=not osrm_usado,
+        )
+        resultado = algoritmo_genetico(
+            pedidos_coords=coords,
+            deposito_coords=deposito,
+            distancia_fn=distancia_fn,
+            deposito_idx=deposito_idx,
+            rotas_iniciais=[rota_inicial],
+            cancelamento=cancelamento,
+            **tarefa["parametros_ga"],
+        )
+    finally:
+        if matriz is not None:
+            matriz.liberar()  # so remove o bloco se este processo o criou
+    return {"rota": resultado["rota_otimizada"], "osrm_usado": osrm_usado}
+
+
+def _executar_setores(
+    tarefas: List[Dict[str, Any]],
+    processos: int,
+    cancelamento: Optional[TokenCancelamento],
+) -> List[Optional[Dict[str, Any]]]:
+    """
+    Resultado de cada setor, ou None para os que nao terminaram antes do cancelamento.
+    No pool o token e consultado enquanto os setores rodam; ao cancelar, os setores
+    ainda na fila sao descartados e a resposta nao espera pelos que ja estao rodando.
+    """
+    resultados: List[Optional[Dict[str, Any]]] = [None] * len(tarefas)
+    if processos <= 1 or len(tarefas) <= 1:
+        for i, tarefa in enumerate(tarefas):
+            if cancelamento is not None and cancelamento.cancelado:
+                break
+            resultados[i] = _otimizar_cluster(tarefa, cancelamento)
+        return resultados
+
+    executor = ProcessPoolExecutor(max_workers=min(processos, len(tarefas)))
+    cancelado = False
+    try:
+        futuros = {executor.submit(_otimizar_cluster, tarefa): i for i, tarefa in enumerate(tarefas)}
+        pendentes = set(futuros)
+        while pendentes:
+            prontos, pendentes = wait(
+                pendentes,
+                timeout=INTERVALO_CANCELAMENTO_S if cancelamento is not None else None,
+                return_when=FIRST_COMPLETED,
+            )
+            for futuro in prontos:
+                resultados[futuros[futuro]] = futuro.result()
+            if pendentes and cancelamento is not None and cancelamento.cancelado:
+                cancelado = True
+                break
+    finally:
+        executor.shutdown(wait=not cancelado, cancel_futures=True)
+    return resultados
+
+
+def _costurar(
+    rotas_clusters: List[List[int]],
+    distancia_fn: Callable[[int, int], float],
+    deposito_idx: int,
+    simetrica: bool = True,
+) -> List[int]:
+    """
+    Concatena os setores na ordem angular, escolhendo o sentido de cada um pela emenda mais
+    curta. Com matriz assimetrica o custo interno do setor tambem muda com o sentido e entra
+    na comparacao.
+    """
+
+    def _custo(ponto: int, trecho: List[int]) -> float:
+        custo = distancia_fn(ponto, trecho[0])
+        if not simetrica:
+            custo += sum(distancia_fn(a, b) for a, b in zip(trecho, trecho[1:]))
+        return custo
+
+    rota: List[int] = []
+    ponto_atual = deposito_idx
+    for rota_cluster in rotas_clusters:
+        if not rota_cluster:
+            continue
+        inverso = rota_cluster[::-1]
+        trecho = rota_cluster if _custo(ponto_atual, rota_cluster) <= _custo(ponto_atual, inverso) else inverso
+        rota.extend(trecho)
+        ponto_atual = trecho[-1]
+    return rota
+
+
+def otimizar_por_decomposicao(
+    pedidos_coords: List[Tuple[float, float]],
+    deposito_coords: Tuple[float, float],
+    parametros_ga: Dict[str, Any],
+    tamanho_cluster: int = 100,
+    processos: Optional[int] = None,
+    osrm: Optional[Dict[str, Any]] = None,
+    cancelamento: Optional[TokenCancelamento] = None,
+    matriz: Optional[MatrizDistancias] = None,
+    matriz_osrm: bool = False,
+) -> dict:
+    """
+    Pipeline para conjuntos grandes de pedidos:
+    1. agrupa os pedidos em setores angulares em torno do deposito;
+    2. otimiza cada setor em paralelo (heuristica + GA);
+    3. costura os setores e refina as emendas com busca local por listas candidatas.
+    Com `matriz` (pedidos + deposito no fim, ex.: submatriz do armazem) os setores se
+    anexam a ela pelo nome do bloco e a costura e o refinamento usam a mesma matriz; sem
+    ela, cada setor usa Haversine ou a sua propria matriz OSRM e a costura, Haversine.
+    `matriz_osrm` indica que a matriz e viaria (possivelmente assimetrica).
+    Retorna o mesmo formato de `algoritmo_genetico`. Se `cancelamento` for acionado,
+    os setores que nao terminaram entram na ordem do vizinho mais proximo.
+    """
+    inicio_tempo = time.time()
+    clusters = agrupar_por_setores(pedidos_coords, deposito_coords, tamanho_cluster)
+
+    tarefas = [
+        {
+            "coordenadas": [pedidos_coords[idx] for idx in cluster],
+            "deposito": deposito_coords,
+            "parametros_ga": {
+                **parametros_ga,
+                "random_seed": (
+                    parametros_ga["random_seed"] + i if parametros_ga.get("random_seed") is not None else None
+                ),
+            },
+            "osrm": osrm,
+            "matriz": (matriz.nome, len(matriz)) if matriz is not None else None,
+            "indices": cluster + [len(pedidos_coords)],
+            "matriz_osrm": matriz_osrm,
+        }
+        for i, cluster in enumerate(clusters)
+    ]
+
+    processos = min(processos or os.cpu_count() or 1, limite_processos())
+    resultados_clusters = _executar_setores(tarefas, processos, cancelamento)
+    tempo_clusters = time.time() - inicio_tempo
+
+    cancelado = any(resultado is None for resultado in resultados_clusters)
+    resultados_clusters = [
+        resultado
+        if resultado is not None
+        else {"rota": construir_vizinho_mais_proximo(tarefa["coordenadas"], deposito_coords), "osrm_usado": None}
+        for tarefa, resultado in zip(tarefas, resultados_clusters)
+    ]
+    rotas_clusters = [
+        [cluster[idx] for idx in resultado["rota"]] for cluster, resultado in zip(clusters, resultados_clusters)
+    ]
+
+    deposito_idx = len(pedidos_coords)
+    if matriz is not None:
+        distancia_fn = matriz.funcao_distancia()
+        osrm_usado = matriz_osrm
+    else:
+        distancia_fn = criar_distancia_fn_coordenadas(pedidos_coords, deposito_coords)
+        # Setores triviais e os completados pelo vizinho mais proximo nao consultam distancias.
+        flags_setores = [r["osrm_usado"] for r in resultados_clusters if r["osrm_usado"] is not None]
+        osrm_usado = bool(flags_setores) and all(flags_setores)
+    rota = _costurar(rotas_clusters, distancia_fn, deposito_idx, simetrica=not matriz_osrm)
+    distancia_costurada = avaliar_rota(rota, pedidos_coords, deposito_coords, distancia_fn, deposito_idx)
+
+    candidatos = IndiceEspacial(pedidos_coords).listas_candidatas(LISTA_CANDIDATOS_K)
+    rota = busca_local(rota, distancia_fn, deposito_idx, candidatos, simetrica=not matriz_osrm)
+    distancia_final = avaliar_rota(rota, pedidos_coords, deposito_coords, distancia_fn, deposito_idx)
+
+    tempo_execucao = time.time() - inicio_tempo
+    logger.info(
+        "[GA][DECOMP] pedidos=%s clusters=%s tempo_clusters=%.2fs costura=%.2fkm refinada=%.2fkm",
+        len(pedidos_coords),
+        len(clusters),
+        tempo_clusters,
+        distancia_costurada,
+        distancia_final,
+    )
+
+    melhoria_percentual = 0
+    if distancia_costurada:
+        melhoria_percentual = round((distancia_costurada - distancia_final) / distancia_costurada * 100, 2)
+
+    return {
+        "rota_otimizada": rota,
+        "distancia_total_km": round(distancia_final, 2),
+        "num_geracoes": parametros_ga.get("num_geracoes", 0),
+        "tempo_execucao_s": round(tempo_execucao, 2),
+        "historico_melhor": [distancia_costurada, distancia_final],
+        "historico_media": [],
+        "melhoria_percentual": melhoria_percentual,
+        "criterio_parada": "cancelado" if cancelado else "decomposicao",
+        "cache_fitness": None,
+        "duplicatas_substituidas": 0,
+        "num_clusters": len(clusters),
+        "osrm_usado": osrm_usado,
+    }
+
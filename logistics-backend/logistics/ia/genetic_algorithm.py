@@ -1,38 +1,37 @@
+import heapq
 import logging
-import math
 import os
 import random
 import time
+import zlib
+from array import array
 from typing import Any, Callable, Dict, List, Optional, Tuple
 
+from .armazem_distancias import abrir_armazem_padrao
+from .cache_fitness import CacheFitness
+from .cancelamento import TokenCancelamento, deve_cancelar
+from .checkpoint import carregar_checkpoint, remover_checkpoint, salvar_checkpoint
+from .matriz_distancias import MatrizDistancias
+from .operadores import SeletorOperadores, movimento_2opt, pressao_mutacao
+from .limite_inferior import limite_inferior_held_karp
+from .parametros_ajustados import parametros_para_tamanho
+from .utils import calcular_distancia, criar_distancia_fn_coordenadas
+
 logger = logging.getLogger(__name__)
 
+MODOS_OTIMIZACAO = ("padrao", "decomposicao")
+# Motores de busca selecionaveis em `parametros["algoritmo"]` (a decomposicao sempre usa o GA por setor).
+ALGORITMOS = ("genetico", "recozimento", "tabu", "colonia_formigas")
+INTERVALO_CHECKPOINT_PADRAO = 25  # geracoes entre gravacoes do checkpoint
+# Na decomposicao, ate este numero de pontos a submatriz do armazem (N x N float64) e compartilhada com os setores.
+MAX_PONTOS_MATRIZ_GLOBAL = 2000
+
 try:
     import requests
 except ImportError:
     requests = None
 
 
-def calcular_distancia(coord1: Tuple[float, float], coord2: Tuple[float, float]) -> float:
-    # Distancia Haversine em quilometros entre dois pontos (lat, lon).
-    lat1, lon1 = coord1
-    lat2, lon2 = coord2
-
-    lat1_rad = math.radians(lat1)
-    lon1_rad = math.radians(lon1)
-    lat2_rad = math.radians(lat2)
-    lon2_rad = math.radians(lon2)
-
-    dlat = lat2_rad - lat1_rad
-    dlon = lon2_rad - lon1_rad
-
-    a = math.sin(dlat / 2) ** 2 + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(dlon / 2) ** 2
-    c = 2 * math.asin(math.sqrt(a))
-
-    raio_terra = 6371
-    return raio_terra * c
-
-
 def _validar_entradas(pedidos: List[dict], deposito: dict) -> None:
     """Valida estrutura basica de pedidos e deposito para evitar falhas silenciosas."""
     if deposito is None or "latitude" not in deposito or "longitude" not in deposito:
@@ -51,13 +50,28 @@ def _validar_entradas(pedidos: List[dict], deposito: dict) -> None:
             raise ValueError(f"Pedido na posicao {i} possui latitude/longitude invalidos.")
 
 
-def _criar_distancia_fn_matriz(matriz: List[List[float]]) -> Callable[[int, int], float]:
-    """Cria funcao de distancia a partir de uma matriz pre-computada (km)."""
-
-    def _dist(a: int, b: int) -> float:
-        return matriz[a][b]
-
-    return _dist
+def _agrupar_paradas(
+    coordenadas: List[Tuple[float, float]],
+    casas_decimais: int = 5,
+) -> Tuple[List[Tuple[float, float]], List[List[int]]]:
+    """
+    Agrupa pedidos cujas coordenadas coincidem apos arredondar para `casas_decimais`
+    (5 casas ~ 1 m). Retorna as coordenadas de cada parada unica e, para cada parada,
+    os indices dos pedidos atendidos nela, na ordem original.
+    """
+    paradas: List[Tuple[float, float]] = []
+    pedidos_por_parada: List[List[int]] = []
+    indice_por_chave: Dict[Tuple[float, float], int] = {}
+    for idx, (lat, lon) in enumerate(coordenadas):
+        chave = (round(float(lat), casas_decimais), round(float(lon), casas_decimais))
+        parada = indice_por_chave.get(chave)
+        if parada is None:
+            indice_por_chave[chave] = len(paradas)
+            paradas.append((lat, lon))
+            pedidos_por_parada.append([idx])
+        else:
+            pedidos_por_parada[parada].append(idx)
+    return paradas, pedidos_por_parada
 
 
 def _construir_matriz_osrm(
@@ -66,10 +80,11 @@ def _construir_matriz_osrm(
     base_url: str = "http://localhost:5000",
     timeout: int = 15,
     tentativas: int = 3,
-) -> Optional[List[List[float]]]:
+) -> Optional[MatrizDistancias]:
     """
-    Constroi matriz de distancias viarias (km) via OSRM /table.
+    Constroi matriz de distancias viarias (km) via OSRM /table, em memoria compartilhada.
     Espera OSRM acessivel em base_url. Retorna None se nao conseguir obter.
+    Quem recebe a matriz e responsavel por chamar `liberar()`.
     """
     if requests is None:
         return None
@@ -89,7 +104,10 @@ def _construir_matriz_osrm(
                 continue
 
             # Converte metros para km
-            return [[round(val / 1000, 3) for val in linha] for linha in dist_metros]
+            matriz = MatrizDistancias.criar(len(dist_metros))
+            for i, linha in enumerate(dist_metros):
+                matriz.definir_linha(i, (round(val / 1000, 3) for val in linha))
+            return matriz
         except Exception as exc:  # noqa: BLE001
             logger.warning("[GA][OSRM] tentativa %s falhou: %s", tentativa, exc)
             if tentativa >= tentativas:
@@ -127,79 +145,162 @@ def avaliar_rota(
     return custo_total
 
 
-def criar_populacao_inicial(tamanho_pop: int, num_pedidos: int) -> List[List[int]]:
+def criar_populacao_inicial(
+    tamanho_pop: int,
+    num_pedidos: int,
+    rng: Optional[random.Random] = None,
+) -> List[List[int]]:
     # Gera rotas iniciais embaralhadas.
     if num_pedidos == 0:
         return []
 
+    rng = rng or random
     populacao = []
     rota_base = list(range(num_pedidos))
 
     for _ in range(tamanho_pop):
         rota = rota_base.copy()
-        random.shuffle(rota)
+        rng.shuffle(rota)
         populacao.append(rota)
 
     return populacao
 
 
-def selecao_torneio(populacao: List[List[int]], fitness: List[float], tamanho_torneio: int = 3) -> List[int]:
-    # Selecao por torneio; menor fitness vence.
-    indices_torneio = random.sample(range(len(populacao)), tamanho_torneio)
-    vencedor_idx = min(indices_torneio, key=lambda i: fitness[i])
-    return populacao[vencedor_idx].copy()
-
-
-def crossover_ordem(pai1: List[int], pai2: List[int]) -> Tuple[List[int], List[int]]:
-    # Crossover OX preservando ordem relativa.
+def selecao_torneio_lote(
+    fitness: List[float],
+    quantidade: int,
+    tamanho_torneio: int = 3,
+    rng: Optional[random.Random] = None,
+) -> List[int]:
+    """
+    Executa `quantidade` torneios de uma vez e devolve apenas os indices vencedores.
+    Todos os competidores sao sorteados numa unica chamada, sem copiar individuos.
+    """
+    rng = rng or random
+    tamanho_pop = len(fitness)
+    tamanho_torneio = max(1, min(tamanho_torneio, tamanho_pop))
+    sorteados = rng.choices(range(tamanho_pop), k=quantidade * tamanho_torneio)
+    vencedores = []
+    for inicio in range(0, len(sorteados), tamanho_torneio):
+        vencedor = sorteados[inicio]
+        for idx in sorteados[inicio + 1 : inicio + tamanho_torneio]:
+            if fitness[idx] < fitness[vencedor]:
+                vencedor = idx
+        vencedores.append(vencedor)
+    return vencedores
+
+
+def _preencher_filho_ox(
+    doador: List[int],
+    ordem: List[int],
+    filho: List[int],
+    ponto1: int,
+    ponto2: int,
+    presentes: bytearray,
+) -> None:
+    # Copia o segmento do doador e completa com os genes restantes na ordem do outro pai.
+    tamanho = len(doador)
+    for i in range(ponto1, ponto2):
+        gene = doador[i]
+        filho[i] = gene
+        presentes[gene] = 1
+
+    pos = ponto2 % tamanho
+    for k in range(tamanho):
+        gene = ordem[(ponto2 + k) % tamanho]
+        if not presentes[gene]:
+            filho[pos] = gene
+            pos = (pos + 1) % tamanho
+
+    for i in range(ponto1, ponto2):
+        presentes[doador[i]] = 0
+
+
+def crossover_ordem(
+    pai1: List[int],
+    pai2: List[int],
+    filho1: Optional[List[int]] = None,
+    filho2: Optional[List[int]] = None,
+    rng: Optional[random.Random] = None,
+    presentes: Optional[bytearray] = None,
+) -> Tuple[List[int], List[int]]:
+    """
+    Crossover OX preservando ordem relativa.
+    Quando `filho1`/`filho2` sao informados os genes sao escritos neles (sem alocar novas listas).
+    """
+    rng = rng or random
     tamanho = len(pai1)
-
-    ponto1 = random.randint(0, tamanho - 2)
-    ponto2 = random.randint(ponto1 + 1, tamanho)
-
-    filho1 = [-1] * tamanho
-    filho2 = [-1] * tamanho
-
-    filho1[ponto1:ponto2] = pai1[ponto1:ponto2]
-    filho2[ponto1:ponto2] = pai2[ponto1:ponto2]
-
-    pos_filho1 = ponto2
-    for gene in pai2[ponto2:] + pai2[:ponto2]:
-        if gene not in filho1:
-            if pos_filho1 >= tamanho:
-                pos_filho1 = 0
-            filho1[pos_filho1] = gene
-            pos_filho1 += 1
-
-    pos_filho2 = ponto2
-    for gene in pai1[ponto2:] + pai1[:ponto2]:
-        if gene not in filho2:
-            if pos_filho2 >= tamanho:
-                pos_filho2 = 0
-            filho2[pos_filho2] = gene
-            pos_filho2 += 1
+    if filho1 is None:
+        filho1 = [-1] * tamanho
+    if filho2 is None:
+        filho2 = [-1] * tamanho
+    if tamanho < 2:
+        filho1[:] = pai1
+        filho2[:] = pai2
+        return filho1, filho2
+    if presentes is None:
+        presentes = bytearray(tamanho)
+
+    ponto1 = rng.randint(0, tamanho - 2)
+    ponto2 = rng.randint(ponto1 + 1, tamanho)
+
+    _preencher_filho_ox(pai1, pai2, filho1, ponto1, ponto2, presentes)
+    _preencher_filho_ox(pai2, pai1, filho2, ponto1, ponto2, presentes)
 
     return filho1, filho2
 
 
-def mutacao_troca(rota: List[int], taxa_mutacao: float = 0.2) -> List[int]:
-    # Troca dois genes aleatoriamente.
-    if random.random() < taxa_mutacao:
-        idx1, idx2 = random.sample(range(len(rota)), 2)
+def mutacao_troca(rota: List[int], taxa_mutacao: float = 0.2, rng: Optional[random.Random] = None) -> List[int]:
+    # Troca dois genes aleatoriamente (in-place).
+    rng = rng or random
+    if len(rota) >= 2 and rng.random() < taxa_mutacao:
+        idx1, idx2 = rng.sample(range(len(rota)), 2)
         rota[idx1], rota[idx2] = rota[idx2], rota[idx1]
     return rota
 
 
-def mutacao_inversao(rota: List[int], taxa_mutacao: float = 0.1) -> List[int]:
-    # Inverte um segmento da rota.
-    if random.random() < taxa_mutacao:
+def mutacao_inversao(rota: List[int], taxa_mutacao: float = 0.1, rng: Optional[random.Random] = None) -> List[int]:
+    # Inverte um segmento da rota (in-place).
+    rng = rng or random
+    if len(rota) >= 2 and rng.random() < taxa_mutacao:
         tamanho = len(rota)
-        idx1 = random.randint(0, tamanho - 2)
-        idx2 = random.randint(idx1 + 1, tamanho)
-        rota[idx1:idx2] = reversed(rota[idx1:idx2])
+        idx1 = rng.randint(0, tamanho - 2)
+        idx2 = rng.randint(idx1 + 1, tamanho) - 1
+        while idx1 < idx2:
+            rota[idx1], rota[idx2] = rota[idx2], rota[idx1]
+            idx1 += 1
+            idx2 -= 1
     return rota
 
 
+def _aplicar_operador(
+    operador: str,
+    rota: List[int],
+    rng: random.Random,
+    distancia_fn: Callable[[int, int], float],
+    deposito_idx: int,
+) -> None:
+    # Operadores de uma rota so (o OX e tratado a parte, pois gera dois filhos).
+    if operador == "troca":
+        mutacao_troca(rota, 1.0, rng)
+    elif operador == "inversao":
+        mutacao_inversao(rota, 1.0, rng)
+    elif operador == "2opt":
+        movimento_2opt(rota, distancia_fn, deposito_idx, rng)
+
+
+def _opcoes_agrupamento(parametros: Dict[str, Any]) -> Tuple[bool, int]:
+    """(agrupar_coordenadas, casas_agrupamento) validados; o agrupamento roda antes de `_preparar_parametros`."""
+    agrupar = bool(parametros.get("agrupar_coordenadas", True))
+    casas = 5
+    if "casas_agrupamento" in parametros:
+        try:
+            casas = int(max(2, min(8, int(parametros["casas_agrupamento"]))))
+        except (TypeError, ValueError):
+            pass
+    return agrupar, casas
+
+
 def _preparar_parametros(parametros: Dict[str, Any], num_pedidos: int) -> Dict[str, Any]:
     """Normaliza e limita parametros do GA para evitar entradas extremas."""
     usar_osrm_default = str(os.getenv("LOGISTICS_OSRM_ENABLED", "true")).lower() in {"1", "true", "yes", "on"}
@@ -215,6 +316,18 @@ def _preparar_parametros(parametros: Dict[str, Any], num_pedidos: int) -> Dict[s
         "osrm_timeout": 15,
         "osrm_tentativas": 3,
         "seed": None,
+        "cache_fitness": True,
+        "tamanho_cache_fitness": 4096,
+        "manter_diversidade": False,
+        "modo": "padrao",
+        "tamanho_cluster": 100,
+        "agrupar_coordenadas": True,
+        "casas_agrupamento": 5,
+        "processos": None,
+        "gap_parada": 0.0,
+        "limite_inferior": True,
+        "operadores_adaptativos": False,
+        "algoritmo": "genetico",
     }
 
     seguros: Dict[str, Any] = defaults.copy()
@@ -222,6 +335,35 @@ def _preparar_parametros(parametros: Dict[str, Any], num_pedidos: int) -> Dict[s
     def _clamp(valor: float, minimo: float, maximo: float) -> float:
         return max(minimo, min(maximo, valor))
 
+    if parametros.get("modo") in MODOS_OTIMIZACAO:
+        seguros["modo"] = parametros["modo"]
+
+    if parametros.get("algoritmo") in ALGORITMOS:
+        seguros["algoritmo"] = parametros["algoritmo"]
+
+    if "tamanho_cluster" in parametros:
+        try:
+            seguros["tamanho_cluster"] = int(_clamp(int(parametros["tamanho_cluster"]), 10, 500))
+        except (TypeError, ValueError):
+            pass
+
+    if "processos" in parametros and parametros["processos"] is not None:
+        try:
+            seguros["processos"] = int(_clamp(int(parametros["processos"]), 1, os.cpu_count() or 1))
+        except (TypeError, ValueError):
+            pass
+
+    seguros["agrupar_coordenadas"], seguros["casas_agrupamento"] = _opcoes_agrupamento(parametros)
+
+    # Na decomposicao o GA roda por setor, entao o limite minimo da populacao segue o tamanho do setor.
+    if seguros["modo"] == "decomposicao":
+        num_pedidos = min(num_pedidos, seguros["tamanho_cluster"])
+
+    # Defaults ajustados offline (comando autoajustar_parametros) para a faixa de tamanho.
+    # Entram como se viessem na requisicao, para passar pelos mesmos limites abaixo;
+    # valores enviados na requisicao continuam tendo prioridade.
+    parametros = {**parametros_para_tamanho(num_pedidos), **parametros}
+
     min_pop = max(4, num_pedidos)
     max_pop = 500
     min_geracoes = 10
@@ -284,6 +426,30 @@ def _preparar_parametros(parametros: Dict[str, Any], num_pedidos: int) -> Dict[s
         except (TypeError, ValueError):
             pass
 
+    if "cache_fitness" in parametros:
+        seguros["cache_fitness"] = bool(parametros["cache_fitness"])
+
+    if "tamanho_cache_fitness" in parametros:
+        try:
+            seguros["tamanho_cache_fitness"] = int(_clamp(int(parametros["tamanho_cache_fitness"]), 1, 100000))
+        except (TypeError, ValueError):
+            pass
+
+    if "manter_diversidade" in parametros:
+        seguros["manter_diversidade"] = bool(parametros["manter_diversidade"])
+
+    if "gap_parada" in parametros:
+        try:
+            seguros["gap_parada"] = float(_clamp(float(parametros["gap_parada"]), 0.0, 100.0))
+        except (TypeError, ValueError):
+            pass
+
+    if "limite_inferior" in parametros:
+        seguros["limite_inferior"] = bool(parametros["limite_inferior"])
+
+    if "operadores_adaptativos" in parametros:
+        seguros["operadores_adaptativos"] = bool(parametros["operadores_adaptativos"])
+
     # Garante que elitismo nao seja maior que a populacao final.
     seguros["elitismo"] = min(seguros["elitismo"], seguros["tamanho_pop"])
 
@@ -301,12 +467,25 @@ def algoritmo_genetico(
     distancia_fn: Optional[Callable[[int, int], float]] = None,
     deposito_idx: Optional[int] = None,
     random_seed: Optional[int] = None,
+    usar_cache_fitness: bool = True,
+    tamanho_cache_fitness: int = 4096,
+    manter_diversidade: bool = False,
+    rotas_iniciais: Optional[List[List[int]]] = None,
+    gap_parada: float = 0.0,
+    calcular_limite_inferior: bool = True,
+    operadores_adaptativos: bool = False,
+    checkpoint_caminho: Optional[str] = None,
+    intervalo_checkpoint: int = INTERVALO_CHECKPOINT_PADRAO,
+    cancelamento: Optional[TokenCancelamento] = None,
 ) -> dict:
     # Algoritmo genetico para otimizar a ordem de entregas.
+    # Com `checkpoint_caminho` o estado completo e gravado a cada `intervalo_checkpoint` geracoes;
+    # se o arquivo ja existir (mesma instancia e parametros) a execucao continua de onde parou
+    # e chega ao mesmo resultado da execucao sem interrupcao. O arquivo e removido ao terminar.
     inicio_tempo = time.time()
 
-    if random_seed is not None:
-        random.seed(random_seed)
+    # Gerador local: nao interfere no estado global de `random` e permite reproduzir execucoes.
+    rng = random.Random(random_seed if random_seed is not None else random.random())
 
     num_pedidos = len(pedidos_coords)
     if num_pedidos == 0:
@@ -319,6 +498,8 @@ def algoritmo_genetico(
             "historico_media": [],
             "melhoria_percentual": 0,
             "criterio_parada": "sem_pedidos",
+            "cache_fitness": None,
+            "duplicatas_substituidas": 0,
         }
 
     tamanho_pop = max(4, min(int(tamanho_pop), 1000))
@@ -327,7 +508,18 @@ def algoritmo_genetico(
     taxa_crossover = float(max(0.0, min(taxa_crossover, 1.0)))
     taxa_mutacao = float(max(0.0, min(taxa_mutacao, 1.0)))
 
-    populacao = criar_populacao_inicial(tamanho_pop, num_pedidos)
+    # Dois buffers de populacao pre-alocados que alternam de papel a cada geracao:
+    # a geracao atual e lida de `populacao` e a proxima e escrita em `proxima`.
+    populacao = criar_populacao_inicial(tamanho_pop, num_pedidos, rng)
+    # Rotas iniciais (ex.: construidas por heuristica) substituem os primeiros individuos aleatorios.
+    for pos, rota_inicial in enumerate((rotas_iniciais or [])[:tamanho_pop]):
+        if sorted(rota_inicial) == list(range(num_pedidos)):
+            populacao[pos][:] = rota_inicial
+    proxima = [[0] * num_pedidos for _ in range(tamanho_pop)]
+    descarte = [0] * num_pedidos  # recebe o segundo filho quando sobra uma vaga impar
+    fitness = [0.0] * tamanho_pop
+    presentes = bytearray(num_pedidos)
+    num_pais = 2 * ((tamanho_pop - elitismo + 1) // 2)
 
     historico_melhor = []
     historico_media = []
@@ -338,58 +530,232 @@ def algoritmo_genetico(
     max_sem_melhora = max(50, num_geracoes // 2)
     criterio_parada = "geracoes"
 
+    # Uma MatrizDistancias vai inteira para o limite inferior (le o mesmo bloco);
+    # os lacos de avaliacao usam a closure, mais barata por chamada.
+    matriz = distancia_fn if isinstance(distancia_fn, MatrizDistancias) else None
+    if matriz is not None:
+        distancia_fn = matriz.funcao_distancia()
     usar_matriz = distancia_fn is not None and deposito_idx is not None
+    # Distancia por indice (deposito incluso) para o limite inferior e o movimento 2-opt.
+    if usar_matriz:
+        dist_indices, idx_deposito = distancia_fn, deposito_idx
+    else:
+        dist_indices = criar_distancia_fn_coordenadas(pedidos_coords, deposito_coords)
+        idx_deposito = num_pedidos
+
+    # Com operadores adaptativos cada filho guarda (operador, fitness do pai) para ser creditado
+    # quando for avaliado na geracao seguinte.
+    seletor = SeletorOperadores() if operadores_adaptativos else None
+    origem: List[Optional[Tuple[str, float]]] = [None] * tamanho_pop
+    pressao = taxa_mutacao
+
+    # Limite inferior (Held-Karp) para medir o gap; calculado apos avaliar a primeira geracao.
+    limite_inferior = None
+    gap_percentual = None
+
+    # Matrizes OSRM podem ser assimetricas; so a Haversine permite unificar a rota com o seu inverso.
+    cache = CacheFitness(tamanho_cache_fitness, simetrica=not usar_matriz) if usar_cache_fitness else None
+    duplicatas_substituidas = 0
+
+    geracao_inicial = 0
+    if checkpoint_caminho:
+        assinatura = {
+            "num_pedidos": num_pedidos,
+            "coords_crc": zlib.crc32(
+                array("d", [v for ponto in list(pedidos_coords) + [deposito_coords] for v in ponto]).tobytes()
+            ),
+            "tamanho_pop": tamanho_pop,
+            "num_geracoes": num_geracoes,
+            "taxa_crossover": taxa_crossover,
+            "taxa_mutacao": taxa_mutacao,
+            "elitismo": elitismo,
+            "random_seed": random_seed,
+            "usar_matriz": usar_matriz,
+            "usar_cache_fitness": usar_cache_fitness,
+            "tamanho_cache_fitness": tamanho_cache_fitness,
+            "manter_diversidade": manter_diversidade,
+            "gap_parada": gap_parada,
+            "calcular_limite_inferior": calcular_limite_inferior,
+            "operadores_adaptativos": operadores_adaptativos,
+        }
+        estado = carregar_checkpoint(checkpoint_caminho)
+        if estado is not None and estado["assinatura"] != assinatura:
+            logger.warning("[GA] checkpoint %s e de outra execucao; recomecando do zero", checkpoint_caminho)
+            estado = None
+        if estado is not None:
+            rng.setstate(estado["rng_estado"])
+            populacao = estado["populacao"]
+            origem = [tuple(credito) if credito else None for credito in estado["origem"]]
+            historico_melhor = estado["historico_melhor"]
+            historico_media = estado["historico_media"]
+            melhor_rota_global = estado["melhor_rota"]
+            melhor_fitness_global = estado["melhor_fitness"]
+            geracoes_sem_melhora = estado["geracoes_sem_melhora"]
+            limite_inferior = estado["limite_inferior"]
+            gap_percentual = estado["gap_percentual"]
+            pressao = estado["pressao"]
+            duplicatas_substituidas = estado["duplicatas_substituidas"]
+            if seletor is not None:
+                for nome, valores in estado["seletor"].items():
+                    setattr(seletor, nome, valores)
+            if cache is not None:
+                cache.restaurar(estado["cache_chaves"], estado["cache_valores"], *estado["cache_contadores"])
+            inicio_tempo -= estado["tempo_decorrido"]
+            geracao_inicial = estado["proxima_geracao"]
+            logger.info("[GA] retomando do checkpoint %s na geracao %s", checkpoint_caminho, geracao_inicial)
+
+    def _salvar_checkpoint(proxima_geracao: int) -> None:
+        cache_exportado = cache.exportar() if cache is not None else {}
+        salvar_checkpoint(
+            checkpoint_caminho,
+            {
+                "assinatura": assinatura,
+                "proxima_geracao": proxima_geracao,
+                "tempo_decorrido": time.time() - inicio_tempo,
+                "populacao": populacao,
+                "origem": origem,
+                "rng_estado": rng.getstate(),
+                "historico_melhor": historico_melhor,
+                "historico_media": historico_media,
+                "melhor_rota": melhor_rota_global,
+                "melhor_fitness": melhor_fitness_global,
+                "geracoes_sem_melhora": geracoes_sem_melhora,
+                "limite_inferior": limite_inferior,
+                "gap_percentual": gap_percentual,
+                "pressao": pressao,
+                "duplicatas_substituidas": duplicatas_substituidas,
+                "seletor": (
+                    {
+                        "probabilidades": seletor.probabilidades,
+                        "qualidades": seletor.qualidades,
+                        "usos": seletor.usos,
+                        "sucessos": seletor.sucessos,
+                    }
+                    if seletor is not None
+                    else None
+                ),
+                "cache_chaves": cache_exportado.get("chaves", []),
+                "cache_valores": cache_exportado.get("valores", []),
+                "cache_contadores": [cache_exportado.get(k, 0) for k in ("hits", "misses", "remocoes")],
+            },
+        )
 
-    for geracao in range(num_geracoes):
-        fitness = [
-            avaliar_rota(rota, pedidos_coords, deposito_coords, distancia_fn if usar_matriz else None, deposito_idx)
-            for rota in populacao
-        ]
-
-        idx_melhor = fitness.index(min(fitness))
+    for geracao in range(geracao_inicial, num_geracoes):
+        vistos = set() if manter_diversidade else None
+        for i, rota in enumerate(populacao):
+            chave = None
+            if cache is not None or vistos is not None:
+                chave = cache.chave(rota) if cache is not None else tuple(rota)
+                if vistos is not None:
+                    if chave in vistos:
+                        # Duplicata: vira um mutante novo para gastar a avaliacao explorando.
+                        mutacao_inversao(rota, 1.0, rng)
+                        mutacao_troca(rota, 1.0, rng)
+                        chave = cache.chave(rota) if cache is not None else tuple(rota)
+                        duplicatas_substituidas += 1
+                    vistos.add(chave)
+
+            valor = cache.obter(chave) if cache is not None else None
+            if valor is None:
+                valor = avaliar_rota(
+                    rota, pedidos_coords, deposito_coords, distancia_fn if usar_matriz else None, deposito_idx
+                )
+                if cache is not None:
+                    cache.guardar(chave, valor)
+            fitness[i] = valor
+
+        if seletor is not None:
+            for i, credito in enumerate(origem):
+                if credito is not None:
+                    seletor.registrar(credito[0], credito[1], fitness[i])
+            seletor.atualizar()
+            pressao = pressao_mutacao(taxa_mutacao, len(set(fitness)) / tamanho_pop)
+
+        indices_elite = heapq.nsmallest(elitismo, range(tamanho_pop), key=fitness.__getitem__)
+        idx_melhor = indices_elite[0]
         melhor_fitness = fitness[idx_melhor]
-        melhor_rota = populacao[idx_melhor]
 
         if melhor_fitness < melhor_fitness_global:
             melhor_fitness_global = melhor_fitness
-            melhor_rota_global = melhor_rota.copy()
+            melhor_rota_global = populacao[idx_melhor].copy()
             geracoes_sem_melhora = 0
         else:
             geracoes_sem_melhora += 1
 
         historico_melhor.append(melhor_fitness)
-        historico_media.append(sum(fitness) / len(fitness))
+        historico_media.append(sum(fitness) / tamanho_pop)
+
+        if geracao == 0 and calcular_limite_inferior:
+            nos = list(range(num_pedidos)) + [idx_deposito]
+            limite_inferior = limite_inferior_held_karp(
+                nos, matriz if matriz is not None else dist_indices, melhor_fitness_global
+            )
+        if limite_inferior:
+            gap_percentual = max(0.0, (melhor_fitness_global - limite_inferior) / limite_inferior * 100)
+            if gap_parada > 0 and gap_percentual <= gap_parada:
+                criterio_parada = "gap"
+                break
 
         if geracoes_sem_melhora > max_sem_melhora:
             criterio_parada = "estagnacao"
             break
 
-        nova_populacao: List[List[int]] = []
-
-        indices_elite = sorted(range(len(fitness)), key=lambda i: fitness[i])[:elitismo]
-        for idx in indices_elite:
-            nova_populacao.append(populacao[idx].copy())
+        # Cancelado: devolve a melhor rota encontrada ate aqui.
+        if deve_cancelar(cancelamento, geracao):
+            criterio_parada = "cancelado"
+            break
 
-        while len(nova_populacao) < tamanho_pop:
-            pai1 = selecao_torneio(populacao, fitness)
-            pai2 = selecao_torneio(populacao, fitness)
+        for pos, idx in enumerate(indices_elite):
+            proxima[pos][:] = populacao[idx]
+            origem[pos] = None
+
+        pais = selecao_torneio_lote(fitness, num_pais, rng=rng)
+        pos = elitismo
+        for k in range(0, num_pais, 2):
+            pai1 = populacao[pais[k]]
+            pai2 = populacao[pais[k + 1]]
+            filho1 = proxima[pos]
+            filho2 = proxima[pos + 1] if pos + 1 < tamanho_pop else descarte
+
+            if seletor is not None:
+                operador = seletor.sortear(rng)
+                if operador == "ox":
+                    crossover_ordem(pai1, pai2, filho1, filho2, rng, presentes)
+                else:
+                    filho1[:] = pai1
+                    filho2[:] = pai2
+                    _aplicar_operador(operador, filho1, rng, dist_indices, idx_deposito)
+                    _aplicar_operador(operador, filho2, rng, dist_indices, idx_deposito)
+                # Pressao extra de mutacao, maior quando a populacao perde diversidade.
+                mutacao_inversao(filho1, pressao, rng)
+                mutacao_inversao(filho2, pressao, rng)
+                origem[pos] = (operador, fitness[pais[k]])
+                if pos + 1 < tamanho_pop:
+                    origem[pos + 1] = (operador, fitness[pais[k + 1]])
+                pos += 2
+                continue
 
-            if random.random() < taxa_crossover:
-                filho1, filho2 = crossover_ordem(pai1, pai2)
+            if rng.random() < taxa_crossover:
+                crossover_ordem(pai1, pai2, filho1, filho2, rng, presentes)
             else:
-                filho1, filho2 = pai1.copy(), pai2.copy()
+                filho1[:] = pai1
+                filho2[:] = pai2
 
-            filho1 = mutacao_troca(filho1, taxa_mutacao)
-            filho1 = mutacao_inversao(filho1, taxa_mutacao * 0.5)
+            mutacao_troca(filho1, taxa_mutacao, rng)
+            mutacao_inversao(filho1, taxa_mutacao * 0.5, rng)
 
-            filho2 = mutacao_troca(filho2, taxa_mutacao)
-            filho2 = mutacao_inversao(filho2, taxa_mutacao * 0.5)
+            mutacao_troca(filho2, taxa_mutacao, rng)
+            mutacao_inversao(filho2, taxa_mutacao * 0.5, rng)
 
-            nova_populacao.append(filho1)
-            if len(nova_populacao) < tamanho_pop:
-                nova_populacao.append(filho2)
+            pos += 2
 
-        populacao = nova_populacao
+        populacao, proxima = proxima, populacao
+
+        if checkpoint_caminho and (geracao + 1) % max(1, intervalo_checkpoint) == 0 and geracao + 1 < num_geracoes:
+            _salvar_checkpoint(geracao + 1)
+
+    if checkpoint_caminho:
+        remover_checkpoint(checkpoint_caminho)
 
     tempo_execucao = time.time() - inicio_tempo
 
@@ -409,6 +775,11 @@ def algoritmo_genetico(
         "historico_media": historico_media,
         "melhoria_percentual": melhoria_percentual,
         "criterio_parada": criterio_parada,
+        "cache_fitness": cache.estatisticas() if cache is not None else None,
+        "duplicatas_substituidas": duplicatas_substituidas,
+        "limite_inferior_km": round(limite_inferior, 2) if limite_inferior else None,
+        "gap_percentual": round(gap_percentual, 2) if gap_percentual is not None else None,
+        "operadores": seletor.estatisticas() if seletor is not None else None,
     }
 
 
@@ -416,61 +787,175 @@ def otimizar_rota_pedidos(
     pedidos: List[dict],
     deposito: dict,
     parametros: Optional[Dict[str, Any]] = None,
+    checkpoint_caminho: Optional[str] = None,
+    cancelamento: Optional[TokenCancelamento] = None,
 ) -> dict:
     # Converte pedidos e deposito para o GA e retorna rota otimizada.
+    # `checkpoint_caminho` (so para o GA no modo padrao) vem de quem executa o job, nunca do payload HTTP.
+    # `cancelamento` interrompe o motor do modo padrao; na decomposicao descarta os setores que ainda nao rodaram.
+    marco = time.perf_counter()
+    tempos_fases: Dict[str, float] = {}
+
+    def _fechar_fase(nome: str) -> None:
+        nonlocal marco
+        agora = time.perf_counter()
+        tempos_fases[nome] = round(agora - marco, 4)
+        marco = agora
+
     _validar_entradas(pedidos, deposito)
     pedidos_coords = [(p["latitude"], p["longitude"]) for p in pedidos]
     deposito_coords = (deposito["latitude"], deposito["longitude"])
 
-    parametros_tratados = _preparar_parametros(parametros or {}, num_pedidos=len(pedidos_coords))
-
-    # Tenta construir matriz OSRM se solicitado.
-    distancia_fn = None
-    deposito_idx = None
-    osrm_usado = False
-    if parametros_tratados.get("usar_osrm"):
-        logger.info(
-            "[GA][OSRM] solicitando matriz via OSRM: pontos=%s deposito=1 url=%s",
-            len(pedidos_coords),
-            parametros_tratados.get("osrm_base_url"),
-        )
-        matriz = _construir_matriz_osrm(
-            pontos=pedidos_coords,
-            deposito=deposito_coords,
-            base_url=parametros_tratados.get("osrm_base_url", "http://localhost:5000"),
-            timeout=parametros_tratados.get("osrm_timeout", 15),
-            tentativas=parametros_tratados.get("osrm_tentativas", 3),
-        )
-        if matriz:
-            distancia_fn = _criar_distancia_fn_matriz(matriz)
-            deposito_idx = len(pedidos_coords)  # deposito foi adicionado ao final da matriz
-            osrm_usado = True
+    parametros = parametros or {}
+
+    # Pedidos no mesmo endereco viram uma unica parada (um gene e uma linha da matriz); os
+    # limites dos parametros dependem do numero de paradas, entao o agrupamento vem antes.
+    agrupar, casas_decimais = _opcoes_agrupamento(parametros)
+    if agrupar:
+        paradas_coords, pedidos_por_parada = _agrupar_paradas(pedidos_coords, casas_decimais)
+    else:
+        paradas_coords = pedidos_coords
+        pedidos_por_parada = [[idx] for idx in range(len(pedidos_coords))]
+    parametros_tratados = _preparar_parametros(parametros, num_pedidos=len(paradas_coords))
+
+    _fechar_fase("preparacao")
+
+    matriz = None
+    try:
+        # Distancias viarias se solicitado: primeiro o armazem pre-computado (sem rede), depois o OSRM.
+        distancia_fn = None
+        deposito_idx = None
+        osrm_usado = False
+        armazem_usado = False
+        decomposicao = parametros_tratados["modo"] == "decomposicao"
+        # Na decomposicao a submatriz do armazem e compartilhada com os setores enquanto couber em memoria.
+        if parametros_tratados.get("usar_osrm") and (
+            not decomposicao or len(paradas_coords) + 1 <= MAX_PONTOS_MATRIZ_GLOBAL
+        ):
+            armazem = abrir_armazem_padrao()
+            if armazem is not None:
+                matriz = armazem.submatriz(paradas_coords + [deposito_coords])
+                if matriz is not None:
+                    armazem_usado = True
+                    osrm_usado = armazem.metrica == "osrm"
+                    logger.info(
+                        "[GA][ARMAZEM] submatriz obtida do armazem: tamanho=%sx%s metrica=%s",
+                        len(matriz),
+                        len(matriz),
+                        armazem.metrica,
+                    )
+
+        if parametros_tratados.get("usar_osrm") and not decomposicao and matriz is None:
             logger.info(
-                "[GA][OSRM] matriz obtida com sucesso: tamanho=%sx%s url=%s",
-                len(matriz),
-                len(matriz[0]) if matriz else 0,
+                "[GA][OSRM] solicitando matriz via OSRM: pontos=%s deposito=1 url=%s",
+                len(paradas_coords),
                 parametros_tratados.get("osrm_base_url"),
             )
+            matriz = _construir_matriz_osrm(
+                pontos=paradas_coords,
+                deposito=deposito_coords,
+                base_url=parametros_tratados.get("osrm_base_url", "http://localhost:5000"),
+                timeout=parametros_tratados.get("osrm_timeout", 15),
+                tentativas=parametros_tratados.get("osrm_tentativas", 3),
+            )
+            if matriz is not None:
+                osrm_usado = True
+                logger.info(
+                    "[GA][OSRM] matriz obtida com sucesso: tamanho=%sx%s url=%s",
+                    len(matriz),
+                    len(matriz),
+                    parametros_tratados.get("osrm_base_url"),
+                )
+            else:
+                logger.warning(
+                    "[GA][OSRM] falha ao obter matriz; usando Haversine. url=%s",
+                    parametros_tratados.get("osrm_base_url"),
+                )
+
+        if matriz is not None:
+            # Os motores recebem a propria matriz: leem o mesmo bloco, sem copia.
+            distancia_fn = matriz
+            deposito_idx = len(paradas_coords)  # deposito foi adicionado ao final da matriz
+
+        _fechar_fase("matriz")
+
+        parametros_ga = dict(
+            tamanho_pop=parametros_tratados["tamanho_pop"],
+            num_geracoes=parametros_tratados["num_geracoes"],
+            taxa_crossover=parametros_tratados["taxa_crossover"],
+            taxa_mutacao=parametros_tratados["taxa_mutacao"],
+            elitismo=parametros_tratados["elitismo"],
+            random_seed=parametros_tratados.get("seed"),
+            usar_cache_fitness=parametros_tratados["cache_fitness"],
+            tamanho_cache_fitness=parametros_tratados["tamanho_cache_fitness"],
+            manter_diversidade=parametros_tratados["manter_diversidade"],
+            gap_parada=parametros_tratados["gap_parada"],
+            operadores_adaptativos=parametros_tratados["operadores_adaptativos"],
+            # Nos setores da decomposicao o limite so compensa quando serve para parar cedo.
+            calcular_limite_inferior=parametros_tratados["limite_inferior"]
+            and (not decomposicao or parametros_tratados["gap_parada"] > 0),
+        )
+
+        if decomposicao:
+            # Sem matriz do armazem, cada setor busca (se habilitado) apenas a sua propria matriz OSRM.
+            from .decomposicao import otimizar_por_decomposicao
+
+            osrm_setores = None
+            if parametros_tratados.get("usar_osrm") and matriz is None:
+                osrm_setores = {
+                    "base_url": parametros_tratados.get("osrm_base_url", "http://localhost:5000"),
+                    "timeout": parametros_tratados.get("osrm_timeout", 15),
+                    "tentativas": parametros_tratados.get("osrm_tentativas", 3),
+                }
+            resultado = otimizar_por_decomposicao(
+                pedidos_coords=paradas_coords,
+                deposito_coords=deposito_coords,
+                parametros_ga=parametros_ga,
+                tamanho_cluster=parametros_tratados["tamanho_cluster"],
+                processos=parametros_tratados["processos"],
+                osrm=osrm_setores,
+                cancelamento=cancelamento,
+                matriz=matriz,
+                matriz_osrm=osrm_usado,
+            )
+            osrm_usado = resultado["osrm_usado"]
+        elif parametros_tratados["algoritmo"] == "genetico":
+            resultado = algoritmo_genetico(
+                pedidos_coords=paradas_coords,
+                deposito_coords=deposito_coords,
+                distancia_fn=distancia_fn,
+                deposito_idx=deposito_idx,
+                checkpoint_caminho=checkpoint_caminho,
+                cancelamento=cancelamento,
+                **parametros_ga,
+            )
         else:
-            logger.warning(
-                "[GA][OSRM] falha ao obter matriz; usando Haversine. url=%s",
-                parametros_tratados.get("osrm_base_url"),
+            from .colonia_formigas import colonia_formigas
+            from .metaheuristicas import busca_tabu, recozimento_simulado
+
+            motor = {
+                "recozimento": recozimento_simulado,
+                "tabu": busca_tabu,
+                "colonia_formigas": colonia_formigas,
+            }[parametros_tratados["algoritmo"]]
+            resultado = motor(
+                pedidos_coords=paradas_coords,
+                deposito_coords=deposito_coords,
+                num_geracoes=parametros_tratados["num_geracoes"],
+                distancia_fn=distancia_fn,
+                deposito_idx=deposito_idx,
+                random_seed=parametros_tratados.get("seed"),
+                cancelamento=cancelamento,
             )
+    finally:
+        # Uma falha entre obter a matriz e terminar a busca nao deixa o bloco compartilhado para tras.
+        if matriz is not None:
+            matriz.liberar()
 
-    resultado = algoritmo_genetico(
-        pedidos_coords=pedidos_coords,
-        deposito_coords=deposito_coords,
-        tamanho_pop=parametros_tratados["tamanho_pop"],
-        num_geracoes=parametros_tratados["num_geracoes"],
-        taxa_crossover=parametros_tratados["taxa_crossover"],
-        taxa_mutacao=parametros_tratados["taxa_mutacao"],
-        elitismo=parametros_tratados["elitismo"],
-        distancia_fn=distancia_fn,
-        deposito_idx=deposito_idx,
-        random_seed=parametros_tratados.get("seed"),
-    )
+    _fechar_fase("busca")
 
-    rota_otimizada = resultado["rota_otimizada"] or []
+    rota_paradas = resultado["rota_otimizada"] or []
+    rota_otimizada = [idx for parada in rota_paradas for idx in pedidos_por_parada[parada]]
     rota_ids = [pedidos[idx]["id"] for idx in rota_otimizada]
 
     rota_coords = [
@@ -492,6 +977,8 @@ def otimizar_rota_pedidos(
         {"latitude": deposito_coords[0], "longitude": deposito_coords[1], "tipo": "deposito", "ordem": len(rota_coords)}
     )
 
+    _fechar_fase("montagem")
+
     return {
         "pedidos_ordem": rota_ids,
         "rota_coordenadas": rota_coords,
@@ -500,6 +987,16 @@ def otimizar_rota_pedidos(
         "num_geracoes": resultado["num_geracoes"],
         "melhoria_percentual": resultado["melhoria_percentual"],
         "criterio_parada": resultado["criterio_parada"],
+        "cache_fitness": resultado["cache_fitness"],
+        "duplicatas_substituidas": resultado["duplicatas_substituidas"],
+        "limite_inferior_km": resultado.get("limite_inferior_km"),
+        "gap_percentual": resultado.get("gap_percentual"),
+        "operadores": resultado.get("operadores"),
         "parametros_utilizados": {**parametros_tratados, "osrm_usado": osrm_usado},
-        "metrica_utilizada": "osrm" if osrm_usado else "haversine",
+        # Na decomposicao sem matriz do armazem o total e medido em Haversine mesmo quando os setores usaram OSRM.
+        "metrica_utilizada": "osrm" if osrm_usado and (not decomposicao or armazem_usado) else "haversine",
+        "num_clusters": resultado.get("num_clusters"),
+        "paradas_unicas": len(paradas_coords),
+        "armazem_distancias": armazem_usado,
+        "tempos_fases": tempos_fases,
     }
@@ -0,0 +1,138 @@
+from collections import deque
+from typing import Callable, List, Optional, Tuple
+
+from .indice_espacial import IndiceEspacial
+
+EPSILON_MELHORA = 1e-9
+
+
+def construir_vizinho_mais_proximo(
+    coordenadas: List[Tuple[float, float]],
+    deposito: Tuple[float, float],
+    indice: Optional[IndiceEspacial] = None,
+) -> List[int]:
+    """
+    Rota gulosa: parte do deposito e sempre visita o pedido mais proximo ainda nao visitado.
+    Usa o indice espacial (consumido durante a construcao) em vez de varrer todos os pedidos.
+    """
+    indice = indice or IndiceEspacial(coordenadas)
+    rota: List[int] = []
+    atual = indice.mais_proximo_do_ponto(*deposito)
+    while atual is not None:
+        rota.append(atual)
+        indice.remover(atual)
+        atual = indice.mais_proximo_do_indice(atual)
+    return rota
+
+
+def _custo_reversao_assimetrica(tour: List[int], inicio: int, fim: int, dist: Callable[[int, int], float]) -> float:
+    # Diferenca de custo das arestas internas de tour[inicio..fim] quando o trecho e percorrido ao contrario.
+    delta = 0.0
+    for k in range(inicio, fim):
+        delta += dist(tour[k + 1], tour[k]) - dist(tour[k], tour[k + 1])
+    return delta
+
+
+def busca_local(
+    rota: List[int],
+    distancia_fn: Callable[[int, int], float],
+    deposito_idx: int,
+    candidatos: List[List[int]],
+    simetrica: bool = True,
+    max_movimentos: Optional[int] = None,
+) -> List[int]:
+    """
+    2-opt + realocacao de pontos (or-opt de 1 pedido) restritos as listas candidatas.
+
+    Cada pedido so tenta ligar-se aos seus k vizinhos, e uma fila de pedidos ativos
+    ("don't look bits") faz com que apenas as pontas dos movimentos aplicados sejam
+    reavaliadas, mantendo cada passada proxima de linear no numero de pedidos.
+    O deposito fica fixo na posicao 0 do ciclo.
+    """
+    if len(rota) < 3:
+        return list(rota)
+
+    dist = distancia_fn
+    tour = [deposito_idx] + list(rota)
+    m = len(tour)
+    # Posicao de cada no no ciclo, mantida a cada movimento (evita tour.index, que e O(n)).
+    pos = [0] * (max(tour) + 1)
+    for i, no in enumerate(tour):
+        pos[no] = i
+
+    fila = deque(rota)
+    na_fila = set(rota)
+    movimentos = 0
+
+    def _ativar(*nos: int) -> None:
+        for no in nos:
+            if no != deposito_idx and no not in na_fila:
+                na_fila.add(no)
+                fila.append(no)
+
+    def _reindexar(inicio: int, fim: int) -> None:
+        for k in range(inicio, fim + 1):
+            pos[tour[k]] = k
+
+    def _tentar_2opt(i: int, j: int) -> bool:
+        # Troca as arestas (tour[i], tour[i+1]) e (tour[j], tour[j+1]) por (tour[i], tour[j]) e (tour[i+1], tour[j+1]).
+        if i > j:
+            i, j = j, i
+        if j - i < 2 or (i == 0 and j == m - 1):
+            return False
+        a, sa = tour[i], tour[i + 1]
+        c, sc = tour[j], tour[(j + 1) % m]
+        delta = dist(a, c) + dist(sa, sc) - dist(a, sa) - dist(c, sc)
+        if delta >= -EPSILON_MELHORA:
+            return False
+        if not simetrica:
+            delta += _custo_reversao_assimetrica(tour, i + 1, j, dist)
+            if delta >= -EPSILON_MELHORA:
+                return False
+        tour[i + 1 : j + 1] = tour[i + 1 : j + 1][::-1]
+        _reindexar(i + 1, j)
+        _ativar(a, sa, c, sc)
+        return True
+
+    def _tentar_realocacao(v: int) -> bool:
+        i = pos[v]
+        pv, sv = tour[i - 1], tour[(i + 1) % m]
+        ganho_remocao = dist(pv, v) + dist(v, sv) - dist(pv, sv)
+        for c in candidatos[v]:
+            j = pos[c]
+            for antes, depois in ((c, tour[(j + 1) % m]), (tour[j - 1], c)):
+                if v in (antes, depois):
+                    continue
+                custo_insercao = dist(antes, v) + dist(v, depois) - dist(antes, depois)
+                if custo_insercao - ganho_remocao < -EPSILON_MELHORA:
+                    tour.pop(i)
+                    if depois == deposito_idx:
+                        destino = len(tour)
+                    else:
+                        # Quem estava depois de v recuou uma posicao com a remocao.
+                        destino = pos[depois] - (1 if pos[depois] > i else 0)
+                    tour.insert(destino, v)
+                    _reindexar(min(i, destino), max(i, destino))
+                    _ativar(v, pv, sv, antes, depois)
+                    return True
+        return False
+
+    while fila:
+        if max_movimentos is not None and movimentos >= max_movimentos:
+            break
+        a = fila.popleft()
+        na_fila.discard(a)
+        melhorou = False
+        for c in candidatos[a]:
+            i, j = pos[a], pos[c]
+            # Sucessores: (a, suc(a)) x (c, suc(c)); predecessores: (pred(a), a) x (pred(c), c).
+            if _tentar_2opt(i, j) or _tentar_2opt((i - 1) % m, (j - 1) % m):
+                melhorou = True
+                break
+        if not melhorou:
+            melhorou = _tentar_realocacao(a)
+        if melhorou:
+            movimentos += 1
+            _ativar(a)
+
+    return tour[1:]
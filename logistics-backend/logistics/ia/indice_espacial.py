@@ -0,0 +1,157 @@
+import heapq
+import math
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+RAIO_TERRA_KM = 6371
+LIMITE_BUSCA_LINEAR = 32
+
+
+class IndiceEspacial:
+    """
+    Grade uniforme sobre lat/lon para consultas de vizinhos mais proximos.
+
+    As coordenadas sao projetadas (equiretangular, em km) em torno da latitude
+    media, o que e suficiente para ordenar vizinhos numa mesma regiao. A busca
+    percorre aneis de celulas a partir da celula da consulta (ou da celula da grade
+    mais proxima dela, se a consulta cai fora) e para assim que nenhum ponto fora
+    dos aneis visitados pode ser mais proximo que o k-esimo.
+    """
+
+    def __init__(self, coordenadas: List[Tuple[float, float]], pontos_por_celula: float = 2.0):
+        self.total = len(coordenadas)
+        lat_ref = sum(lat for lat, _ in coordenadas) / self.total if self.total else 0.0
+        self._cos_ref = math.cos(math.radians(lat_ref))
+        self._xy = [self._projetar(lat, lon) for lat, lon in coordenadas]
+
+        if self._xy:
+            xs = [x for x, _ in self._xy]
+            ys = [y for _, y in self._xy]
+            self._min_x, self._min_y = min(xs), min(ys)
+            self._max_x, self._max_y = max(xs), max(ys)
+        else:
+            self._min_x = self._min_y = self._max_x = self._max_y = 0.0
+        largura, altura = self._max_x - self._min_x, self._max_y - self._min_y
+
+        area = max(largura * altura, 1e-9)
+        # Piso pela diagonal: pontos colineares ou quase coincidentes (area ~0) nao geram
+        # milhares de celulas vazias; a grade fica com no maximo ~total/pontos_por_celula por eixo.
+        diagonal = math.hypot(largura, altura)
+        self.tamanho_celula = max(
+            math.sqrt(area * pontos_por_celula / max(self.total, 1)),
+            diagonal * pontos_por_celula / max(self.total, 1),
+            1e-3,
+        )
+        self._colunas = int(largura / self.tamanho_celula) + 1
+        self._linhas = int(altura / self.tamanho_celula) + 1
+
+        self._celulas: Dict[Tuple[int, int], List[int]] = defaultdict(list)
+        self._celula_do_ponto: List[Tuple[int, int]] = []
+        for idx, (x, y) in enumerate(self._xy):
+            celula = self._celula(x, y)
+            self._celulas[celula].append(idx)
+            self._celula_do_ponto.append(celula)
+            # Arredondamento na borda maxima pode cair uma celula alem da conta acima.
+            self._colunas = max(self._colunas, celula[0] + 1)
+            self._linhas = max(self._linhas, celula[1] + 1)
+        self._ativos: Set[int] = set(range(self.total))
+
+    def _projetar(self, lat: float, lon: float) -> Tuple[float, float]:
+        return (
+            RAIO_TERRA_KM * math.radians(lon) * self._cos_ref,
+            RAIO_TERRA_KM * math.radians(lat),
+        )
+
+    def _celula(self, x: float, y: float) -> Tuple[int, int]:
+        return (
+            math.floor((x - self._min_x) / self.tamanho_celula),
+            math.floor((y - self._min_y) / self.tamanho_celula),
+        )
+
+    def _celulas_do_anel(self, centro: Tuple[int, int], raio: int) -> Iterable[Tuple[int, int]]:
+        cx, cy = centro
+        if raio == 0:
+            yield centro
+            return
+        for dx in range(-raio, raio + 1):
+            yield cx + dx, cy - raio
+            yield cx + dx, cy + raio
+        for dy in range(-raio + 1, raio):
+            yield cx - raio, cy + dy
+            yield cx + raio, cy + dy
+
+    def _raio_maximo(self, centro: Tuple[int, int]) -> int:
+        # Quantidade de aneis necessaria para cobrir toda a grade a partir do centro.
+        cx, cy = centro
+        return max(abs(cx), abs(cx - self._colunas + 1), abs(cy), abs(cy - self._linhas + 1))
+
+    @property
+    def ativos(self) -> int:
+        return len(self._ativos)
+
+    def remover(self, idx: int) -> None:
+        """Remove um ponto das consultas seguintes (ex.: pedido ja visitado)."""
+        if idx in self._ativos:
+            self._ativos.discard(idx)
+            self._celulas[self._celula_do_ponto[idx]].remove(idx)
+
+    def _k_mais_proximos(self, x: float, y: float, k: int, ignorar: Optional[int]) -> List[int]:
+        k = min(k, self.ativos - (1 if ignorar in self._ativos else 0))
+        if k <= 0:
+            return []
+
+        if self.ativos <= LIMITE_BUSCA_LINEAR:
+            # Com poucos pontos restantes, varrer aneis vazios custa mais que comparar todos.
+            candidatos = [
+                ((self._xy[idx][0] - x) ** 2 + (self._xy[idx][1] - y) ** 2, idx)
+                for idx in self._ativos
+                if idx != ignorar
+            ]
+            return [idx for _, idx in heapq.nsmallest(k, candidatos)]
+
+        # Consulta fora da grade (ex.: deposito distante): parte do ponto da grade mais proximo.
+        # Todo ponto da grade esta a pelo menos `distancia_grade` da consulta, e a distancia ate
+        # ele cresce em quadratura com a distancia a partir desse ponto mais proximo.
+        gx = min(max(x, self._min_x), self._max_x)
+        gy = min(max(y, self._min_y), self._max_y)
+        distancia_grade = (gx - x) ** 2 + (gy - y) ** 2
+        centro = self._celula(gx, gy)
+        candidatos = []
+        raio_maximo = self._raio_maximo(centro)
+        raio = 0
+        while raio <= raio_maximo:
+            for celula in self._celulas_do_anel(centro, raio):
+                for idx in self._celulas.get(celula, ()):
+                    if idx == ignorar:
+                        continue
+                    px, py = self._xy[idx]
+                    candidatos.append(((px - x) ** 2 + (py - y) ** 2, idx))
+            if len(candidatos) >= k:
+                # Pontos alem do anel atual estao a pelo menos `raio * tamanho_celula` do centro.
+                limite = distancia_grade + (raio * self.tamanho_celula) ** 2
+                if heapq.nsmallest(k, candidatos)[-1][0] <= limite:
+                    break
+            raio += 1
+        return [idx for _, idx in heapq.nsmallest(k, candidatos)]
+
+    def k_mais_proximos_do_ponto(self, lat: float, lon: float, k: int) -> List[int]:
+        """Indices dos k pontos ativos mais proximos de (lat, lon), do mais perto ao mais longe."""
+        x, y = self._projetar(lat, lon)
+        return self._k_mais_proximos(x, y, k, ignorar=None)
+
+    def k_mais_proximos_do_indice(self, idx: int, k: int) -> List[int]:
+        """Os k pontos ativos mais proximos do ponto `idx` (o proprio ponto nao entra)."""
+        x, y = self._xy[idx]
+        return self._k_mais_proximos(x, y, k, ignorar=idx)
+
+    def mais_proximo_do_ponto(self, lat: float, lon: float) -> Optional[int]:
+        vizinhos = self.k_mais_proximos_do_ponto(lat, lon, 1)
+        return vizinhos[0] if vizinhos else None
+
+    def mais_proximo_do_indice(self, idx: int) -> Optional[int]:
+        vizinhos = self.k_mais_proximos_do_indice(idx, 1)
+        return vizinhos[0] if vizinhos else None
+
+    def listas_candidatas(self, k: int = 10) -> List[List[int]]:
+        """Para cada ponto, os k vizinhos ativos mais proximos (listas candidatas das heuristicas)."""
+        return [self.k_mais_proximos_do_indice(idx, k) for idx in range(self.total)]
@@ -0,0 +1,143 @@
+from typing import Callable, List, Optional, Sequence, Tuple
+
+from .matriz_distancias import MatrizDistancias
+
+MAX_PONTOS_LIMITE = 300  # acima disso a matriz densa e o Prim O(n^2) por iteracao custam mais que o proprio GA
+ITERACOES_PADRAO = 40
+
+
+def _matriz_simetrica(nos: List[int], distancia_fn: Callable[[int, int], float]) -> Tuple[MatrizDistancias, bool]:
+    """
+    Matriz dos `nos` para a 1-arvore e se ela foi criada aqui (e deve ser liberada).
+    Le direto a matriz compartilhada quando ela ja e a dos `nos` e e simetrica; senao
+    monta uma com o menor dos dois sentidos (mantem o limite valido em matrizes OSRM).
+    """
+    n = len(nos)
+    if isinstance(distancia_fn, MatrizDistancias) and len(distancia_fn) == n and nos == list(range(n)):
+        if distancia_fn.simetrica():
+            return distancia_fn, False
+    matriz = MatrizDistancias.criar(n)
+    valores = matriz.valores
+    for i in range(n):
+        for j in range(i + 1, n):
+            valor = min(distancia_fn(nos[i], nos[j]), distancia_fn(nos[j], nos[i]))
+            valores[i * n + j] = valores[j * n + i] = valor
+    return matriz, True
+
+
+def _uma_arvore(valores: Sequence[float], n: int, pi: List[float], especial: int) -> Tuple[float, List[int]]:
+    """
+    1-arvore minima com custos reduzidos c_ij + pi_i + pi_j: arvore geradora minima (Prim)
+    sobre os nos exceto `especial`, mais as duas arestas mais baratas do no especial.
+    `valores` e a matriz plana n x n. Retorna o custo e o grau de cada no.
+    """
+    infinito = float("inf")
+    graus = [0] * n
+    chave = [infinito] * n
+    pai = [-1] * n
+    fora = [i for i in range(n) if i != especial]
+    chave[fora[0]] = 0.0
+    custo = 0.0
+
+    proximo = 0
+    while fora:
+        u = fora[proximo]
+        fora[proximo] = fora[-1]
+        fora.pop()
+        custo += chave[u]
+        if pai[u] >= 0:
+            graus[u] += 1
+            graus[pai[u]] += 1
+        base_u = u * n
+        pi_u = pi[u]
+        # Atualiza as chaves e ja escolhe o proximo no da arvore na mesma passada.
+        menor = infinito
+        for pos, v in enumerate(fora):
+            reduzido = valores[base_u + v] + pi_u + pi[v]
+            if reduzido < chave[v]:
+                chave[v] = reduzido
+                pai[v] = u
+            if chave[v] < menor:
+                menor = chave[v]
+                proximo = pos
+
+    base_especial = especial * n
+    pi_especial = pi[especial]
+    arestas = sorted((valores[base_especial + v] + pi_especial + pi[v], v) for v in range(n) if v != especial)[:2]
+    for valor, v in arestas:
+        custo += valor
+        graus[v] += 1
+        graus[especial] += 1
+    return custo, graus
+
+
+def _custo_vizinho_mais_proximo(valores: Sequence[float], n: int, inicio: int) -> float:
+    visitados = [False] * n
+    visitados[inicio] = True
+    atual, custo = inicio, 0.0
+    for _ in range(n - 1):
+        base = atual * n
+        proximo = min((v for v in range(n) if not visitados[v]), key=lambda v: valores[base + v])
+        custo += valores[base + proximo]
+        visitados[proximo] = True
+        atual = proximo
+    return custo + valores[atual * n + inicio]
+
+
+def limite_inferior_held_karp(
+    nos: List[int],
+    distancia_fn: Callable[[int, int], float],
+    limite_superior: Optional[float] = None,
+    iteracoes: int = ITERACOES_PADRAO,
+) -> Optional[float]:
+    """
+    Limite inferior de Held-Karp para o ciclo que visita todos os `nos` (o ultimo e o
+    deposito): relaxacao lagrangiana da 1-arvore com otimizacao por subgradiente
+    (penalidades pi nos nos com grau diferente de 2). O limite superior so calibra o
+    passo; usa o menor entre `limite_superior` e o vizinho mais proximo.
+    `distancia_fn` pode ser a propria MatrizDistancias, lida sem copia quando simetrica.
+    Retorna None para instancias grandes demais.
+    """
+    n = len(nos)
+    if n < 3 or n > MAX_PONTOS_LIMITE:
+        return None
+
+    matriz, propria = _matriz_simetrica(nos, distancia_fn)
+    try:
+        return _subgradiente(matriz.valores, n, limite_superior, iteracoes)
+    finally:
+        if propria:
+            matriz.liberar()
+
+
+def _subgradiente(valores: Sequence[float], n: int, limite_superior: Optional[float], iteracoes: int) -> float:
+    especial = n - 1
+    referencia = _custo_vizinho_mais_proximo(valores, n, especial)
+    if limite_superior is not None:
+        referencia = min(referencia, limite_superior)
+    pi = [0.0] * n
+    melhor = 0.0
+    passo = 2.0
+    sem_melhora = 0
+
+    for _ in range(max(1, iteracoes)):
+        custo, graus = _uma_arvore(valores, n, pi, especial)
+        limite = custo - 2 * sum(pi)
+        if limite > melhor + 1e-9:
+            melhor = limite
+            sem_melhora = 0
+        else:
+            sem_melhora += 1
+            if sem_melhora >= 5:
+                passo /= 2
+                sem_melhora = 0
+
+        subgradiente = [g - 2 for g in graus]
+        norma = sum(g * g for g in subgradiente)
+        if norma == 0:
+            # Todos os graus iguais a 2: a 1-arvore e um ciclo, logo e otima.
+            break
+        t = passo * max(referencia - limite, 1e-6) / norma
+        pi = [p + t * g for p, g in zip(pi, subgradiente)]
+
+    return melhor
@@ -0,0 +1,129 @@
+import sys
+from multiprocessing import resource_tracker, shared_memory
+from typing import Callable, Iterable, List, Sequence
+
+BYTES_POR_VALOR = 8  # float64
+RASTREIO_OPCIONAL = sys.version_info >= (3, 13)  # `SharedMemory(track=False)`
+
+
+class MatrizDistancias:
+    """
+    Matriz N x N de distancias (km) guardada em memoria compartilhada.
+
+    E o unico formato de matriz usado em `logistics.ia`: chamar `matriz(a, b)` devolve
+    a distancia de `a` para `b`, entao a instancia serve direto como `distancia_fn`.
+    Ao ser enviada para outro processo (pickle), so o nome do bloco e o tamanho
+    viajam; o processo de destino se anexa ao mesmo bloco sem copiar os dados.
+
+    Quem cria a matriz e o dono e deve chamar `liberar()` (ou usar `with`) ao final;
+    processos anexados apenas fecham a sua visao com `fechar()`.
+    """
+
+    def __init__(self, shm: shared_memory.SharedMemory, tamanho: int, dono: bool):
+        self._shm = shm
+        self.tamanho = tamanho
+        self.dono = dono
+        self._valores = shm.buf.cast("d")
+
+    @classmethod
+    def criar(cls, tamanho: int) -> "MatrizDistancias":
+        """Aloca uma matriz de `tamanho` x `tamanho` (o SO entrega o bloco zerado)."""
+        tamanho = max(1, int(tamanho))
+        shm = shared_memory.SharedMemory(create=True, size=tamanho * tamanho * BYTES_POR_VALOR)
+        return cls(shm, tamanho, dono=True)
+
+    @classmethod
+    def de_linhas(cls, linhas: Sequence[Sequence[float]]) -> "MatrizDistancias":
+        """Copia uma matriz em listas (ex.: resposta do OSRM) para a memoria compartilhada."""
+        matriz = cls.criar(len(linhas))
+        for i, linha in enumerate(linhas):
+            matriz.definir_linha(i, linha)
+        return matriz
+
+    @classmethod
+    def anexar(cls, nome: str, tamanho: int) -> "MatrizDistancias":
+        """Anexa-se (sem copia) a uma matriz criada por outro processo."""
+        if RASTREIO_OPCIONAL:
+            # Sem rastreamento: o bloco pertence ao processo que o criou.
+            shm = shared_memory.SharedMemory(name=nome, track=False)
+        else:
+            # Antes do 3.13 anexar tambem registra o bloco no resource_tracker; sem o
+            # unregister, um processo com rastreador proprio removeria o bloco do dono ao sair.
+            shm = shared_memory.SharedMemory(name=nome)
+            resource_tracker.unregister(shm._name, "shared_memory")
+        return cls(shm, tamanho, dono=False)
+
+    @property
+    def nome(self) -> str:
+        return self._shm.name
+
+    def __len__(self) -> int:
+        return self.tamanho
+
+    def __call__(self, a: int, b: int) -> float:
+        return self._valores[a * self.tamanho + b]
+
+    def funcao_distancia(self) -> Callable[[int, int], float]:
+        """Versao em closure de `__call__`, sem o custo de atributo por chamada nos lacos quentes."""
+        valores = self._valores
+        n = self.tamanho
+
+        def _dist(a: int, b: int) -> float:
+            return valores[a * n + b]
+
+        return _dist
+
+    @property
+    def valores(self) -> memoryview:
+        """Visao plana (float64) da matriz: o valor de (a, b) fica em `a * tamanho + b`."""
+        return self._valores
+
+    def simetrica(self, tolerancia: float = 1e-9) -> bool:
+        n = self.tamanho
+        valores = self._valores
+        return all(
+            abs(valores[i * n + j] - valores[j * n + i]) <= tolerancia for i in range(n) for j in range(i + 1, n)
+        )
+
+    def linha(self, i: int) -> List[float]:
+        inicio = i * self.tamanho
+        return self._valores[inicio : inicio + self.tamanho].tolist()
+
+    def definir_linha(self, i: int, valores: Iterable[float]) -> None:
+        inicio = i * self.tamanho
+        for j, valor in enumerate(valores):
+            self._valores[inicio + j] = float(valor)
+
+    def fechar(self) -> None:
+        """Solta a visao deste processo sobre o bloco (os dados continuam para os demais)."""
+        if self._valores is not None:
+            self._valores.release()
+            self._valores = None
+            self._shm.close()
+
+    def liberar(self) -> None:
+        """Fecha e, se este processo for o dono, remove o bloco do sistema."""
+        self.fechar()
+        if self.dono:
+            if not RASTREIO_OPCIONAL:
+                # Se o rastreador e o mesmo do processo anexado, o unregister dele tambem
+                # apagou o registro do dono; registrar de novo (idempotente) evita o KeyError
+                # que o rastreador imprimiria no unregister feito pelo unlink.
+                resource_tracker.register(self._shm._name, "shared_memory")
+            try:
+                self._shm.unlink()
+            except FileNotFoundError:
+                if not RASTREIO_OPCIONAL:
+                    resource_tracker.unregister(self._shm._name, "shared_memory")
+            self.dono = False
+
+    def __enter__(self) -> "MatrizDistancias":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.liberar()
+
+    def __reduce__(self):
+        # Pickle leva apenas a referencia; o destino se anexa ao mesmo bloco.
+        return (MatrizDistancias.anexar, (self.nome, self.tamanho))
+
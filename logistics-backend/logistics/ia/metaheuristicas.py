@@ -0,0 +1,303 @@
+import math
+import random
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .cancelamento import TokenCancelamento, deve_cancelar
+from .genetic_algorithm import avaliar_rota
+from .heuristicas import EPSILON_MELHORA, _custo_reversao_assimetrica, construir_vizinho_mais_proximo
+from .indice_espacial import IndiceEspacial
+from .matriz_distancias import MatrizDistancias
+from .utils import criar_distancia_fn_coordenadas
+
+LISTA_CANDIDATOS_K = 10
+TEMPERATURA_FINAL_RELATIVA = 1e-3  # a temperatura cai ate 0,1% da inicial ao longo das epocas
+MOVIMENTOS_POR_EPOCA = 5  # movimentos por pedido em cada epoca do recozimento
+
+
+def _preparar_metrica(
+    pedidos_coords: List[Tuple[float, float]],
+    deposito_coords: Tuple[float, float],
+    distancia_fn: Optional[Callable[[int, int], float]],
+    deposito_idx: Optional[int],
+) -> Tuple[Callable[[int, int], float], int, bool]:
+    # Mesma abstracao do GA: matriz por indice quando houver, senao Haversine por indice.
+    if distancia_fn is not None and deposito_idx is not None:
+        if isinstance(distancia_fn, MatrizDistancias):
+            distancia_fn = distancia_fn.funcao_distancia()
+        return distancia_fn, deposito_idx, False
+    return criar_distancia_fn_coordenadas(pedidos_coords, deposito_coords), len(pedidos_coords), True
+
+
+def _rota_inicial(
+    pedidos_coords: List[Tuple[float, float]],
+    deposito_coords: Tuple[float, float],
+    rotas_iniciais: Optional[List[List[int]]],
+) -> List[int]:
+    for rota in rotas_iniciais or []:
+        if sorted(rota) == list(range(len(pedidos_coords))):
+            return list(rota)
+    return construir_vizinho_mais_proximo(pedidos_coords, deposito_coords)
+
+
+def _delta_2opt(
+    tour: List[int], i: int, j: int, dist: Callable[[int, int], float], simetrica: bool
+) -> float:
+    # Custo de inverter tour[i+1..j] (troca das arestas (i, i+1) e (j, j+1)); o tour e ciclico.
+    m = len(tour)
+    a, b = tour[i], tour[i + 1]
+    c, d = tour[j], tour[(j + 1) % m]
+    delta = dist(a, c) + dist(b, d) - dist(a, b) - dist(c, d)
+    if not simetrica:
+        delta += _custo_reversao_assimetrica(tour, i + 1, j, dist)
+    return delta
+
+
+def _montar_resultado(
+    tour: List[int],
+    pedidos_coords: List[Tuple[float, float]],
+    deposito_coords: Tuple[float, float],
+    distancia_fn: Optional[Callable[[int, int], float]],
+    deposito_idx: Optional[int],
+    historico_melhor: List[float],
+    historico_media: List[float],
+    iteracoes: int,
+    criterio_parada: str,
+    inicio_tempo: float,
+) -> dict:
+    rota = tour[1:]  # o deposito nunca sai da posicao 0
+    distancia = avaliar_rota(rota, pedidos_coords, deposito_coords, distancia_fn, deposito_idx)
+    melhoria_percentual = 0
+    if historico_melhor and historico_melhor[0]:
+        melhoria_percentual = round((historico_melhor[0] - distancia) / historico_melhor[0] * 100, 2)
+    return {
+        "rota_otimizada": rota,
+        "distancia_total_km": round(distancia, 2),
+        "num_geracoes": iteracoes,
+        "tempo_execucao_s": round(time.time() - inicio_tempo, 2),
+        "historico_melhor": historico_melhor,
+        "historico_media": historico_media,
+        "melhoria_percentual": melhoria_percentual,
+        "criterio_parada": criterio_parada,
+        "cache_fitness": None,
+        "duplicatas_substituidas": 0,
+        "limite_inferior_km": None,
+        "gap_percentual": None,
+        "operadores": None,
+    }
+
+
+def _resultado_trivial(pedidos_coords, deposito_coords, inicio_tempo) -> dict:
+    rota = list(range(len(pedidos_coords)))
+    distancia = avaliar_rota(rota, pedidos_coords, deposito_coords)
+    return {
+        "rota_otimizada": rota,
+        "distancia_total_km": round(distancia, 2),
+        "num_geracoes": 0,
+        "tempo_execucao_s": round(time.time() - inicio_tempo, 2),
+        "historico_melhor": [distancia] if rota else [],
+        "historico_media": [],
+        "melhoria_percentual": 0,
+        "criterio_parada": "sem_pedidos" if not rota else "trivial",
+        "cache_fitness": None,
+        "duplicatas_substituidas": 0,
+        "limite_inferior_km": None,
+        "gap_percentual": None,
+        "operadores": None,
+    }
+
+
+def recozimento_simulado(
+    pedidos_coords: List[Tuple[float, float]],
+    deposito_coords: Tuple[float, float],
+    num_geracoes: int = 500,
+    distancia_fn: Optional[Callable[[int, int], float]] = None,
+    deposito_idx: Optional[int] = None,
+    random_seed: Optional[int] = None,
+    rotas_iniciais: Optional[List[List[int]]] = None,
+    cancelamento: Optional[TokenCancelamento] = None,
+) -> dict:
+    """
+    Recozimento simulado com vizinhanca 2-opt e avaliacao incremental (delta de 4 arestas).
+
+    Cada "geracao" e uma epoca de 5N movimentos a temperatura fixa; a temperatura inicial
+    aceita metade das pioras medias e cai geometricamente ate 0,1% dela na ultima epoca.
+    Parte do vizinho mais proximo (ou de `rotas_iniciais`) e devolve a melhor rota vista.
+    """
+    inicio_tempo = time.time()
+    rng = random.Random(random_seed if random_seed is not None else random.random())
+    n = len(pedidos_coords)
+    if n < 3:
+        return _resultado_trivial(pedidos_coords, deposito_coords, inicio_tempo)
+
+    dist, idx_deposito, simetrica = _preparar_metrica(pedidos_coords, deposito_coords, distancia_fn, deposito_idx)
+    tour = [idx_deposito] + _rota_inicial(pedidos_coords, deposito_coords, rotas_iniciais)
+    m = len(tour)
+    custo = avaliar_rota(tour[1:], pedidos_coords, deposito_coords, dist, idx_deposito)
+    melhor_tour, melhor_custo = tour.copy(), custo
+
+    # Temperatura inicial a partir da piora media de movimentos aleatorios.
+    pioras = []
+    for _ in range(min(200, 10 * n)):
+        i = rng.randrange(0, m - 2)
+        j = rng.randrange(i + 2, m)
+        delta = _delta_2opt(tour, i, j, dist, simetrica)
+        if delta > 0:
+            pioras.append(delta)
+    temperatura = (sum(pioras) / len(pioras)) / math.log(2) if pioras else 1.0
+    num_geracoes = max(1, int(num_geracoes))
+    resfriamento = TEMPERATURA_FINAL_RELATIVA ** (1.0 / num_geracoes)
+    movimentos_por_epoca = MOVIMENTOS_POR_EPOCA * n
+
+    historico_melhor = [melhor_custo]
+    historico_media = []
+    criterio_parada = "geracoes"
+
+    # Sem parada por estagnacao: enquanto a temperatura e alta a melhor rota quase nao muda
+    # e e o resfriamento que define a duracao da busca.
+    for epoca in range(num_geracoes):
+        soma_custos = 0.0
+        for _ in range(movimentos_por_epoca):
+            i = rng.randrange(0, m - 2)
+            j = rng.randrange(i + 2, m)
+            if i == 0 and j == m - 1:
+                continue
+            delta = _delta_2opt(tour, i, j, dist, simetrica)
+            if delta < 0 or rng.random() < math.exp(-delta / temperatura):
+                tour[i + 1 : j + 1] = tour[i + 1 : j + 1][::-1]
+                custo += delta
+                if custo < melhor_custo - EPSILON_MELHORA:
+                    melhor_custo = custo
+                    melhor_tour = tour.copy()
+            soma_custos += custo
+        historico_melhor.append(melhor_custo)
+        historico_media.append(soma_custos / movimentos_por_epoca)
+        temperatura *= resfriamento
+        if deve_cancelar(cancelamento, epoca):
+            criterio_parada = "cancelado"
+            break
+
+    return _montar_resultado(
+        melhor_tour,
+        pedidos_coords,
+        deposito_coords,
+        distancia_fn,
+        deposito_idx,
+        historico_melhor,
+        historico_media,
+        epoca + 1,
+        criterio_parada,
+        inicio_tempo,
+    )
+
+
+def busca_tabu(
+    pedidos_coords: List[Tuple[float, float]],
+    deposito_coords: Tuple[float, float],
+    num_geracoes: int = 500,
+    distancia_fn: Optional[Callable[[int, int], float]] = None,
+    deposito_idx: Optional[int] = None,
+    random_seed: Optional[int] = None,
+    rotas_iniciais: Optional[List[List[int]]] = None,
+    tenure: Optional[int] = None,
+    cancelamento: Optional[TokenCancelamento] = None,
+) -> dict:
+    """
+    Busca tabu sobre a vizinhanca 2-opt restrita as listas candidatas.
+
+    A cada iteracao aplica o melhor movimento admissivel, mesmo que piore a rota.
+    As arestas removidas ficam proibidas de voltar por `tenure` iteracoes, salvo se
+    o movimento produzir uma rota melhor que a melhor conhecida (aspiracao).
+    """
+    inicio_tempo = time.time()
+    rng = random.Random(random_seed if random_seed is not None else random.random())
+    n = len(pedidos_coords)
+    if n < 3:
+        return _resultado_trivial(pedidos_coords, deposito_coords, inicio_tempo)
+
+    dist, idx_deposito, simetrica = _preparar_metrica(pedidos_coords, deposito_coords, distancia_fn, deposito_idx)
+    indice = IndiceEspacial(pedidos_coords)
+    candidatos = indice.listas_candidatas(LISTA_CANDIDATOS_K)
+    # Os candidatos do deposito sao os pedidos mais proximos do ponto do deposito.
+    candidatos_deposito = indice.k_mais_proximos_do_ponto(*deposito_coords, LISTA_CANDIDATOS_K)
+
+    tour = [idx_deposito] + _rota_inicial(pedidos_coords, deposito_coords, rotas_iniciais)
+    m = len(tour)
+    pos = {no: i for i, no in enumerate(tour)}
+    custo = avaliar_rota(tour[1:], pedidos_coords, deposito_coords, dist, idx_deposito)
+    melhor_tour, melhor_custo = tour.copy(), custo
+
+    tenure = tenure or max(7, n // 10)
+    tabu: Dict[Tuple[int, int], int] = {}
+
+    def _aresta(x: int, y: int) -> Tuple[int, int]:
+        return (x, y) if x < y else (y, x)
+
+    historico_melhor = [melhor_custo]
+    historico_media = []
+    num_geracoes = max(1, int(num_geracoes))
+    iteracoes_sem_melhora = 0
+    max_sem_melhora = max(50, num_geracoes // 2)
+    criterio_parada = "geracoes"
+
+    for iteracao in range(num_geracoes):
+        melhor_movimento = None
+        melhor_delta = float("inf")
+        for i in range(m):
+            a = tour[i]
+            for c in candidatos_deposito if a == idx_deposito else candidatos[a]:
+                j = pos[c]
+                x, y = (i, j) if i < j else (j, i)
+                if y - x < 2 or (x == 0 and y == m - 1):
+                    continue
+                delta = _delta_2opt(tour, x, y, dist, simetrica)
+                if delta >= melhor_delta:
+                    continue
+                novas = (_aresta(tour[x], tour[y]), _aresta(tour[x + 1], tour[(y + 1) % m]))
+                proibido = any(tabu.get(aresta, -1) > iteracao for aresta in novas)
+                if proibido and custo + delta >= melhor_custo - EPSILON_MELHORA:
+                    continue
+                melhor_delta, melhor_movimento = delta, (x, y)
+
+        if melhor_movimento is None:
+            criterio_parada = "sem_movimentos"
+            break
+
+        x, y = melhor_movimento
+        # Leve variacao no tenure evita ciclos de periodo fixo.
+        expira = iteracao + tenure + rng.randint(0, 2)
+        tabu[_aresta(tour[x], tour[x + 1])] = expira
+        tabu[_aresta(tour[y], tour[(y + 1) % m])] = expira
+        tour[x + 1 : y + 1] = tour[x + 1 : y + 1][::-1]
+        for k in range(x + 1, y + 1):
+            pos[tour[k]] = k
+        custo += melhor_delta
+
+        if custo < melhor_custo - EPSILON_MELHORA:
+            melhor_custo = custo
+            melhor_tour = tour.copy()
+            iteracoes_sem_melhora = 0
+        else:
+            iteracoes_sem_melhora += 1
+        historico_melhor.append(melhor_custo)
+        historico_media.append(custo)
+
+        if iteracoes_sem_melhora > max_sem_melhora:
+            criterio_parada = "estagnacao"
+            break
+        if deve_cancelar(cancelamento, iteracao):
+            criterio_parada = "cancelado"
+            break
+
+    return _montar_resultado(
+        melhor_tour,
+        pedidos_coords,
+        deposito_coords,
+        distancia_fn,
+        deposito_idx,
+        historico_melhor,
+        historico_media,
+        iteracao + 1,
+        criterio_parada,
+        inicio_tempo,
+    )
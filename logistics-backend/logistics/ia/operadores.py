@@ -0,0 +1,115 @@
+import random
+from typing import Callable, Dict, List, Optional, Sequence
+
+OPERADORES_PADRAO = ("troca", "inversao", "ox", "2opt")
+LIMITE_DIVERSIDADE = 0.5  # abaixo desta fracao de individuos distintos a pressao de mutacao sobe
+
+
+class SeletorOperadores:
+    """
+    Selecao adaptativa de operadores por perseguicao adaptativa (adaptive pursuit).
+
+    Cada operador tem uma qualidade estimada (media movel da melhora relativa que
+    seus filhos obtiveram sobre o pai) e uma probabilidade de ser sorteado. A cada
+    geracao a probabilidade do melhor operador se aproxima de `p_max` e a dos demais
+    de `p_min`, de modo que nenhum operador deixa de ser experimentado.
+    """
+
+    def __init__(
+        self,
+        operadores: Sequence[str] = OPERADORES_PADRAO,
+        p_min: float = 0.05,
+        alfa: float = 0.3,
+        beta: float = 0.3,
+    ):
+        self.operadores = list(operadores)
+        k = len(self.operadores)
+        self.p_min = min(p_min, 1.0 / k)
+        self.p_max = 1.0 - (k - 1) * self.p_min
+        self.alfa = alfa
+        self.beta = beta
+        self.probabilidades: Dict[str, float] = {op: 1.0 / k for op in self.operadores}
+        self.qualidades: Dict[str, float] = {op: 0.0 for op in self.operadores}
+        self.usos: Dict[str, int] = {op: 0 for op in self.operadores}
+        self.sucessos: Dict[str, int] = {op: 0 for op in self.operadores}
+        self._soma_geracao: Dict[str, float] = {op: 0.0 for op in self.operadores}
+        self._contagem_geracao: Dict[str, int] = {op: 0 for op in self.operadores}
+
+    def sortear(self, rng: Optional[random.Random] = None) -> str:
+        rng = rng or random
+        return rng.choices(self.operadores, weights=[self.probabilidades[op] for op in self.operadores])[0]
+
+    def registrar(self, operador: str, fitness_pai: float, fitness_filho: float) -> None:
+        """Credita ao operador a melhora relativa do filho sobre o pai (zero se piorou)."""
+        recompensa = max(0.0, (fitness_pai - fitness_filho) / fitness_pai) if fitness_pai else 0.0
+        self.usos[operador] += 1
+        if recompensa > 0:
+            self.sucessos[operador] += 1
+        self._soma_geracao[operador] += recompensa
+        self._contagem_geracao[operador] += 1
+
+    def atualizar(self) -> None:
+        """Fecha a geracao: atualiza qualidades com as recompensas medias e reequilibra as probabilidades."""
+        for op in self.operadores:
+            if self._contagem_geracao[op]:
+                media = self._soma_geracao[op] / self._contagem_geracao[op]
+                self.qualidades[op] += self.alfa * (media - self.qualidades[op])
+            self._soma_geracao[op] = 0.0
+            self._contagem_geracao[op] = 0
+
+        melhor = max(self.operadores, key=self.qualidades.__getitem__)
+        for op in self.operadores:
+            alvo = self.p_max if op == melhor else self.p_min
+            self.probabilidades[op] += self.beta * (alvo - self.probabilidades[op])
+
+    def estatisticas(self) -> Dict[str, Dict[str, float]]:
+        return {
+            op: {
+                "probabilidade": round(self.probabilidades[op], 4),
+                "qualidade": round(self.qualidades[op], 6),
+                "usos": self.usos[op],
+                "sucessos": self.sucessos[op],
+            }
+            for op in self.operadores
+        }
+
+
+def pressao_mutacao(taxa_base: float, diversidade: float) -> float:
+    """
+    Taxa de mutacao extra conforme a diversidade (fracao de individuos distintos):
+    igual a `taxa_base` com populacao diversa, subindo linearmente ate 1.0 quando colapsa.
+    """
+    colapso = max(0.0, (LIMITE_DIVERSIDADE - diversidade) / LIMITE_DIVERSIDADE)
+    return taxa_base + (1.0 - taxa_base) * colapso
+
+
+def movimento_2opt(
+    rota: List[int],
+    distancia_fn: Callable[[int, int], float],
+    deposito_idx: int,
+    rng: Optional[random.Random] = None,
+) -> List[int]:
+    """
+    Movimento de busca local usado como operador: sorteia uma aresta da rota (incluindo
+    as do deposito) e aplica a melhor troca 2-opt que a envolve, se houver ganho (in-place).
+    """
+    rng = rng or random
+    n = len(rota)
+    if n < 3:
+        return rota
+    dist = distancia_fn
+    tour = [deposito_idx] + rota
+    i = rng.randrange(n)
+    a, b = tour[i], tour[i + 1]
+    d_ab = dist(a, b)
+    melhor_delta, melhor_j = -1e-9, None
+    for j in range(i + 2, n + 1):
+        c = tour[j]
+        d = tour[(j + 1) % (n + 1)]
+        delta = dist(a, c) + dist(b, d) - d_ab - dist(c, d)
+        if delta < melhor_delta:
+            melhor_delta, melhor_j = delta, j
+    if melhor_j is not None:
+        # Inverte tour[i+1..j]; em `rota` (sem o deposito) isso e rota[i..j-1].
+        rota[i:melhor_j] = rota[i:melhor_j][::-1]
+    return rota
@@ -0,0 +1,80 @@
+import json
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+ENV_CAMINHO = "LOGISTICS_PARAMETROS_PATH"
+# Unicos parametros que a tabela pode trocar; o resto continua vindo dos defaults fixos.
+PARAMETROS_AJUSTAVEIS = {
+    "tamanho_pop": int,
+    "num_geracoes": int,
+    "taxa_crossover": float,
+    "taxa_mutacao": float,
+    "elitismo": int,
+    "operadores_adaptativos": bool,
+}
+
+_tabelas_carregadas: Dict[str, Tuple[float, List[dict]]] = {}
+
+
+def gravar_tabela(caminho: str, faixas: List[dict], metadados: Optional[Dict[str, Any]] = None) -> None:
+    """
+    Grava a tabela de parametros por faixa de tamanho. Cada faixa e
+    {"ate": limite de paradas (None na ultima), "parametros": {...}}, em ordem crescente.
+    A escrita passa por um arquivo temporario para que leitores nunca vejam JSON parcial.
+    """
+    conteudo = {**(metadados or {}), "faixas": faixas}
+    temporario = f"{caminho}.tmp"
+    with open(temporario, "w", encoding="utf-8") as arq:
+        json.dump(conteudo, arq, indent=2, ensure_ascii=False)
+    os.replace(temporario, caminho)
+
+
+def _normalizar_faixas(faixas: List[dict]) -> List[dict]:
+    normalizadas = []
+    for faixa in faixas:
+        parametros = {}
+        for nome, valor in (faixa.get("parametros") or {}).items():
+            tipo = PARAMETROS_AJUSTAVEIS.get(nome)
+            if tipo is None:
+                continue
+            try:
+                parametros[nome] = tipo(valor)
+            except (TypeError, ValueError):
+                continue
+        limite = faixa.get("ate")
+        normalizadas.append({"ate": int(limite) if limite is not None else None, "parametros": parametros})
+    # Faixa aberta (ate=None) sempre por ultimo.
+    return sorted(normalizadas, key=lambda f: (f["ate"] is None, f["ate"] or 0))
+
+
+def carregar_tabela(caminho: Optional[str] = None) -> List[dict]:
+    """
+    Faixas da tabela em `caminho` (ou LOGISTICS_PARAMETROS_PATH), relidas apenas quando o
+    arquivo muda. Arquivo ausente ou invalido equivale a tabela vazia.
+    """
+    caminho = caminho or os.getenv(ENV_CAMINHO)
+    if not caminho:
+        return []
+    try:
+        versao = os.path.getmtime(caminho)
+    except OSError:
+        return []
+
+    carregada = _tabelas_carregadas.get(caminho)
+    if carregada is not None and carregada[0] == versao:
+        return carregada[1]
+    try:
+        with open(caminho, encoding="utf-8") as arq:
+            faixas = _normalizar_faixas(json.load(arq).get("faixas") or [])
+    except (OSError, ValueError, AttributeError, TypeError):
+        return []
+    _tabelas_carregadas[caminho] = (versao, faixas)
+    return faixas
+
+
+def parametros_para_tamanho(num_pedidos: int, caminho: Optional[str] = None) -> Dict[str, Any]:
+    """Parametros ajustados da primeira faixa que comporta `num_pedidos` ({} sem tabela)."""
+    for faixa in carregar_tabela(caminho):
+        if faixa["ate"] is None or num_pedidos <= faixa["ate"]:
+            return dict(faixa["parametros"])
+    return {}
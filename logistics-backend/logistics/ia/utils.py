@@ -0,0 +1,35 @@
+import math
+from typing import Callable, List, Tuple
+
+
+def calcular_distancia(coord1: Tuple[float, float], coord2: Tuple[float, float]) -> float:
+    # Distancia Haversine em quilometros entre dois pontos (lat, lon).
+    lat1, lon1 = coord1
+    lat2, lon2 = coord2
+
+    lat1_rad = math.radians(lat1)
+    lon1_rad = math.radians(lon1)
+    lat2_rad = math.radians(lat2)
+    lon2_rad = math.radians(lon2)
+
+    dlat = lat2_rad - lat1_rad
+    dlon = lon2_rad - lon1_rad
+
+    a = math.sin(dlat / 2) ** 2 + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(dlon / 2) ** 2
+    c = 2 * math.asin(math.sqrt(a))
+
+    raio_terra = 6371
+    return raio_terra * c
+
+
+def criar_distancia_fn_coordenadas(
+    coordenadas: List[Tuple[float, float]],
+    deposito: Tuple[float, float],
+) -> Callable[[int, int], float]:
+    """Funcao de distancia Haversine por indice; o indice len(coordenadas) e o deposito."""
+    pontos = list(coordenadas) + [deposito]
+
+    def _dist(a: int, b: int) -> float:
+        return calcular_distancia(pontos[a], pontos[b])
+
+    return _dist
@@ -0,0 +1,117 @@
+import os
+import random
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from logistics.constants import DEFAULT_DEPOSITO
+from logistics.ia.autoajuste import GRADE_PADRAO, ajustar_parametros, gerar_configuracoes, limites_faixas
+from logistics.ia.parametros_ajustados import ENV_CAMINHO, gravar_tabela
+from logistics.models import Pedido
+
+from .benchmark_otimizacao import gerar_instancia_sintetica
+
+
+class Command(BaseCommand):
+    help = (
+        "Ajusta os parametros do GA por faixa de tamanho (grade ou successive halving, em paralelo) "
+        "e grava a tabela consultada por _preparar_parametros."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--tamanhos", nargs="+", type=int, default=[25, 100, 500])
+        parser.add_argument("--instancias", type=int, default=9, help="Instancias por tamanho.")
+        parser.add_argument(
+            "--origem",
+            default="sintetica",
+            choices=["sintetica", "banco"],
+            help="Instancias sinteticas ou amostras dos pedidos gravados.",
+        )
+        parser.add_argument("--estrategia", default="halving", choices=["halving", "grade"])
+        parser.add_argument(
+            "--orcamento-s",
+            type=float,
+            default=None,
+            help="Tempo medio maximo por execucao; configuracoes mais lentas so vencem se nenhuma couber.",
+        )
+        parser.add_argument("--processos", type=int, default=None)
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument(
+            "--saida",
+            default=os.getenv(ENV_CAMINHO) or "parametros_ajustados.json",
+            help=f"Arquivo da tabela (o otimizador le o caminho de {ENV_CAMINHO}).",
+        )
+        parser.add_argument("--populacoes", nargs="+", type=int, default=GRADE_PADRAO["tamanho_pop"])
+        parser.add_argument("--geracoes", nargs="+", type=int, default=GRADE_PADRAO["num_geracoes"])
+        parser.add_argument("--crossovers", nargs="+", type=float, default=GRADE_PADRAO["taxa_crossover"])
+        parser.add_argument("--mutacoes", nargs="+", type=float, default=GRADE_PADRAO["taxa_mutacao"])
+
+    def handle(self, *args, **options):
+        configuracoes = gerar_configuracoes(
+            {
+                "tamanho_pop": options["populacoes"],
+                "num_geracoes": options["geracoes"],
+                "taxa_crossover": options["crossovers"],
+                "taxa_mutacao": options["mutacoes"],
+            }
+        )
+        deposito_coords = (DEFAULT_DEPOSITO["latitude"], DEFAULT_DEPOSITO["longitude"])
+        tamanhos = sorted(set(options["tamanhos"]))
+
+        faixas = []
+        for tamanho, limite in zip(tamanhos, limites_faixas(tamanhos)):
+            instancias = self._instancias(tamanho, options, deposito_coords)
+            if not instancias:
+                self.stderr.write(f"n={tamanho}: pedidos insuficientes no banco, faixa ignorada")
+                continue
+            self.stdout.write(
+                f"n={tamanho}: {len(configuracoes)} configuracoes, {len(instancias)} instancias ({options['estrategia']})"
+            )
+            melhor = ajustar_parametros(
+                instancias,
+                configuracoes,
+                estrategia=options["estrategia"],
+                orcamento_s=options["orcamento_s"],
+                processos=options["processos"],
+                seed=options["seed"],
+                progresso=lambda mensagem: self.stdout.write(f"  {mensagem}"),
+            )
+            if not melhor["dentro_orcamento"]:
+                self.stderr.write(f"n={tamanho}: nenhuma configuracao coube no orcamento; usando a mais barata em custo")
+            self.stdout.write(
+                f"  melhor={melhor['parametros']} custo_relativo={melhor['custo_relativo']} "
+                f"tempo_medio={melhor['tempo_medio_s']}s avaliacoes={melhor['avaliacoes']}"
+            )
+            faixas.append({"ate": limite, "tamanho_referencia": tamanho, **melhor})
+
+        if not faixas:
+            raise CommandError("Nenhuma faixa ajustada; a tabela nao foi gravada.")
+        # A faixa aberta precisa existir mesmo que o maior tamanho tenha sido ignorado.
+        faixas[-1]["ate"] = None
+        gravar_tabela(
+            options["saida"],
+            faixas,
+            {
+                "gerado_em": datetime.now().isoformat(timespec="seconds"),
+                "estrategia": options["estrategia"],
+                "origem": options["origem"],
+                "orcamento_s": options["orcamento_s"],
+            },
+        )
+        self.stdout.write(self.style.SUCCESS(f"Tabela com {len(faixas)} faixas gravada em {options['saida']}"))
+
+    def _instancias(self, tamanho, options, deposito_coords):
+        if options["origem"] == "sintetica":
+            return [
+                ([(p["latitude"], p["longitude"]) for p in gerar_instancia_sintetica(tamanho, options["seed"] + i)], deposito_coords)
+                for i in range(options["instancias"])
+            ]
+
+        # Amostras dos locais de entrega reais (sem repetir coordenadas, como no agrupamento do otimizador).
+        locais = sorted(
+            {(float(lat), float(lon)) for lat, lon in Pedido.objects.values_list("latitude", "longitude")}
+        )
+        if len(locais) < tamanho:
+            return []
+        rng = random.Random(options["seed"])
+        return [(rng.sample(locais, tamanho), deposito_coords) for _ in range(options["instancias"])]
@@ -0,0 +1,123 @@
+import random
+import resource
+import time
+
+from django.core.management.base import BaseCommand
+
+from logistics.constants import DEFAULT_DEPOSITO
+from logistics.ia.genetic_algorithm import ALGORITMOS, algoritmo_genetico, avaliar_rota, otimizar_rota_pedidos
+from logistics.ia.heuristicas import construir_vizinho_mais_proximo
+
+
+def gerar_instancia_sintetica(tamanho: int, seed: int, raio_graus: float = 1.5) -> list:
+    """Pedidos ficticios espalhados ao redor do deposito padrao (sem tocar no banco)."""
+    rng = random.Random(seed)
+    return [
+        {
+            "id": idx + 1,
+            "latitude": DEFAULT_DEPOSITO["latitude"] + rng.uniform(-raio_graus, raio_graus),
+            "longitude": DEFAULT_DEPOSITO["longitude"] + rng.uniform(-raio_graus, raio_graus),
+        }
+        for idx in range(tamanho)
+    ]
+
+
+def geracoes_ate_alvo(historico_melhor: list, alvo: float):
+    """Primeira geracao (1-based) cujo melhor custo chegou ao alvo; None se nunca chegou."""
+    for geracao, custo in enumerate(historico_melhor, 1):
+        if round(custo, 2) <= alvo:
+            return geracao
+    return None
+
+
+class Command(BaseCommand):
+    help = "Executa o otimizador em instancias sinteticas e mostra tempo, distancia e pico de memoria (RSS)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--tamanhos", nargs="+", type=int, default=[1000, 5000, 10000])
+        parser.add_argument("--modo", default="decomposicao", choices=["padrao", "decomposicao"])
+        parser.add_argument("--geracoes", type=int, default=100)
+        parser.add_argument("--populacao", type=int, default=50)
+        parser.add_argument("--tamanho-cluster", type=int, default=100)
+        parser.add_argument("--processos", type=int, default=None)
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument(
+            "--algoritmos",
+            nargs="+",
+            default=["genetico"],
+            choices=list(ALGORITMOS),
+            help="Motores a comparar na mesma instancia e seed (no modo padrao).",
+        )
+        parser.add_argument(
+            "--comparar-operadores",
+            action="store_true",
+            help="Compara o GA com operadores fixos e adaptativos (geracoes ate o custo final do GA fixo).",
+        )
+
+    def handle(self, *args, **options):
+        if options["comparar_operadores"]:
+            return self._comparar_operadores(options)
+
+        deposito = {"latitude": DEFAULT_DEPOSITO["latitude"], "longitude": DEFAULT_DEPOSITO["longitude"]}
+        deposito_coords = (deposito["latitude"], deposito["longitude"])
+
+        for tamanho in options["tamanhos"]:
+            pedidos = gerar_instancia_sintetica(tamanho, options["seed"])
+            coords = [(p["latitude"], p["longitude"]) for p in pedidos]
+
+            inicio = time.time()
+            distancia_vmp = avaliar_rota(construir_vizinho_mais_proximo(coords, deposito_coords), coords, deposito_coords)
+            tempo_vmp = time.time() - inicio
+
+            for algoritmo in options["algoritmos"]:
+                parametros = {
+                    "modo": options["modo"],
+                    "algoritmo": algoritmo,
+                    "usar_osrm": False,
+                    "seed": options["seed"],
+                    "num_geracoes": options["geracoes"],
+                    "tamanho_pop": options["populacao"],
+                    "tamanho_cluster": options["tamanho_cluster"],
+                    "processos": options["processos"],
+                }
+                inicio = time.time()
+                resultado = otimizar_rota_pedidos(pedidos, deposito, parametros)
+                tempo = time.time() - inicio
+                # ru_maxrss e o pico de memoria residente do processo principal (KiB no Linux).
+                pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+                ganho = (distancia_vmp - resultado["distancia_total_km"]) / distancia_vmp * 100 if distancia_vmp else 0
+                self.stdout.write(
+                    f"n={tamanho:>6} modo={options['modo']} algoritmo={algoritmo} "
+                    f"clusters={resultado.get('num_clusters') or '-'} "
+                    f"tempo={tempo:.2f}s dist={resultado['distancia_total_km']:.1f}km "
+                    f"vizinho_mais_proximo={distancia_vmp:.1f}km ({tempo_vmp:.2f}s) ganho={ganho:.1f}% "
+                    f"pico_rss={pico / 1024:.0f}MiB"
+                )
+
+    def _comparar_operadores(self, options):
+        deposito_coords = (DEFAULT_DEPOSITO["latitude"], DEFAULT_DEPOSITO["longitude"])
+        for tamanho in options["tamanhos"]:
+            coords = [(p["latitude"], p["longitude"]) for p in gerar_instancia_sintetica(tamanho, options["seed"])]
+            resultados = {}
+            for adaptativo in (False, True):
+                inicio = time.time()
+                resultado = algoritmo_genetico(
+                    coords,
+                    deposito_coords,
+                    tamanho_pop=options["populacao"],
+                    num_geracoes=options["geracoes"],
+                    random_seed=options["seed"],
+                    calcular_limite_inferior=False,
+                    operadores_adaptativos=adaptativo,
+                )
+                resultados[adaptativo] = (resultado, time.time() - inicio)
+
+            alvo = resultados[False][0]["distancia_total_km"]
+            for adaptativo, (resultado, tempo) in resultados.items():
+                self.stdout.write(
+                    f"n={tamanho:>6} operadores={'adaptativos' if adaptativo else 'fixos':<11} "
+                    f"dist={resultado['distancia_total_km']:.1f}km tempo={tempo:.2f}s "
+                    f"geracoes={resultado['num_geracoes']} "
+                    f"geracoes_ate_{alvo:.1f}km={geracoes_ate_alvo(resultado['historico_melhor'], alvo) or '-'}"
+                )
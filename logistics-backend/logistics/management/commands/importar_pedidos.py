@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from logistics.services.importacao import FORMATOS, TAMANHO_LOTE_PADRAO, importar_pedidos, ler_registros
+
+
+class Command(BaseCommand):
+    help = (
+        "Importa pedidos de um arquivo CSV (uma linha por item) ou JSON Lines (um pedido por linha) "
+        "em lotes, dividindo automaticamente os pedidos com familias incompativeis."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("arquivo")
+        parser.add_argument("--formato", choices=FORMATOS, default=None, help="Padrao: pela extensao do arquivo.")
+        parser.add_argument("--lote", type=int, default=TAMANHO_LOTE_PADRAO, help="Pedidos por lote/transacao.")
+        parser.add_argument("--usuario-id", type=int, default=None)
+        parser.add_argument("--sem-divisao", action="store_true", help="Rejeita pedidos com familias incompativeis.")
+        parser.add_argument("--simular", action="store_true", help="Valida o arquivo sem gravar nada.")
+
+    def handle(self, *args, **options):
+        caminho = options["arquivo"]
+        formato = options["formato"] or caminho.rsplit(".", 1)[-1].lower()
+        if formato not in FORMATOS:
+            raise CommandError(f"Formato nao reconhecido pela extensao; informe --formato ({', '.join(FORMATOS)}).")
+
+        try:
+            with open(caminho, encoding="utf-8-sig", newline="") as arq:
+                resumo = importar_pedidos(
+                    ler_registros(arq, formato),
+                    tamanho_lote=options["lote"],
+                    usuario_id=options["usuario_id"],
+                    dividir_conflitos=not options["sem_divisao"],
+                    simular=options["simular"],
+                )
+        except OSError as exc:
+            raise CommandError(f"Nao foi possivel ler {caminho}: {exc}")
+        except UnicodeDecodeError as exc:
+            raise CommandError(f"{caminho} nao esta em UTF-8: {exc}")
+
+        for erro in resumo["erros"]:
+            self.stderr.write(f"linha {erro['linha']} (NF {erro['nf']}): [{erro['codigo']}] {erro['mensagem']}")
+        if resumo["total_erros"] > len(resumo["erros"]):
+            self.stderr.write(f"... mais {resumo['total_erros'] - len(resumo['erros'])} erros")
+        prefixo = "Simulacao: " if resumo["simulado"] else ""
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{prefixo}{resumo['pedidos_importados']} de {resumo['pedidos_lidos']} pedidos importados "
+                f"({resumo['pedidos_criados']} gravados, {resumo['pedidos_divididos']} divididos, "
+                f"{resumo['itens_criados']} itens); {resumo['total_erros']} erros"
+            )
+        )
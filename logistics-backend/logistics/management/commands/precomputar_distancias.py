@@ -0,0 +1,109 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from logistics.constants import DEFAULT_DEPOSITO
+from logistics.ia.armazem_distancias import ENV_CAMINHO, ArmazemDistancias
+from logistics.ia.utils import calcular_distancia
+from logistics.models import Pedido
+
+try:
+    import requests
+except ImportError:
+    requests = None
+
+
+def tabela_haversine(origens, destinos):
+    """Substituto local do OSRM (linha reta), util para testes e ambientes sem servidor."""
+    return [[calcular_distancia(o, d) for d in destinos] for o in origens]
+
+
+def criar_tabela_osrm(base_url: str, timeout: int, tentativas: int):
+    """Tabela origens x destinos (km) via OSRM /table com `sources` e `destinations`."""
+
+    def _tabela(origens, destinos):
+        coords = origens + destinos
+        coords_str = ";".join(f"{lon},{lat}" for lat, lon in coords)
+        fontes = ";".join(str(i) for i in range(len(origens)))
+        alvos = ";".join(str(i) for i in range(len(origens), len(coords)))
+        url = (
+            f"{base_url.rstrip('/')}/table/v1/driving/{coords_str}"
+            f"?annotations=distance&sources={fontes}&destinations={alvos}"
+        )
+        for tentativa in range(1, max(1, tentativas) + 1):
+            try:
+                resp = requests.get(url, timeout=timeout)
+                resp.raise_for_status()
+                distancias = resp.json().get("distances")
+                if distancias:
+                    return [[round(val / 1000, 3) for val in linha] for linha in distancias]
+            except Exception as exc:  # noqa: BLE001
+                if tentativa >= tentativas:
+                    raise CommandError(f"OSRM falhou: {exc}")
+                time.sleep(min(2 * tentativa, 5))
+        raise CommandError("OSRM nao retornou distancias.")
+
+    return _tabela
+
+
+class Command(BaseCommand):
+    help = (
+        "Pre-calcula a matriz de distancias de todos os locais distintos de Pedido (mais depositos) "
+        "num arquivo mapeado em memoria. Execucoes seguintes so acrescentam os locais novos."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--caminho", default=os.getenv(ENV_CAMINHO), help=f"Arquivo da matriz (padrao: ${ENV_CAMINHO}).")
+        parser.add_argument(
+            "--deposito",
+            nargs=2,
+            type=float,
+            action="append",
+            metavar=("LAT", "LON"),
+            help="Deposito adicional (o deposito padrao sempre entra).",
+        )
+        parser.add_argument("--haversine", action="store_true", help="Usa distancia em linha reta em vez do OSRM.")
+        parser.add_argument("--osrm-url", default=os.getenv("LOGISTICS_OSRM_URL", "http://localhost:5000"))
+        parser.add_argument("--osrm-timeout", type=int, default=30)
+        parser.add_argument("--osrm-tentativas", type=int, default=3)
+        parser.add_argument("--bloco", type=int, default=100, help="Locais por requisicao /table (origens e destinos).")
+        parser.add_argument("--capacidade", type=int, default=1024, help="Capacidade inicial ao criar o arquivo.")
+        parser.add_argument("--recriar", action="store_true", help="Descarta o arquivo existente.")
+
+    def handle(self, *args, **options):
+        caminho = options["caminho"]
+        if not caminho:
+            raise CommandError(f"Informe --caminho ou defina {ENV_CAMINHO}.")
+
+        metrica = "haversine" if options["haversine"] else "osrm"
+        if metrica == "osrm":
+            if requests is None:
+                raise CommandError("Biblioteca requests indisponivel; use --haversine.")
+            tabela_fn = criar_tabela_osrm(options["osrm_url"], options["osrm_timeout"], options["osrm_tentativas"])
+        else:
+            tabela_fn = tabela_haversine
+
+        if options["recriar"] or not os.path.exists(f"{caminho}.json"):
+            armazem = ArmazemDistancias.criar(caminho, capacidade=options["capacidade"], metrica=metrica)
+        else:
+            armazem = ArmazemDistancias(caminho, somente_leitura=False)
+            if armazem.metrica != metrica:
+                raise CommandError(
+                    f"Arquivo existente usa a metrica '{armazem.metrica}'; use --recriar para trocar para '{metrica}'."
+                )
+
+        depositos = [(DEFAULT_DEPOSITO["latitude"], DEFAULT_DEPOSITO["longitude"])]
+        depositos += [tuple(par) for par in options["deposito"] or []]
+        locais = depositos + [
+            (float(lat), float(lon)) for lat, lon in Pedido.objects.values_list("latitude", "longitude").distinct()
+        ]
+
+        inicio = time.time()
+        antes = len(armazem)
+        adicionados = armazem.adicionar(locais, tabela_fn, bloco=options["bloco"])
+        armazem.fechar()
+        self.stdout.write(
+            f"locais={antes + adicionados} novos={adicionados} metrica={metrica} "
+            f"capacidade={armazem.capacidade} tempo={time.time() - inicio:.2f}s arquivo={caminho}"
+        )
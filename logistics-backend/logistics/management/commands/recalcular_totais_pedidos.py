@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand
+
+from logistics.models import Pedido
+from logistics.services.totais import (
+    pedidos_com_totais_divergentes,
+    recalcular_estatisticas_rotas,
+    recalcular_totais,
+    rotas_com_estatisticas_divergentes,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcula peso_total, volume_total e total_itens dos pedidos a partir dos itens e as "
+        "estatisticas das rotas (preenchimento inicial ou reparo apos escritas fora da API)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--verificar", action="store_true", help="So lista os pedidos divergentes, sem gravar.")
+        parser.add_argument("--todos", action="store_true", help="Regrava todos os pedidos, nao so os divergentes.")
+        parser.add_argument("--lote", type=int, default=1000, help="Pedidos (ou rotas) por UPDATE.")
+
+    def handle(self, *args, **options):
+        if options["todos"]:
+            ids = list(Pedido.objects.order_by("id").values_list("id", flat=True))
+        else:
+            ids = list(pedidos_com_totais_divergentes().order_by("id").values_list("id", flat=True))
+
+        if options["verificar"]:
+            for pedido_id in ids[:50]:
+                self.stdout.write(f"pedido {pedido_id}: totais divergentes")
+            if len(ids) > 50:
+                self.stdout.write(f"... mais {len(ids) - 50}")
+            rotas = rotas_com_estatisticas_divergentes().count()
+            self.stdout.write(self.style.SUCCESS(f"{len(ids)} pedidos e {rotas} rotas com totais divergentes"))
+            return
+
+        lote = max(1, options["lote"])
+        atualizados = 0
+        for inicio in range(0, len(ids), lote):
+            # Tambem regrava a carga das rotas desses pedidos.
+            atualizados += recalcular_totais(pedido_ids=ids[inicio : inicio + lote])
+        if options["todos"]:
+            rotas = recalcular_estatisticas_rotas()
+        else:
+            # Ids lidos antes: o MySQL recusa UPDATE da rota com subconsulta na propria tabela (erro 1093).
+            rota_ids = list(rotas_com_estatisticas_divergentes().order_by("id").values_list("id", flat=True))
+            rotas = 0
+            for inicio in range(0, len(rota_ids), lote):
+                rotas += recalcular_estatisticas_rotas(rota_ids=rota_ids[inicio : inicio + lote])
+        self.stdout.write(self.style.SUCCESS(f"{atualizados} pedidos e {rotas} rotas recalculados"))
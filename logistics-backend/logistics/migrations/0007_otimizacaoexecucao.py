@@ -0,0 +1,43 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logistics', '0006_pedidorestricaogrupo_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OtimizacaoExecucao',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('num_pedidos', models.PositiveIntegerField()),
+                ('num_paradas', models.PositiveIntegerField()),
+                ('algoritmo', models.CharField(default='genetico', max_length=30)),
+                ('modo', models.CharField(default='padrao', max_length=20)),
+                ('metrica', models.CharField(default='haversine', max_length=20)),
+                ('seed', models.BigIntegerField(blank=True, null=True)),
+                ('parametros', models.JSONField(default=dict)),
+                ('tempos_fases', models.JSONField(default=dict)),
+                ('tempo_total_s', models.FloatField()),
+                ('num_geracoes', models.PositiveIntegerField(default=0)),
+                ('criterio_parada', models.CharField(blank=True, max_length=30)),
+                ('cache_hits', models.PositiveIntegerField(blank=True, null=True)),
+                ('cache_misses', models.PositiveIntegerField(blank=True, null=True)),
+                ('distancia_km', models.FloatField()),
+                ('gap_percentual', models.FloatField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('usuario', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='otimizacoes_execucoes', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Execucao de Otimizacao',
+                'verbose_name_plural': 'Execucoes de Otimizacao',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['num_paradas', 'created_at'], name='idx_otimizacao_paradas_data')],
+            },
+        ),
+    ]
@@ -0,0 +1,47 @@
+from django.db import migrations, models
+from django.db.models import DecimalField, F, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def preencher_totais(apps, schema_editor):
+    # Mesmo calculo de logistics.services.totais, com os modelos historicos: um UPDATE so.
+    Pedido = apps.get_model("logistics", "Pedido")
+    ProdutoPedido = apps.get_model("logistics", "ProdutoPedido")
+    itens = ProdutoPedido.objects.filter(pedido=OuterRef("pk")).order_by().values("pedido")
+    decimal = DecimalField(max_digits=14, decimal_places=3)
+
+    def _total(expressao, output_field):
+        soma = Subquery(itens.annotate(total=Sum(expressao, output_field=output_field)).values("total")[:1])
+        return Coalesce(soma, Value(0, output_field=output_field), output_field=output_field)
+
+    Pedido.objects.update(
+        peso_total=_total(F("quantidade") * F("produto__peso"), decimal),
+        volume_total=_total(F("quantidade") * F("produto__volume"), decimal),
+        total_itens=_total(F("quantidade"), IntegerField()),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logistics', '0007_otimizacaoexecucao'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pedido',
+            name='peso_total',
+            field=models.DecimalField(db_index=True, decimal_places=3, default=0, max_digits=14),
+        ),
+        migrations.AddField(
+            model_name='pedido',
+            name='volume_total',
+            field=models.DecimalField(decimal_places=3, default=0, max_digits=14),
+        ),
+        migrations.AddField(
+            model_name='pedido',
+            name='total_itens',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(preencher_totais, migrations.RunPython.noop),
+    ]
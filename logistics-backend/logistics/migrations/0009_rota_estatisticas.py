@@ -0,0 +1,62 @@
+from django.db import migrations, models
+from django.db.models import DecimalField, F, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def preencher_estatisticas(apps, schema_editor):
+    # Mesmo calculo de logistics.services.totais.expressoes_estatisticas_rota: um UPDATE so.
+    Rota = apps.get_model("logistics", "Rota")
+    RotaPedido = apps.get_model("logistics", "RotaPedido")
+    vinculos = RotaPedido.objects.filter(rota=OuterRef("pk"))
+
+    def _soma(linhas, expressao, output_field):
+        agrupadas = linhas.order_by().values("rota")
+        soma = Subquery(agrupadas.annotate(total=Sum(expressao, output_field=output_field)).values("total")[:1])
+        return Coalesce(soma, Value(0, output_field=output_field), output_field=output_field)
+
+    Rota.objects.update(
+        total_pedidos=_soma(vinculos, Value(1), IntegerField()),
+        pedidos_entregues=_soma(vinculos.filter(entregue=True), Value(1), IntegerField()),
+        peso_total_pedidos=_soma(vinculos, F("pedido__peso_total"), DecimalField(max_digits=14, decimal_places=3)),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logistics', '0008_pedido_totais'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='pedido',
+            name='peso_total',
+            field=models.DecimalField(db_index=True, decimal_places=3, default=0, editable=False, max_digits=14),
+        ),
+        migrations.AlterField(
+            model_name='pedido',
+            name='volume_total',
+            field=models.DecimalField(decimal_places=3, default=0, editable=False, max_digits=14),
+        ),
+        migrations.AlterField(
+            model_name='pedido',
+            name='total_itens',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='rota',
+            name='total_pedidos',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='rota',
+            name='pedidos_entregues',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='rota',
+            name='peso_total_pedidos',
+            field=models.DecimalField(decimal_places=3, default=0, editable=False, max_digits=14),
+        ),
+        migrations.RunPython(preencher_estatisticas, migrations.RunPython.noop),
+    ]
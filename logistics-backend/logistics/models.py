@@ -54,8 +54,14 @@ class Pedido(models.Model):
     dtpedido = models.DateField(verbose_name="Data do Pedido")
     latitude = models.DecimalField(max_digits=10, decimal_places=6)
     longitude = models.DecimalField(max_digits=10, decimal_places=6)
+    # Totais dos itens gravados junto com eles (ver logistics.services.totais); leitura sem JOIN.
+    peso_total = models.DecimalField(max_digits=14, decimal_places=3, default=0, db_index=True, editable=False)
+    volume_total = models.DecimalField(max_digits=14, decimal_places=3, default=0, editable=False)
+    total_itens = models.PositiveIntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    CAMPOS_DESNORMALIZADOS = ("peso_total", "volume_total", "total_itens")
+
     def __str__(self):
         return f"Pedido {self.id} - NF {self.nf}"
 
@@ -138,20 +144,24 @@ class Rota(models.Model):
         choices=STATUS_CHOICES,
         default="PLANEJADA",
     )
+    # Estatisticas dos RotaPedido, regravadas na mesma transacao que os altera
+    # (ver logistics.services.totais.recalcular_estatisticas_rotas).
+    total_pedidos = models.PositiveIntegerField(default=0, editable=False)
+    pedidos_entregues = models.PositiveIntegerField(default=0, editable=False)
+    peso_total_pedidos = models.DecimalField(max_digits=14, decimal_places=3, default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    CAMPOS_DESNORMALIZADOS = ("total_pedidos", "pedidos_entregues", "peso_total_pedidos")
+
     def __str__(self):
         return f"Rota {self.id} - {self.data_rota}"
 
     @property
-    def peso_total_pedidos(self):
-        """Calcula o peso total dos produtos nos pedidos da rota."""
-        peso_total = 0
-        for rota_pedido in self.pedidos.all():
-            for item in rota_pedido.pedido.itens.all():
-                peso_total += item.produto.peso * item.quantidade
-        return peso_total
+    def percentual_entrega(self):
+        if not self.total_pedidos:
+            return 0
+        return round((self.pedidos_entregues / self.total_pedidos) * 100, 1)
 
     class Meta:
         verbose_name = "Rota"
@@ -270,3 +280,43 @@ class RestricaoFamilia(models.Model):
             self.chave_bidirecional = f"{ids[0]}:{ids[1]}"
         self.full_clean()
         super().save(*args, **kwargs)
+
+
+class OtimizacaoExecucao(models.Model):
+    """
+    Registro de cada execucao do otimizador de rotas (auditoria e ajuste de parametros).
+    Gravado fora do ciclo da requisicao; ver logistics.services.execucoes.
+    """
+
+    usuario = models.ForeignKey(
+        User,
+        related_name="otimizacoes_execucoes",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+    )
+    num_pedidos = models.PositiveIntegerField()
+    num_paradas = models.PositiveIntegerField()
+    algoritmo = models.CharField(max_length=30, default="genetico")
+    modo = models.CharField(max_length=20, default="padrao")
+    metrica = models.CharField(max_length=20, default="haversine")
+    seed = models.BigIntegerField(null=True, blank=True)
+    parametros = models.JSONField(default=dict)
+    tempos_fases = models.JSONField(default=dict)
+    tempo_total_s = models.FloatField()
+    num_geracoes = models.PositiveIntegerField(default=0)
+    criterio_parada = models.CharField(max_length=30, blank=True)
+    cache_hits = models.PositiveIntegerField(null=True, blank=True)
+    cache_misses = models.PositiveIntegerField(null=True, blank=True)
+    distancia_km = models.FloatField()
+    gap_percentual = models.FloatField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Otimizacao {self.id} - {self.num_paradas} paradas ({self.algoritmo})"
+
+    class Meta:
+        verbose_name = "Execucao de Otimizacao"
+        verbose_name_plural = "Execucoes de Otimizacao"
+        ordering = ["-created_at"]
+        indexes = [models.Index(fields=["num_paradas", "created_at"], name="idx_otimizacao_paradas_data")]
@@ -1,7 +1,10 @@
 import logging
 import math
+import time
+import uuid
 
 from django.core.exceptions import ValidationError
+from django.db import transaction
 from django.http import HttpResponse
 from django.shortcuts import get_object_or_404
 from rest_framework import status
@@ -9,14 +12,28 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from .ia.genetic_algorithm import otimizar_rota_pedidos
+from .ia.genetic_algorithm import avaliar_rota, otimizar_rota_pedidos
+from .ia.heuristicas import busca_local, construir_vizinho_mais_proximo
+from .ia.indice_espacial import IndiceEspacial
+from .ia.utils import criar_distancia_fn_coordenadas
 from .constants import DEFAULT_DEPOSITO
-from .models import Pedido, PedidoRestricaoGrupo, Rota, RotaPedido
+from .models import Pedido, Rota, RotaPedido
 from .relatorios import gerar_relatorio_rota_pdf
-from .services.restricoes import normalizar_payload_pedidos, validar_novos_vinculos_em_rota
+from .services.cancelamento import (
+    encerrar_execucao,
+    execucao_id_valido,
+    iniciar_execucao,
+    solicitar_cancelamento,
+    token_para_execucao,
+)
+from .services.execucoes import estatisticas_execucoes, registrar_execucao
+from .services.restricoes import carregar_vinculos_em_lote, listar_conflitos_em_rota, normalizar_payload_pedidos
+from .services.totais import recalcular_estatisticas_rotas
 
 logger = logging.getLogger(__name__)
 
+LISTA_CANDIDATOS_K = 10
+
 
 def _coord_valida(lat_val, lng_val) -> bool:
     try:
@@ -35,8 +52,16 @@ class OtimizarRotaGeneticoView(APIView):
             pedidos_ids = request.data.get("pedidos_ids", [])
             deposito = request.data.get("deposito") or DEFAULT_DEPOSITO
             parametros = request.data.get("parametros", {})
+            # O cliente pode gerar o id para poder cancelar (DELETE) enquanto a otimizacao roda.
+            execucao_id = request.data.get("execucao_id") or uuid.uuid4().hex
             logger.info("[GA] requisicao: pedidos=%s deposito=%s params=%s", pedidos_ids, deposito, parametros)
 
+            if not execucao_id_valido(execucao_id):
+                return Response(
+                    {"error": "execucao_id deve ter ate 64 letras, numeros, '-' ou '_'"},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+
             if not pedidos_ids or len(pedidos_ids) < 2:
                 logger.warning("[GA] pedidos insuficientes para otimizar: %s", pedidos_ids)
                 return Response(
@@ -85,8 +110,19 @@ class OtimizarRotaGeneticoView(APIView):
                     status=status.HTTP_400_BAD_REQUEST,
                 )
 
-            logger.info("[GA] iniciando otimizacao: pedidos=%s deposito=%s", pedidos_ids, deposito_data)
-            resultado = otimizar_rota_pedidos(pedidos_data, deposito_data, parametros)
+            if not iniciar_execucao(execucao_id):
+                return Response(
+                    {"error": f"Ja existe uma otimizacao em andamento com o execucao_id {execucao_id}."},
+                    status=status.HTTP_409_CONFLICT,
+                )
+
+            logger.info("[GA] iniciando otimizacao %s: pedidos=%s deposito=%s", execucao_id, pedidos_ids, deposito_data)
+            try:
+                resultado = otimizar_rota_pedidos(
+                    pedidos_data, deposito_data, parametros, cancelamento=token_para_execucao(execucao_id)
+                )
+            finally:
+                encerrar_execucao(execucao_id)
             logger.info(
                 "[GA] concluido: dist_km=%s geracoes=%s ordem=%s params=%s",
                 resultado.get("distancia_total_km"),
@@ -94,11 +130,14 @@ class OtimizarRotaGeneticoView(APIView):
                 resultado.get("pedidos_ordem"),
                 resultado.get("parametros_utilizados"),
             )
+            registrar_execucao(resultado, len(pedidos_data), usuario_id=request.user.pk)
 
             return Response(
                 {
                     "status": "success",
-                    "algoritmo": "genetico",
+                    "execucao_id": execucao_id,
+                    "cancelado": resultado.get("criterio_parada") == "cancelado",
+                    "algoritmo": resultado["parametros_utilizados"].get("algoritmo", "genetico"),
                     "num_geracoes": resultado.get("num_geracoes"),
                     "distancia_total_km": resultado.get("distancia_total_km"),
                     "resultado": resultado,
@@ -115,6 +154,43 @@ class OtimizarRotaGeneticoView(APIView):
             )
 
 
+class CancelarOtimizacaoView(APIView):
+    """Pede o cancelamento de uma otimizacao em andamento; ela responde com a melhor rota ate o momento."""
+
+    permission_classes = [IsAuthenticated]
+
+    def delete(self, request, execucao_id):
+        if not execucao_id_valido(execucao_id):
+            return Response({"error": "execucao_id invalido"}, status=status.HTTP_400_BAD_REQUEST)
+        if not solicitar_cancelamento(execucao_id):
+            return Response(
+                {"error": "Nenhuma otimizacao em andamento com esse execucao_id"},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+        logger.info("[GA] cancelamento solicitado para a execucao %s", execucao_id)
+        return Response(
+            {"status": "cancelamento_solicitado", "execucao_id": execucao_id},
+            status=status.HTTP_202_ACCEPTED,
+        )
+
+
+class EstatisticasOtimizacaoView(APIView):
+    """Latencia (percentis) e qualidade das otimizacoes registradas, por faixa de tamanho."""
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        try:
+            dias = int(request.query_params.get("dias", 30))
+        except (TypeError, ValueError):
+            return Response({"error": "dias deve ser um inteiro"}, status=status.HTTP_400_BAD_REQUEST)
+        if dias < 1:
+            return Response({"error": "dias deve ser maior que zero"}, status=status.HTTP_400_BAD_REQUEST)
+
+        algoritmo = request.query_params.get("algoritmo") or None
+        return Response(estatisticas_execucoes(dias=dias, algoritmo=algoritmo), status=status.HTTP_200_OK)
+
+
 class SalvarRotaOtimizadaView(APIView):
     permission_classes = [IsAuthenticated]
 
@@ -144,56 +220,30 @@ class SalvarRotaOtimizadaView(APIView):
             except ValidationError as exc:
                 return Response({"error": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
 
-            pedidos_ids = [entry["pedido_id"] for entry in pedidos_normalizados]
-            pedidos_map = {p.id: p for p in Pedido.objects.filter(id__in=pedidos_ids)}
-            if len(set(pedidos_ids)) != len(pedidos_map):
+            vinculos, erros = carregar_vinculos_em_lote(pedidos_normalizados)
+            if any(erro["codigo"] == "pedido_nao_encontrado" for erro in erros):
                 return Response(
-                    {"error": "Alguns pedidos nao foram encontrados"},
+                    {"error": "Alguns pedidos nao foram encontrados", "erros": erros},
                     status=status.HTTP_404_NOT_FOUND,
                 )
-
-            vinculos = []
-            for entry in pedidos_normalizados:
-                pedido = pedidos_map[entry["pedido_id"]]
-                grupo = None
-                grupo_id = entry.get("grupo_restricao_id")
-                if grupo_id:
-                    try:
-                        grupo = PedidoRestricaoGrupo.objects.get(pk=grupo_id, pedido=pedido)
-                    except PedidoRestricaoGrupo.DoesNotExist:
-                        return Response(
-                            {"error": f"Grupo inválido informado para o pedido {pedido.id}."},
-                            status=status.HTTP_400_BAD_REQUEST,
-                        )
-                elif pedido.grupos_restricao.filter(ativo=True).exists():
-                    return Response(
-                        {"error": f"Pedido {pedido.id} está repartido. Informe o grupo correto para roteirizar."},
-                        status=status.HTTP_400_BAD_REQUEST,
-                    )
-                vinculos.append((pedido, grupo))
-
-            try:
-                validar_novos_vinculos_em_rota(vinculos)
-            except ValidationError as exc:
-                mensagem = ", ".join(exc.messages) if hasattr(exc, "messages") else str(exc)
+            erros.extend(listar_conflitos_em_rota(vinculos))
+            if erros:
                 return Response(
-                    {"error": mensagem},
+                    {"error": ", ".join(erro["mensagem"] for erro in erros), "erros": erros},
                     status=status.HTTP_400_BAD_REQUEST,
                 )
 
-            rota = Rota.objects.create(
-                data_rota=data_rota,
-                capacidade_max=capacidade_max,
-                status="PLANEJADA",
-            )
-
-            for ordem, (pedido, grupo) in enumerate(vinculos, 1):
-                RotaPedido.objects.create(
-                    rota=rota,
-                    pedido=pedido,
-                    grupo_restricao=grupo,
-                    ordem_entrega=ordem,
+            with transaction.atomic():
+                rota = Rota.objects.create(
+                    data_rota=data_rota,
+                    capacidade_max=capacidade_max,
+                    status="PLANEJADA",
+                )
+                RotaPedido.objects.bulk_create(
+                    RotaPedido(rota=rota, pedido=pedido, grupo_restricao=grupo, ordem_entrega=ordem)
+                    for ordem, (pedido, grupo) in enumerate(vinculos, 1)
                 )
+                recalcular_estatisticas_rotas(rota_ids=[rota.id])
 
             logger.info("[GA] rota salva id=%s pedidos=%s", rota.id, pedidos_payload)
 
@@ -242,37 +292,25 @@ class CompararAlgoritmosView(APIView):
 
             resultado_ga = otimizar_rota_pedidos(pedidos_data, deposito_data)
 
-            from .ia.genetic_algorithm import calcular_distancia
-
-            rota_greedy = []
-            visitados = set()
-            atual = deposito_data
-            distancia_greedy = 0
-
-            for _ in range(len(pedidos_data)):
-                melhor_dist = float("inf")
-                melhor_idx = None
-
-                for i, p in enumerate(pedidos_data):
-                    if i not in visitados:
-                        dist = calcular_distancia(
-                            (atual["latitude"], atual["longitude"]),
-                            (p["latitude"], p["longitude"]),
-                        )
-                        if dist < melhor_dist:
-                            melhor_dist = dist
-                            melhor_idx = i
-
-                if melhor_idx is not None:
-                    visitados.add(melhor_idx)
-                    rota_greedy.append(melhor_idx)
-                    distancia_greedy += melhor_dist
-                    atual = pedidos_data[melhor_idx]
-
-            distancia_greedy += calcular_distancia(
-                (atual["latitude"], atual["longitude"]),
-                (deposito_data["latitude"], deposito_data["longitude"]),
+            pedidos_coords = [(p["latitude"], p["longitude"]) for p in pedidos_data]
+            deposito_coords = (deposito_data["latitude"], deposito_data["longitude"])
+
+            inicio_greedy = time.time()
+            indice = IndiceEspacial(pedidos_coords)
+            candidatos = indice.listas_candidatas(LISTA_CANDIDATOS_K)
+            rota_greedy = construir_vizinho_mais_proximo(pedidos_coords, deposito_coords, indice)
+            distancia_greedy = avaliar_rota(rota_greedy, pedidos_coords, deposito_coords)
+            tempo_greedy = time.time() - inicio_greedy
+
+            inicio_busca = time.time()
+            rota_busca = busca_local(
+                rota_greedy,
+                criar_distancia_fn_coordenadas(pedidos_coords, deposito_coords),
+                len(pedidos_coords),
+                candidatos,
             )
+            distancia_busca = avaliar_rota(rota_busca, pedidos_coords, deposito_coords)
+            tempo_busca = tempo_greedy + (time.time() - inicio_busca)
 
             economia = distancia_greedy - resultado_ga["distancia_total_km"]
             economia_percentual = (economia / distancia_greedy * 100) if distancia_greedy > 0 else 0
@@ -288,7 +326,11 @@ class CompararAlgoritmosView(APIView):
                         },
                         "vizinho_mais_proximo": {
                             "distancia_km": round(distancia_greedy, 2),
-                            "tempo_s": 0.01,
+                            "tempo_s": round(tempo_greedy, 2),
+                        },
+                        "vizinho_mais_proximo_2opt": {
+                            "distancia_km": round(distancia_busca, 2),
+                            "tempo_s": round(tempo_busca, 2),
                         },
                         "economia": {
                             "km": round(economia, 2),
@@ -4,7 +4,6 @@ import logging
 import os
 import urllib.parse
 import urllib.request
-from decimal import Decimal
 from typing import List, Optional, Tuple
 
 from django.conf import settings
@@ -22,11 +21,8 @@ logger = logging.getLogger(__name__)
 
 
 def _peso_pedido(pedido: Pedido) -> float:
-    # Calcula peso total de um pedido a partir dos itens.
-    total = Decimal("0")
-    for item in pedido.itens.select_related("produto").all():
-        total += item.produto.peso * item.quantidade
-    return float(total)
+    # Peso total do pedido (coluna mantida na gravacao dos itens).
+    return float(pedido.peso_total)
 
 
 def _coordenadas_da_rota(rota: Rota, deposito_coords: Optional[dict]) -> List[dict]:
@@ -1,5 +1,6 @@
 from rest_framework import serializers
-from django.db.models import Sum, Count
+from django.db import transaction
+from django.db.models import Count, Prefetch, Q, Sum
 
 from accounts.models import User
 from logistics.models import (
@@ -16,23 +17,70 @@ from logistics.models import (
 from logistics.services.restricoes import (
     analisar_restricoes_para_itens_payload,
     aplicar_restricoes_no_pedido,
+    carregar_vinculos_em_lote,
     normalizar_payload_pedidos,
     validar_novos_vinculos_em_rota,
 )
+from logistics.services.totais import atualizar_totais_do_pedido, recalcular_estatisticas_rotas
 
+MAX_PEDIDOS_ANALISE_LOTE = 1000
 
-def _montar_alerta_restricao(pedido: Pedido):
-    grupos = (
-        pedido.grupos_restricao.filter(ativo=True)
-        .prefetch_related("familias")
-        .order_by("titulo")
+
+def _grupos_restricao_para_leitura():
+    # Grupos com as contagens de PedidoRestricaoGrupoSerializer/FamiliaSerializer ja anotadas.
+    familias = Familia.objects.annotate(total_produtos_anotado=Count("produtos", filter=Q(produtos__ativo=True)))
+    return PedidoRestricaoGrupo.objects.annotate(total_itens_anotado=Count("itens")).prefetch_related(
+        Prefetch("familias", queryset=familias)
     )
-    grupos = list(grupos)
+
+
+def _parametro_lista(request, nome):
+    valor = request.query_params.get(nome) if request is not None else None
+    if valor is None:
+        return None
+    return {campo.strip() for campo in valor.split(",") if campo.strip()}
+
+
+class CamposEsparsosMixin:
+    """
+    Sparse fieldsets pela query string (so em leituras e so no serializer raiz):
+    - ?fields=id,status limita os campos devolvidos;
+    - campos de Meta.campos_expansiveis (aninhados pesados) so aparecem com ?expand=,
+      ou sempre quando o contexto traz expandir_tudo=True (ex.: detalhe).
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        visiveis = self.campos_selecionados(self._context)
+        for nome in set(self.fields) - visiveis:
+            self.fields.pop(nome)
+
+    @classmethod
+    def campos_selecionados(cls, context):
+        """Campos que a requisicao vai receber; use tambem para montar o queryset."""
+        todos = set(cls.Meta.fields)
+        request = (context or {}).get("request")
+        if request is None or request.method not in ("GET", "HEAD", "OPTIONS"):
+            return todos
+        campos = _parametro_lista(request, "fields")
+        # Pedir um campo expansivel em ?fields= equivale a expandi-lo.
+        expandir = (_parametro_lista(request, "expand") or set()) | (campos or set())
+        expansiveis = set(getattr(cls.Meta, "campos_expansiveis", ()))
+        if not context.get("expandir_tudo"):
+            todos -= expansiveis - expandir
+        if campos:
+            todos &= campos | (expandir & expansiveis)
+        return todos
+
+
+def _montar_alerta_restricao(pedido: Pedido):
+    # Le grupos e familias por .all(): sem consultas quando vierem de PedidoSerializer.preparar_queryset.
+    grupos = sorted((grupo for grupo in pedido.grupos_restricao.all() if grupo.ativo), key=lambda grupo: grupo.titulo)
     if not grupos:
         return None
     partes = []
     for grupo in grupos:
-        nomes = ", ".join(grupo.familias.values_list("nome", flat=True))
+        nomes = ", ".join(familia.nome for familia in grupo.familias.all())
         partes.append(f"{grupo.titulo}: {nomes or 'sem famílias definidas'}")
     return "Pedido repartido por restrições de família -> " + " | ".join(partes)
 
@@ -41,7 +89,7 @@ def _montar_alerta_restricao(pedido: Pedido):
 # SERIALIZERS BÁSICOS - Convertem models Django em JSON e vice-versa
 # =============================================================================
 
-class FamiliaSerializer(serializers.ModelSerializer):
+class FamiliaSerializer(CamposEsparsosMixin, serializers.ModelSerializer):
     """
     Serializer para o modelo Familia
     - Converte dados da família de produtos entre Python/Django e JSON
@@ -60,10 +108,13 @@ class FamiliaSerializer(serializers.ModelSerializer):
         - obj: instância da Familia atual
         - Retorna: número inteiro com a contagem
         """
+        anotado = getattr(obj, "total_produtos_anotado", None)
+        if anotado is not None:
+            return anotado
         return obj.produtos.filter(ativo=True).count()
 
 
-class RestricaoFamiliaSerializer(serializers.ModelSerializer):
+class RestricaoFamiliaSerializer(CamposEsparsosMixin, serializers.ModelSerializer):
     familia_origem = FamiliaSerializer(read_only=True)
     familia_restrita = FamiliaSerializer(read_only=True)
     familia_origem_id = serializers.IntegerField(write_only=True)
@@ -92,10 +143,13 @@ class PedidoRestricaoGrupoSerializer(serializers.ModelSerializer):
         fields = ["id", "titulo", "ativo", "familias", "total_itens", "created_at"]
 
     def get_total_itens(self, obj):
+        anotado = getattr(obj, "total_itens_anotado", None)
+        if anotado is not None:
+            return anotado
         return obj.itens.count()
 
 
-class ProdutoSerializer(serializers.ModelSerializer):
+class ProdutoSerializer(CamposEsparsosMixin, serializers.ModelSerializer):
     """
     Serializer para o modelo Produto
     - Gerencia a serialização/deserialização de produtos
@@ -181,7 +235,7 @@ class UsuarioSimpleSerializer(serializers.ModelSerializer):
 # SERIALIZERS PRINCIPAIS - Para as entidades principais do sistema
 # =============================================================================
 
-class PedidoSerializer(serializers.ModelSerializer):
+class PedidoSerializer(CamposEsparsosMixin, serializers.ModelSerializer):
     """
     Serializer principal para Pedidos
     - Inclui todos os relacionamentos (usuário, itens)
@@ -194,9 +248,10 @@ class PedidoSerializer(serializers.ModelSerializer):
     itens = ProdutoPedidoSerializer(many=True, read_only=True)
     grupos_restricao = PedidoRestricaoGrupoSerializer(many=True, read_only=True)
 
-    peso_total = serializers.SerializerMethodField()
-    volume_total = serializers.SerializerMethodField()
-    total_itens = serializers.SerializerMethodField()
+    # Colunas desnormalizadas; coerce_to_string=False mantem os numeros como antes do campo existir.
+    peso_total = serializers.DecimalField(max_digits=14, decimal_places=3, read_only=True, coerce_to_string=False)
+    volume_total = serializers.DecimalField(max_digits=14, decimal_places=3, read_only=True, coerce_to_string=False)
+    total_itens = serializers.IntegerField(read_only=True)
     distancia_km = serializers.SerializerMethodField()
     rotas = serializers.SerializerMethodField()
     restricao_alerta = serializers.SerializerMethodField()
@@ -209,21 +264,28 @@ class PedidoSerializer(serializers.ModelSerializer):
             'volume_total', 'total_itens', 'distancia_km', 'rotas', 'restricao_alerta'
         ]
 
-    def get_peso_total(self, obj):
-        total = 0
-        for item in obj.itens.all():
-            total += item.produto.peso * item.quantidade
-        return total
-
-    def get_volume_total(self, obj):
-        total = 0
-        for item in obj.itens.all():
-            if item.produto.volume:
-                total += item.produto.volume * item.quantidade
-        return total
-
-    def get_total_itens(self, obj):
-        return obj.itens.aggregate(total=Sum('quantidade'))['total'] or 0
+    @staticmethod
+    def preparar_queryset(queryset, campos=None):
+        """
+        Relacionamentos em Prefetch: uma pagina de pedidos custa um numero fixo de
+        consultas, qualquer que seja o tamanho (os totais ja sao colunas do pedido).
+        Com `campos` (ver campos_selecionados), so carrega o que sera serializado.
+        """
+        campos = set(PedidoSerializer.Meta.fields) if campos is None else set(campos)
+        grupos = _grupos_restricao_para_leitura()
+        prefetches = []
+        if "itens" in campos:
+            prefetches += [
+                Prefetch("itens", queryset=ProdutoPedido.objects.select_related("produto__familia")),
+                Prefetch("itens__grupo_restricao", queryset=grupos),
+            ]
+        if campos & {"grupos_restricao", "restricao_alerta"}:
+            prefetches.append(Prefetch("grupos_restricao", queryset=grupos))
+        if "rotas" in campos:
+            prefetches.append(Prefetch("rotas", queryset=RotaPedido.objects.select_related("rota")))
+        if "usuario" in campos:
+            queryset = queryset.select_related("usuario")
+        return queryset.prefetch_related(*prefetches)
 
     def get_distancia_km(self, obj):
         return self.context.get('distancia_km', 0)
@@ -300,23 +362,22 @@ class RotaPedidoSerializer(serializers.ModelSerializer):
         ]
 
 
-class RotaSerializer(serializers.ModelSerializer):
+class RotaSerializer(CamposEsparsosMixin, serializers.ModelSerializer):
     """
     Serializer principal para Rotas de entrega
     - Inclui todos os pedidos da rota ordenados
     - Inclui trajeto GPS completo
     - Calcula estatísticas da rota (peso, entregas, percentuais)
+    - Na listagem, pedidos e trajetos só vêm com ?expand=pedidos,trajetos
     """
     pedidos = RotaPedidoSerializer(many=True, read_only=True)
     trajetos = RotaTrajetoSerializer(many=True, read_only=True)
     
-    # ReadOnlyField: lê propriedade do modelo (não precisa de método get_)
+    # Estatísticas gravadas na própria rota (atualizadas junto com os RotaPedido)
     peso_total_pedidos = serializers.ReadOnlyField()
-    
-    # Campos calculados para dashboard e relatórios
-    total_pedidos = serializers.SerializerMethodField()
-    pedidos_entregues = serializers.SerializerMethodField()
-    percentual_entrega = serializers.SerializerMethodField()
+    total_pedidos = serializers.ReadOnlyField()
+    pedidos_entregues = serializers.ReadOnlyField()
+    percentual_entrega = serializers.ReadOnlyField()
     
     class Meta:
         model = Rota
@@ -325,26 +386,21 @@ class RotaSerializer(serializers.ModelSerializer):
             'updated_at', 'pedidos', 'trajetos', 'peso_total_pedidos',
             'total_pedidos', 'pedidos_entregues', 'percentual_entrega'
         ]
-    
-    def get_total_pedidos(self, obj):
-        """Conta quantos pedidos estão na rota"""
-        return obj.pedidos.count()
-    
-    def get_pedidos_entregues(self, obj):
-        """Conta quantos pedidos já foram entregues"""
-        return obj.pedidos.filter(entregue=True).count()
-    
-    def get_percentual_entrega(self, obj):
-        """
-        Calcula percentual de pedidos entregues
-        - Evita divisão por zero
-        - Retorna valor arredondado com 1 casa decimal
-        """
-        total = obj.pedidos.count()
-        if total == 0:
-            return 0
-        entregues = obj.pedidos.filter(entregue=True).count()
-        return round((entregues / total) * 100, 1)
+        campos_expansiveis = ['pedidos', 'trajetos']
+
+    @staticmethod
+    def preparar_queryset(queryset, campos=None):
+        """Pedidos (com usuário e grupo) e trajetos em Prefetch, só quando serializados."""
+        campos = set(RotaSerializer.Meta.fields) if campos is None else set(campos)
+        prefetches = []
+        if "pedidos" in campos:
+            prefetches += [
+                Prefetch("pedidos", queryset=RotaPedido.objects.select_related("pedido__usuario")),
+                Prefetch("pedidos__grupo_restricao", queryset=_grupos_restricao_para_leitura()),
+            ]
+        if "trajetos" in campos:
+            prefetches.append("trajetos")
+        return queryset.prefetch_related(*prefetches)
 
 
 class RotaSimpleSerializer(serializers.ModelSerializer):
@@ -353,7 +409,7 @@ class RotaSimpleSerializer(serializers.ModelSerializer):
     - Usado em tabelas e seletores
     - Evita carregar pedidos e trajetos completos
     """
-    total_pedidos = serializers.SerializerMethodField()
+    total_pedidos = serializers.ReadOnlyField()
     peso_total = serializers.ReadOnlyField(source='peso_total_pedidos')
     
     class Meta:
@@ -362,9 +418,6 @@ class RotaSimpleSerializer(serializers.ModelSerializer):
             'id', 'data_rota', 'capacidade_max', 'status', 
             'total_pedidos', 'peso_total'
         ]
-    
-    def get_total_pedidos(self, obj):
-        return obj.pedidos.count()
 
 
 # =============================================================================
@@ -442,6 +495,7 @@ class PedidoCreateSerializer(serializers.ModelSerializer):
                 produto_id=item_data['produto_id'],
                 quantidade=item_data['quantidade']
             )
+        atualizar_totais_do_pedido(pedido)
         resultado = aplicar_restricoes_no_pedido(pedido)
         if resultado.get("mensagem"):
             pedido._restricao_msg = resultado["mensagem"]
@@ -454,7 +508,8 @@ class PedidoCreateSerializer(serializers.ModelSerializer):
         itens_data = validated_data.pop('itens', None)
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
-        instance.save()
+        # Só os campos enviados: os totais são gravados apenas por services.totais.
+        instance.save(update_fields=list(validated_data))
 
         if itens_data is not None:
             # Remove itens antigos e recria conforme payload
@@ -465,6 +520,7 @@ class PedidoCreateSerializer(serializers.ModelSerializer):
                     produto_id=item_data['produto_id'],
                     quantidade=item_data['quantidade']
                 )
+            atualizar_totais_do_pedido(instance)
         resultado = aplicar_restricoes_no_pedido(instance)
         if resultado.get("mensagem"):
             instance._restricao_msg = resultado["mensagem"]
@@ -477,6 +533,16 @@ class PedidoCreateSerializer(serializers.ModelSerializer):
         return _montar_alerta_restricao(obj)
 
 
+class PedidoAnaliseSerializer(serializers.Serializer):
+    """Itens de um pedido ainda nao gravado; `nf` so identifica o pedido na resposta."""
+    nf = serializers.IntegerField(required=False, allow_null=True)
+    itens = ProdutoPedidoSerializer(many=True)
+
+
+class AnaliseRestricoesLoteSerializer(serializers.Serializer):
+    pedidos = PedidoAnaliseSerializer(many=True, allow_empty=False, max_length=MAX_PEDIDOS_ANALISE_LOTE)
+
+
 class RotaCreateSerializer(serializers.ModelSerializer):
     """
     Serializer especializado para CRIAR rotas com pedidos
@@ -506,35 +572,29 @@ class RotaCreateSerializer(serializers.ModelSerializer):
         pedidos_payload = validated_data.pop('pedidos_ids', [])
         pedidos_normalizados = normalizar_payload_pedidos(pedidos_payload)
 
-        vinculos = []
-        for entry in pedidos_normalizados:
-            pedido_id = entry["pedido_id"]
-            try:
-                pedido = Pedido.objects.get(pk=pedido_id)
-            except Pedido.DoesNotExist as exc:
-                raise serializers.ValidationError(f"Pedido {pedido_id} não encontrado.") from exc
-            grupo = None
-            grupo_id = entry.get("grupo_restricao_id")
-            if grupo_id:
-                try:
-                    grupo = PedidoRestricaoGrupo.objects.get(pk=grupo_id, pedido=pedido)
-                except PedidoRestricaoGrupo.DoesNotExist as exc:
-                    raise serializers.ValidationError("Grupo informado não pertence ao pedido selecionado.") from exc
-            elif pedido.grupos_restricao.filter(ativo=True).exists():
-                raise serializers.ValidationError(
-                    f"Pedido {pedido.id} está repartido em grupos. Informe o grupo para roteirização."
-                )
-            vinculos.append((pedido, grupo))
+        vinculos, erros = carregar_vinculos_em_lote(pedidos_normalizados)
+        if erros:
+            raise serializers.ValidationError([erro["mensagem"] for erro in erros])
 
         validar_novos_vinculos_em_rota(vinculos)
 
-        rota = Rota.objects.create(**validated_data)
-        for ordem, (pedido, grupo) in enumerate(vinculos, 1):
-            RotaPedido.objects.create(
-                rota=rota,
-                pedido=pedido,
-                grupo_restricao=grupo,
-                ordem_entrega=ordem
+        with transaction.atomic():
+            rota = Rota.objects.create(**validated_data)
+            RotaPedido.objects.bulk_create(
+                RotaPedido(rota=rota, pedido=pedido, grupo_restricao=grupo, ordem_entrega=ordem)
+                for ordem, (pedido, grupo) in enumerate(vinculos, 1)
             )
+            recalcular_estatisticas_rotas(rota_ids=[rota.id])
         
         return rota
+
+    def update(self, instance, validated_data):
+        """
+        Atualiza os dados da rota; os vínculos são alterados pelos endpoints de atribuição.
+        As estatísticas são gravadas apenas por services.totais, então ficam fora do save().
+        """
+        validated_data.pop('pedidos_ids', None)
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        instance.save(update_fields=[*validated_data, 'updated_at'])
+        return instance
@@ -0,0 +1,49 @@
+from __future__ import annotations
+
+import re
+
+from django.core.cache import cache
+
+from logistics.ia.cancelamento import TokenCancelamento
+
+PREFIXO_CHAVE = "logistics:otimizacao:cancelar:"
+PREFIXO_ATIVA = "logistics:otimizacao:ativa:"
+VALIDADE_PEDIDO_S = 3600
+FORMATO_EXECUCAO_ID = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+def execucao_id_valido(execucao_id) -> bool:
+    return isinstance(execucao_id, str) and bool(FORMATO_EXECUCAO_ID.match(execucao_id))
+
+
+def iniciar_execucao(execucao_id: str) -> bool:
+    """
+    Registra a execucao como em andamento e descarta pedidos de cancelamento antigos
+    para o mesmo id. Retorna False se ja houver uma execucao ativa com esse id.
+    """
+    if not cache.add(f"{PREFIXO_ATIVA}{execucao_id}", True, VALIDADE_PEDIDO_S):
+        return False
+    cache.delete(f"{PREFIXO_CHAVE}{execucao_id}")
+    return True
+
+
+def solicitar_cancelamento(execucao_id: str) -> bool:
+    """
+    Marca a execucao para cancelamento no cache do Django; retorna False (sem marcar nada)
+    se o id nao estiver em andamento. Com mais de um processo servindo a API o backend de
+    cache precisa ser compartilhado (Redis, Memcached, banco); ver logistics.checks.
+    """
+    if cache.get(f"{PREFIXO_ATIVA}{execucao_id}") is None:
+        return False
+    cache.set(f"{PREFIXO_CHAVE}{execucao_id}", True, VALIDADE_PEDIDO_S)
+    return True
+
+
+def token_para_execucao(execucao_id: str) -> TokenCancelamento:
+    chave = f"{PREFIXO_CHAVE}{execucao_id}"
+    return TokenCancelamento(verificar=lambda: cache.get(chave) is not None)
+
+
+def encerrar_execucao(execucao_id: str) -> None:
+    # Evita que um pedido antigo cancele uma execucao futura com o mesmo id.
+    cache.delete_many([f"{PREFIXO_CHAVE}{execucao_id}", f"{PREFIXO_ATIVA}{execucao_id}"])
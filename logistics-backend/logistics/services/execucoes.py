@@ -0,0 +1,179 @@
+from __future__ import annotations
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import Any, Dict, List, Optional, Sequence
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Avg, Case, CharField, Count, Value, When
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from logistics.models import OtimizacaoExecucao
+
+logger = logging.getLogger(__name__)
+
+# (rotulo, limite superior inclusivo de paradas); o ultimo intervalo e aberto.
+FAIXAS_TAMANHO = (
+    ("ate_25", 25),
+    ("26_100", 100),
+    ("101_500", 500),
+    ("501_2000", 2000),
+    ("acima_2000", None),
+)
+PERCENTIS = (50, 90, 99)
+
+# Um unico worker: as gravacoes saem em ordem e nunca disputam conexoes com as requisicoes.
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def _obter_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="otimizacao-execucoes")
+    return _executor
+
+
+def _dados_execucao(resultado: Dict[str, Any], num_pedidos: int, usuario_id: Optional[int]) -> Dict[str, Any]:
+    parametros = dict(resultado.get("parametros_utilizados") or {})
+    cache = resultado.get("cache_fitness") or {}
+    tempos_fases = resultado.get("tempos_fases") or {}
+    return {
+        "usuario_id": usuario_id,
+        "num_pedidos": num_pedidos,
+        "num_paradas": resultado.get("paradas_unicas") or num_pedidos,
+        "algoritmo": parametros.get("algoritmo", "genetico"),
+        "modo": parametros.get("modo", "padrao"),
+        "metrica": resultado.get("metrica_utilizada") or "haversine",
+        "seed": parametros.get("seed"),
+        "parametros": parametros,
+        "tempos_fases": tempos_fases,
+        "tempo_total_s": round(sum(tempos_fases.values()), 4) if tempos_fases else resultado.get("tempo_execucao_s", 0),
+        "num_geracoes": resultado.get("num_geracoes") or 0,
+        "criterio_parada": resultado.get("criterio_parada") or "",
+        "cache_hits": cache.get("hits"),
+        "cache_misses": cache.get("misses"),
+        "distancia_km": resultado.get("distancia_total_km") or 0,
+        "gap_percentual": resultado.get("gap_percentual"),
+    }
+
+
+def _gravar(dados: Dict[str, Any]) -> None:
+    try:
+        OtimizacaoExecucao.objects.create(**dados)
+    except Exception:
+        logger.exception("[GA] falha ao registrar execucao da otimizacao")
+    finally:
+        # A thread do worker nao passa pelo ciclo de requisicao que fecharia a conexao.
+        if getattr(settings, "LOGISTICS_EXECUCOES_ASSINCRONAS", True):
+            connection.close()
+
+
+def registrar_execucao(resultado: Dict[str, Any], num_pedidos: int, usuario_id: Optional[int] = None) -> None:
+    """
+    Registra uma execucao do otimizador sem atrasar a resposta: a gravacao vai para
+    um worker em segundo plano (ou e feita na hora se LOGISTICS_EXECUCOES_ASSINCRONAS
+    estiver desligado). Erros sao apenas logados.
+    """
+    try:
+        dados = _dados_execucao(resultado, num_pedidos, usuario_id)
+    except Exception:
+        logger.exception("[GA] resultado da otimizacao sem o formato esperado para registro")
+        return
+    if getattr(settings, "LOGISTICS_EXECUCOES_ASSINCRONAS", True):
+        _obter_executor().submit(_gravar, dados)
+    else:
+        _gravar(dados)
+
+
+def _faixa_case() -> Case:
+    condicoes = []
+    for rotulo, limite in FAIXAS_TAMANHO:
+        if limite is not None:
+            condicoes.append(When(num_paradas__lte=limite, then=Value(rotulo)))
+    return Case(*condicoes, default=Value(FAIXAS_TAMANHO[-1][0]), output_field=CharField())
+
+
+def percentil(valores_ordenados: Sequence[float], p: float) -> Optional[float]:
+    """Percentil por posicao mais proxima (nearest-rank) de uma lista ja ordenada."""
+    if not valores_ordenados:
+        return None
+    posicao = max(1, -(-len(valores_ordenados) * p // 100))  # teto sem float
+    return valores_ordenados[int(posicao) - 1]
+
+
+def estatisticas_execucoes(dias: int = 30, algoritmo: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Latencia (p50/p90/p99 de tempo_total_s) e qualidade (km por parada, gap) por faixa
+    de tamanho da instancia, mais a tendencia diaria de qualidade em cada faixa.
+    """
+    execucoes = OtimizacaoExecucao.objects.filter(created_at__gte=timezone.now() - timedelta(days=dias))
+    if algoritmo:
+        execucoes = execucoes.filter(algoritmo=algoritmo)
+    execucoes = execucoes.annotate(faixa=_faixa_case())
+
+    # Percentis nao sao portaveis entre bancos: so os tempos vao para o Python, o resto agrega no SQL.
+    tempos: Dict[str, List[float]] = {}
+    for faixa, tempo in execucoes.order_by("tempo_total_s").values_list("faixa", "tempo_total_s"):
+        tempos.setdefault(faixa, []).append(tempo)
+
+    agregados = {
+        linha["faixa"]: linha
+        for linha in execucoes.order_by().values("faixa").annotate(
+            total=Count("id"),
+            distancia_media_km=Avg("distancia_km"),
+            paradas_media=Avg("num_paradas"),
+            gap_medio=Avg("gap_percentual"),
+            tempo_medio_s=Avg("tempo_total_s"),
+        )
+    }
+
+    faixas = []
+    for rotulo, limite in FAIXAS_TAMANHO:
+        linha = agregados.get(rotulo)
+        if not linha:
+            continue
+        valores = tempos.get(rotulo, [])
+        faixas.append(
+            {
+                "faixa": rotulo,
+                "limite_paradas": limite,
+                "total_execucoes": linha["total"],
+                "latencia_s": {f"p{p}": percentil(valores, p) for p in PERCENTIS},
+                "tempo_medio_s": _arredondar(linha["tempo_medio_s"], 4),
+                "distancia_media_km": _arredondar(linha["distancia_media_km"]),
+                "km_por_parada": _arredondar(
+                    linha["distancia_media_km"] / linha["paradas_media"] if linha["paradas_media"] else None, 4
+                ),
+                "gap_medio_percentual": _arredondar(linha["gap_medio"]),
+            }
+        )
+
+    tendencia = [
+        {
+            "dia": linha["dia"].isoformat() if linha["dia"] else None,
+            "faixa": linha["faixa"],
+            "total_execucoes": linha["total"],
+            "distancia_media_km": _arredondar(linha["distancia_media_km"]),
+            "gap_medio_percentual": _arredondar(linha["gap_medio"]),
+            "tempo_medio_s": _arredondar(linha["tempo_medio_s"], 4),
+        }
+        for linha in execucoes.annotate(dia=TruncDate("created_at"))
+        .order_by()
+        .values("dia", "faixa")
+        .annotate(
+            total=Count("id"),
+            distancia_media_km=Avg("distancia_km"),
+            gap_medio=Avg("gap_percentual"),
+            tempo_medio_s=Avg("tempo_total_s"),
+        )
+        .order_by("dia", "faixa")
+    ]
+
+    return {"periodo_dias": dias, "algoritmo": algoritmo, "faixas": faixas, "tendencia_diaria": tendencia}
+
+
+def _arredondar(valor: Optional[float], casas: int = 2) -> Optional[float]:
+    return round(valor, casas) if valor is not None else None
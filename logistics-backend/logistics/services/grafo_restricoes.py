@@ -0,0 +1,173 @@
+from __future__ import annotations
+
+import threading
+import time
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+from django.conf import settings
+from django.db import transaction
+
+from logistics.models import RestricaoFamilia
+
+# Rede de seguranca para outros processos (onde o sinal nao chega) e para .update() em lote,
+# que nao dispara post_save: o grafo e recompilado apos este tempo mesmo sem invalidacao.
+VALIDADE_PADRAO_S = 60
+
+
+class GrafoConflitos:
+    """
+    Grafo de incompatibilidade entre familias compilado a partir de RestricaoFamilia (ativas).
+
+    Cada familia com restricao recebe um bit; `adjacencia[familia_id]` e o bitset das
+    familias incompativeis com ela. Testes de conflito viram operacoes com inteiros.
+    """
+
+    def __init__(self, restricoes: Iterable[Tuple[int, str, int, str]], versao: int):
+        restricoes = list(restricoes)
+        self.versao = versao
+        # Identifica o conteudo do grafo: recompilar sem mudanca nas restricoes nao gera nova versao.
+        self.assinatura: FrozenSet[Tuple[int, str, int, str]] = frozenset(restricoes)
+        self.bit_por_familia: Dict[int, int] = {}
+        self.familia_por_bit: List[int] = []
+        self.nomes: Dict[int, str] = {}
+        self.adjacencia: Dict[int, int] = {}
+        # Sentido original (origem, restrita) de cada par, para as mensagens de erro.
+        self._pares: Dict[FrozenSet[int], Tuple[int, int]] = {}
+
+        for origem_id, origem_nome, restrita_id, restrita_nome in restricoes:
+            if origem_id == restrita_id:
+                continue
+            self.nomes[origem_id] = origem_nome
+            self.nomes[restrita_id] = restrita_nome
+            bit_origem = self._bit(origem_id)
+            bit_restrita = self._bit(restrita_id)
+            self.adjacencia[origem_id] = self.adjacencia.get(origem_id, 0) | bit_restrita
+            self.adjacencia[restrita_id] = self.adjacencia.get(restrita_id, 0) | bit_origem
+            self._pares.setdefault(frozenset((origem_id, restrita_id)), (origem_id, restrita_id))
+
+    def _bit(self, familia_id: int) -> int:
+        posicao = self.bit_por_familia.get(familia_id)
+        if posicao is None:
+            posicao = len(self.familia_por_bit)
+            self.bit_por_familia[familia_id] = posicao
+            self.familia_por_bit.append(familia_id)
+        return 1 << posicao
+
+    def mascara(self, familia_ids: Iterable[int]) -> int:
+        """Bitset das familias (familias sem nenhuma restricao nao ocupam bit)."""
+        mascara = 0
+        for fid in familia_ids:
+            posicao = self.bit_por_familia.get(fid)
+            if posicao is not None:
+                mascara |= 1 << posicao
+        return mascara
+
+    def familias_da_mascara(self, mascara: int) -> Set[int]:
+        familias = set()
+        while mascara:
+            bit = mascara & -mascara
+            familias.add(self.familia_por_bit[bit.bit_length() - 1])
+            mascara ^= bit
+        return familias
+
+    def vizinhos(self, familia_id: int) -> Set[int]:
+        return self.familias_da_mascara(self.adjacencia.get(familia_id, 0))
+
+    def conflitos_de(self, familia_ids: Iterable[int]) -> int:
+        """Bitset de todas as familias incompativeis com alguma de `familia_ids`."""
+        conflitos = 0
+        for fid in familia_ids:
+            conflitos |= self.adjacencia.get(fid, 0)
+        return conflitos
+
+    def conflitam(self, familias_a: Iterable[int], familias_b: Iterable[int]) -> bool:
+        return bool(self.conflitos_de(familias_a) & self.mascara(familias_b))
+
+    def primeiro_conflito(self, familias_a: Iterable[int], familias_b: Iterable[int]) -> Optional[Tuple[int, int]]:
+        """Par (origem, restrita) de uma restricao entre os dois conjuntos, ou None."""
+        familias_b = set(familias_b)
+        mascara_b = self.mascara(familias_b)
+        if not mascara_b:
+            return None
+        for fid in sorted(set(familias_a)):
+            comum = self.adjacencia.get(fid, 0) & mascara_b
+            if comum:
+                outra = min(self.familias_da_mascara(comum))
+                return self._pares[frozenset((fid, outra))]
+        return None
+
+    def pares_em_conflito(self, familia_ids: Iterable[int]) -> List[Tuple[int, int]]:
+        """Restricoes (origem, restrita) com as duas familias dentro de `familia_ids`."""
+        presentes = set(familia_ids)
+        mascara = self.mascara(presentes)
+        pares = set()
+        for fid in presentes:
+            for outra in self.familias_da_mascara(self.adjacencia.get(fid, 0) & mascara):
+                pares.add(self._pares[frozenset((fid, outra))])
+        return sorted(pares)
+
+    def subgrafo(self, familia_ids: Iterable[int]) -> Dict[int, Set[int]]:
+        presentes = set(familia_ids)
+        mascara = self.mascara(presentes)
+        return {fid: self.familias_da_mascara(self.adjacencia.get(fid, 0) & mascara) for fid in presentes}
+
+    def nome(self, familia_id: int) -> str:
+        return self.nomes.get(familia_id, str(familia_id))
+
+    def descrever_par(self, par: Tuple[int, int]) -> str:
+        return f"{self.nome(par[0])} x {self.nome(par[1])}"
+
+
+_trava = threading.Lock()
+_versao = 0
+_grafo: Optional[GrafoConflitos] = None
+_compilado_em = 0.0
+
+
+def versao_grafo() -> int:
+    """
+    Contador incrementado a cada invalidacao (ou quando a recompilacao por expiracao encontra
+    restricoes diferentes); serve de chave para caches derivados do grafo.
+    """
+    return _versao
+
+
+def _compilar(versao: int) -> GrafoConflitos:
+    linhas = RestricaoFamilia.objects.filter(ativo=True).values_list(
+        "familia_origem_id", "familia_origem__nome", "familia_restrita_id", "familia_restrita__nome"
+    )
+    return GrafoConflitos(linhas, versao)
+
+
+def obter_grafo() -> GrafoConflitos:
+    """Grafo compilado do processo; recompila (uma consulta) apos invalidacao ou expiracao."""
+    global _grafo, _compilado_em, _versao
+    validade = getattr(settings, "LOGISTICS_GRAFO_RESTRICOES_VALIDADE_S", VALIDADE_PADRAO_S)
+    grafo = _grafo
+    if grafo is not None and grafo.versao == _versao and time.monotonic() - _compilado_em < validade:
+        return grafo
+    with _trava:
+        grafo = _grafo
+        if grafo is None or grafo.versao != _versao or time.monotonic() - _compilado_em >= validade:
+            anterior = grafo
+            grafo = _compilar(_versao)
+            if anterior is not None and anterior.versao == _versao and anterior.assinatura != grafo.assinatura:
+                # Expirou e outro processo (ou um .update() em lote) mudou as restricoes: nova versao.
+                _versao += 1
+                grafo.versao = _versao
+            _grafo, _compilado_em = grafo, time.monotonic()
+    return grafo
+
+
+def invalidar_grafo() -> None:
+    global _versao, _grafo
+    with _trava:
+        _versao += 1
+        _grafo = None
+
+
+def invalidar_grafo_por_sinal(sender=None, **kwargs) -> None:
+    # Invalida ja (a propria transacao enxerga a mudanca) e de novo no commit, para descartar
+    # um grafo que outra thread tenha compilado com os dados antigos nesse intervalo.
+    invalidar_grafo()
+    transaction.on_commit(invalidar_grafo)
@@ -0,0 +1,315 @@
+from __future__ import annotations
+
+import csv
+import json
+from collections import defaultdict
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from django.db import transaction
+
+from logistics.models import Pedido, Produto, ProdutoPedido
+from logistics.services.grafo_restricoes import obter_grafo
+from logistics.services.particionamento import particionar_familias
+from logistics.services.lotes import criar_em_lote
+from logistics.services.restricoes import conflitos_dentro_dos_grupos
+from logistics.services.totais import MedidasProduto, calcular_totais
+
+TAMANHO_LOTE_PADRAO = 500
+MAX_ERROS_REPORTADOS = 1000
+FORMATOS = ("csv", "jsonl")
+# Uma linha por item; as linhas consecutivas da mesma NF formam o pedido.
+COLUNAS_CSV = ("nf", "cliente", "cidade", "dtpedido", "latitude", "longitude", "observacao", "produto_id", "quantidade")
+CAMPOS_PEDIDO = ("nf", "cliente", "cidade", "dtpedido", "latitude", "longitude", "observacao")
+FORMATOS_DATA = ("%Y-%m-%d", "%d/%m/%Y")
+CASAS_COORDENADA = Decimal("0.000001")
+
+
+class ErroRegistro(Exception):
+    def __init__(self, codigo: str, mensagem: str):
+        super().__init__(mensagem)
+        self.codigo = codigo
+        self.mensagem = mensagem
+
+
+# =============================================================================
+# Leitura (streaming): cada registro e {"linha", campos do pedido, "itens": [...]}
+# ou {"linha", "erro": ErroRegistro} quando a linha nem pode ser interpretada.
+# =============================================================================
+
+def ler_registros_csv(linhas: Iterable[str], delimitador: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Agrupa as linhas consecutivas com a mesma NF em um registro de pedido. O delimitador
+    (`,` ou `;`, comum em exportacoes de ERP) e detectado pelo cabecalho quando omitido.
+    """
+    linhas = iter(linhas)
+    cabecalho = next(linhas, None)
+    if cabecalho is None:
+        return
+    if delimitador is None:
+        delimitador = ";" if cabecalho.count(";") > cabecalho.count(",") else ","
+    colunas = [coluna.strip().lower() for coluna in next(csv.reader([cabecalho], delimiter=delimitador))]
+    faltantes = [coluna for coluna in ("nf", "produto_id", "quantidade") if coluna not in colunas]
+    if faltantes:
+        yield {"linha": 1, "erro": ErroRegistro("cabecalho_invalido", f"Colunas obrigatórias ausentes: {', '.join(faltantes)}.")}
+        return
+
+    atual: Optional[Dict[str, Any]] = None
+    for numero, valores in enumerate(csv.reader(linhas, delimiter=delimitador), start=2):
+        if not any(valor.strip() for valor in valores):
+            continue
+        linha = dict(zip(colunas, (valor.strip() for valor in valores)))
+        item = {"linha": numero, "produto_id": linha.get("produto_id"), "quantidade": linha.get("quantidade")}
+        if atual is not None and linha.get("nf") == atual["nf"]:
+            atual["itens"].append(item)
+            continue
+        if atual is not None:
+            yield atual
+        atual = {"linha": numero, **{campo: linha.get(campo) for campo in CAMPOS_PEDIDO}, "itens": [item]}
+    if atual is not None:
+        yield atual
+
+
+def ler_registros_jsonl(linhas: Iterable[str]) -> Iterator[Dict[str, Any]]:
+    """Um pedido por linha, no mesmo formato do payload de criacao (campos + lista `itens`)."""
+    for numero, texto in enumerate(linhas, start=1):
+        texto = texto.strip()
+        if not texto:
+            continue
+        try:
+            dados = json.loads(texto)
+        except ValueError as exc:
+            yield {"linha": numero, "erro": ErroRegistro("json_invalido", f"JSON inválido: {exc}.")}
+            continue
+        if not isinstance(dados, dict):
+            yield {"linha": numero, "erro": ErroRegistro("json_invalido", "Cada linha deve ser um objeto JSON.")}
+            continue
+        itens = dados.get("itens")
+        yield {
+            "linha": numero,
+            **{campo: dados.get(campo) for campo in CAMPOS_PEDIDO},
+            "itens": [{"linha": numero, **item} if isinstance(item, dict) else {"linha": numero} for item in itens]
+            if isinstance(itens, list)
+            else [],
+        }
+
+
+def ler_registros(linhas: Iterable[str], formato: str) -> Iterator[Dict[str, Any]]:
+    if formato == "csv":
+        return ler_registros_csv(linhas)
+    if formato == "jsonl":
+        return ler_registros_jsonl(linhas)
+    raise ValueError(f"Formato de importação desconhecido: {formato}.")
+
+
+# =============================================================================
+# Validacao sem banco
+# =============================================================================
+
+def _inteiro(valor: Any, campo: str, minimo: Optional[int] = None) -> int:
+    try:
+        numero = int(str(valor).strip())
+    except (TypeError, ValueError):
+        raise ErroRegistro("campo_invalido", f"Campo '{campo}' deve ser um número inteiro.")
+    if minimo is not None and numero < minimo:
+        raise ErroRegistro("campo_invalido", f"Campo '{campo}' deve ser maior ou igual a {minimo}.")
+    return numero
+
+
+def _coordenada(valor: Any, campo: str, limite: int) -> Decimal:
+    try:
+        numero = Decimal(str(valor).strip().replace(",", "."))
+    except (InvalidOperation, TypeError):
+        raise ErroRegistro("campo_invalido", f"Campo '{campo}' deve ser numérico.")
+    if not numero.is_finite() or abs(numero) > limite:
+        raise ErroRegistro("campo_invalido", f"Campo '{campo}' fora do intervalo permitido.")
+    return numero.quantize(CASAS_COORDENADA)
+
+
+def _data(valor: Any) -> date:
+    if isinstance(valor, date):
+        return valor
+    texto = str(valor or "").strip()
+    for formato in FORMATOS_DATA:
+        try:
+            return datetime.strptime(texto, formato).date()
+        except ValueError:
+            continue
+    raise ErroRegistro("campo_invalido", "Campo 'dtpedido' deve estar no formato AAAA-MM-DD ou DD/MM/AAAA.")
+
+
+def _texto(valor: Any, campo: str, tamanho: int) -> str:
+    texto = "" if valor is None else str(valor).strip()
+    if len(texto) > tamanho:
+        raise ErroRegistro("campo_invalido", f"Campo '{campo}' excede {tamanho} caracteres.")
+    return texto
+
+
+def _normalizar_registro(registro: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[int, int]]:
+    """Campos do Pedido e {produto_id: quantidade}; itens repetidos do mesmo produto sao somados."""
+    campos = {
+        "nf": _inteiro(registro.get("nf"), "nf"),
+        "cliente": _texto(registro.get("cliente"), "cliente", 100),
+        "cidade": _texto(registro.get("cidade"), "cidade", 100),
+        "observacao": _texto(registro.get("observacao"), "observacao", 100) or None,
+        "dtpedido": _data(registro.get("dtpedido")),
+        "latitude": _coordenada(registro.get("latitude"), "latitude", 90),
+        "longitude": _coordenada(registro.get("longitude"), "longitude", 180),
+    }
+    quantidades: Dict[int, int] = defaultdict(int)
+    for item in registro.get("itens") or []:
+        try:
+            quantidades[_inteiro(item.get("produto_id"), "produto_id", 1)] += _inteiro(item.get("quantidade"), "quantidade", 1)
+        except ErroRegistro as exc:
+            raise ErroRegistro(exc.codigo, f"Linha {item.get('linha')}: {exc.mensagem}")
+    if not quantidades:
+        raise ErroRegistro("sem_itens", "Pedido sem itens.")
+    return campos, dict(quantidades)
+
+
+# =============================================================================
+# Pipeline
+# =============================================================================
+
+class _Importacao:
+    def __init__(self, usuario_id: Optional[int], dividir_conflitos: bool, simular: bool):
+        self.usuario_id = usuario_id
+        self.dividir_conflitos = dividir_conflitos
+        self.simular = simular
+        self.nfs_vistas: Set[int] = set()
+        self.familia_por_produto: Dict[int, Optional[int]] = {}
+        self.medidas: Dict[int, MedidasProduto] = {}
+        self.resumo: Dict[str, Any] = {
+            "pedidos_lidos": 0,
+            "pedidos_importados": 0,
+            "pedidos_criados": 0,
+            "pedidos_divididos": 0,
+            "itens_criados": 0,
+            "total_erros": 0,
+            "simulado": simular,
+            "erros": [],
+        }
+
+    def erro(self, registro: Dict[str, Any], codigo: str, mensagem: str) -> None:
+        self.resumo["total_erros"] += 1
+        if len(self.resumo["erros"]) < MAX_ERROS_REPORTADOS:
+            self.resumo["erros"].append({"linha": registro.get("linha"), "nf": registro.get("nf"), "codigo": codigo, "mensagem": mensagem})
+
+    def processar_lote(self, registros: List[Dict[str, Any]]) -> None:
+        self.resumo["pedidos_lidos"] += len(registros)
+        candidatos: List[Tuple[Dict[str, Any], Dict[str, Any], Dict[int, int]]] = []
+        for registro in registros:
+            if "erro" in registro:
+                self.erro(registro, registro["erro"].codigo, registro["erro"].mensagem)
+                continue
+            try:
+                campos, quantidades = _normalizar_registro(registro)
+            except ErroRegistro as exc:
+                self.erro(registro, exc.codigo, exc.mensagem)
+                continue
+            if campos["nf"] in self.nfs_vistas:
+                self.erro(registro, "nf_duplicada_no_arquivo", f"NF {campos['nf']} aparece mais de uma vez no arquivo.")
+                continue
+            self.nfs_vistas.add(campos["nf"])
+            candidatos.append((registro, campos, quantidades))
+        if not candidatos:
+            return
+
+        # Uma consulta IN para as NFs do lote e outra para os produtos ainda nao vistos.
+        nfs_existentes = set(
+            Pedido.objects.filter(nf__in={campos["nf"] for _, campos, _ in candidatos}).values_list("nf", flat=True)
+        )
+        faltantes = {pid for _, _, quantidades in candidatos for pid in quantidades} - self.familia_por_produto.keys()
+        if faltantes:
+            for pid, familia_id, peso, volume in Produto.objects.filter(id__in=faltantes).values_list(
+                "id", "familia_id", "peso", "volume"
+            ):
+                self.familia_por_produto[pid] = familia_id
+                self.medidas[pid] = (peso, volume)
+        grafo = obter_grafo()
+
+        pedidos: List[Pedido] = []
+        itens_por_pedido: List[Dict[int, int]] = []
+        for registro, campos, quantidades in candidatos:
+            if campos["nf"] in nfs_existentes:
+                self.erro(registro, "nf_ja_cadastrada", f"Nota Fiscal {campos['nf']} já cadastrada no sistema.")
+                continue
+            inexistentes = sorted(pid for pid in quantidades if pid not in self.familia_por_produto)
+            if inexistentes:
+                self.erro(
+                    registro,
+                    "produto_nao_encontrado",
+                    f"Produtos não encontrados: {', '.join(str(pid) for pid in inexistentes)}.",
+                )
+                continue
+
+            familias = {self.familia_por_produto[pid] for pid in quantidades} - {None}
+            pares = grafo.pares_em_conflito(familias)
+            grupos = [quantidades]
+            if pares:
+                conflitos = ", ".join(sorted({grafo.descrever_par(par) for par in pares}))
+                if not self.dividir_conflitos:
+                    self.erro(registro, "familias_incompativeis", f"Pedido possui famílias incompatíveis ({conflitos}).")
+                    continue
+                # Mesma divisao de dividir_pedido_validado: um pedido por grupo da particao, mesma NF.
+                atribuicoes, total = particionar_familias(familias)
+                grupos = [{} for _ in range(total)]
+                for pid, quantidade in quantidades.items():
+                    grupos[atribuicoes.get(self.familia_por_produto[pid], 0)][pid] = quantidade
+                grupos = [grupo for grupo in grupos if grupo]
+                violados = conflitos_dentro_dos_grupos(
+                    {self.familia_por_produto[pid] for pid in grupo} for grupo in grupos
+                )
+                if violados:
+                    conflitos = ", ".join(sorted({grafo.descrever_par(par) for par in violados}))
+                    self.erro(registro, "divisao_invalida", f"Divisão ainda combina famílias incompatíveis ({conflitos}).")
+                    continue
+                self.resumo["pedidos_divididos"] += 1
+
+            self.resumo["pedidos_importados"] += 1
+            for grupo in grupos:
+                pedidos.append(Pedido(usuario_id=self.usuario_id, **campos, **calcular_totais(grupo.items(), self.medidas)))
+                itens_por_pedido.append(grupo)
+
+        self.resumo["pedidos_criados"] += len(pedidos)
+        self.resumo["itens_criados"] += sum(len(grupo) for grupo in itens_por_pedido)
+        if self.simular or not pedidos:
+            return
+        with transaction.atomic():
+            pedidos = criar_em_lote(Pedido, pedidos, campos_chave=("nf", "created_at"))
+            ProdutoPedido.objects.bulk_create(
+                [
+                    ProdutoPedido(pedido=pedido, produto_id=pid, quantidade=quantidade)
+                    for pedido, grupo in zip(pedidos, itens_por_pedido)
+                    for pid, quantidade in grupo.items()
+                ],
+                batch_size=TAMANHO_LOTE_PADRAO,
+            )
+
+
+def importar_pedidos(
+    registros: Iterable[Dict[str, Any]],
+    *,
+    tamanho_lote: int = TAMANHO_LOTE_PADRAO,
+    usuario_id: Optional[int] = None,
+    dividir_conflitos: bool = True,
+    simular: bool = False,
+) -> Dict[str, Any]:
+    """
+    Importa pedidos em lotes de `tamanho_lote` registros (ver ler_registros): por lote, uma
+    consulta de NFs ja cadastradas, uma de produtos novos e as insercoes em bulk_create, numa
+    transacao propria. Restricoes sao avaliadas no grafo em memoria; pedidos com familias
+    incompativeis sao divididos (ou rejeitados, com `dividir_conflitos=False`). Linhas
+    invalidas nao interrompem a importacao: entram em `erros` com linha, NF e codigo.
+    """
+    importacao = _Importacao(usuario_id, dividir_conflitos, simular)
+    registros = iter(registros)
+    tamanho_lote = max(1, tamanho_lote)
+    while True:
+        lote = list(islice(registros, tamanho_lote))
+        if not lote:
+            break
+        importacao.processar_lote(lote)
+    return importacao.resumo
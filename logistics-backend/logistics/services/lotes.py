@@ -0,0 +1,39 @@
+from __future__ import annotations
+
+from collections import defaultdict, deque
+from typing import Any, List, Sequence
+
+from django.db import DatabaseError, connection
+
+TAMANHO_LOTE_PADRAO = 500
+
+
+def criar_em_lote(modelo, objetos: List[Any], campos_chave: Sequence[str], batch_size: int = TAMANHO_LOTE_PADRAO) -> List[Any]:
+    """
+    bulk_create que devolve os objetos com PK em qualquer banco.
+
+    PostgreSQL, SQLite e MariaDB 10.5+ devolvem as PKs no proprio INSERT. No MySQL, que nao
+    devolve, as PKs sao recuperadas com uma consulta pelos `campos_chave` do lote (ex.: NF e
+    created_at, preenchido pelo auto_now_add antes do INSERT). Objetos com a mesma chave
+    recebem as PKs em ordem crescente, que e a ordem das linhas no INSERT.
+    """
+    if not objetos:
+        return objetos
+    objetos = modelo.objects.bulk_create(objetos, batch_size=batch_size)
+    if connection.features.can_return_rows_from_bulk_insert:
+        return objetos
+
+    atributos = [modelo._meta.get_field(campo).attname for campo in campos_chave]
+    chaves = [tuple(getattr(objeto, atributo) for atributo in atributos) for objeto in objetos]
+    filtros = {f"{atributo}__in": {chave[i] for chave in chaves} for i, atributo in enumerate(atributos)}
+    pks_por_chave = defaultdict(deque)
+    for pk, *chave in modelo.objects.filter(**filtros).order_by("pk").values_list("pk", *atributos):
+        pks_por_chave[tuple(chave)].append(pk)
+
+    for objeto, chave in zip(objetos, chaves):
+        if not pks_por_chave[chave]:
+            raise DatabaseError(f"Nao foi possivel recuperar a PK de {modelo.__name__} inserido em lote.")
+        objeto.pk = pks_por_chave[chave].popleft()
+        objeto._state.adding = False
+        objeto._state.db = connection.alias
+    return objetos
@@ -0,0 +1,165 @@
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from typing import Dict, FrozenSet, Iterable, List, Tuple
+
+from logistics.services.grafo_restricoes import GrafoConflitos, obter_grafo
+
+# Ate este numero de familias com restricao a coloracao e exata (branch and bound sobre DSATUR);
+# acima disso fica so a heuristica DSATUR.
+LIMITE_COLORACAO_EXATA = 24
+TAMANHO_MEMO = 2048
+
+_memo: "OrderedDict[Tuple[FrozenSet[int], int], Tuple[Dict[int, int], int]]" = OrderedDict()
+_trava_memo = threading.Lock()
+
+
+def _escolher_vertice(livres: int, saturacao: List[int], graus: List[int]) -> int:
+    # Maior saturacao (cores distintas na vizinhanca), depois maior grau, depois menor indice.
+    melhor, chave_melhor = -1, None
+    while livres:
+        bit = livres & -livres
+        v = bit.bit_length() - 1
+        livres ^= bit
+        chave = (bin(saturacao[v]).count("1"), graus[v], -v)
+        if chave_melhor is None or chave > chave_melhor:
+            melhor, chave_melhor = v, chave
+    return melhor
+
+
+def coloracao_dsatur(adjacencia: List[int]) -> List[int]:
+    """Coloracao DSATUR de um grafo dado por bitsets de vizinhanca (vertices 0..n-1)."""
+    n = len(adjacencia)
+    cores = [-1] * n
+    saturacao = [0] * n  # bitset das cores ja usadas pelos vizinhos
+    graus = [bin(mascara).count("1") for mascara in adjacencia]
+    livres = (1 << n) - 1
+    while livres:
+        v = _escolher_vertice(livres, saturacao, graus)
+        proibidas = saturacao[v]
+        cor = 0
+        while proibidas >> cor & 1:
+            cor += 1
+        cores[v] = cor
+        livres &= ~(1 << v)
+        vizinhos = adjacencia[v] & livres
+        while vizinhos:
+            bit = vizinhos & -vizinhos
+            saturacao[bit.bit_length() - 1] |= 1 << cor
+            vizinhos ^= bit
+    return cores
+
+
+def _clique_guloso(adjacencia: List[int]) -> int:
+    # Limite inferior barato: clique construido a partir de cada vertice pelo maior grau.
+    melhor = 1 if adjacencia else 0
+    graus = [bin(mascara).count("1") for mascara in adjacencia]
+    for inicio in range(len(adjacencia)):
+        candidatos, tamanho = adjacencia[inicio], 1
+        while candidatos:
+            v = max(
+                (i for i in range(len(adjacencia)) if candidatos >> i & 1),
+                key=lambda i: (graus[i], -i),
+            )
+            candidatos &= adjacencia[v]
+            tamanho += 1
+        melhor = max(melhor, tamanho)
+    return melhor
+
+
+def coloracao_exata(adjacencia: List[int]) -> List[int]:
+    """
+    Coloracao com o numero minimo de cores: backtracking na ordem DSATUR, partindo da
+    solucao DSATUR como limite superior e parando quando alcanca o tamanho de um clique.
+    """
+    n = len(adjacencia)
+    melhor = coloracao_dsatur(adjacencia)
+    limite_superior = max(melhor, default=-1) + 1
+    limite_inferior = _clique_guloso(adjacencia)
+    if limite_superior <= limite_inferior:
+        return melhor
+
+    graus = [bin(mascara).count("1") for mascara in adjacencia]
+    cores = [-1] * n
+    saturacao = [0] * n
+
+    def _buscar(livres: int, usadas: int) -> bool:
+        nonlocal melhor, limite_superior
+        if not livres:
+            melhor, limite_superior = cores.copy(), usadas
+            return limite_superior <= limite_inferior
+        v = _escolher_vertice(livres, saturacao, graus)
+        restantes = livres & ~(1 << v)
+        vizinhos = []
+        mascara = adjacencia[v] & restantes
+        while mascara:
+            bit = mascara & -mascara
+            vizinhos.append(bit.bit_length() - 1)
+            mascara ^= bit
+        # Cores ja usadas e no maximo uma nova, sempre abaixo da melhor solucao conhecida.
+        for cor in range(min(usadas + 1, limite_superior - 1)):
+            if cor >= limite_superior - 1:
+                break  # o limite caiu durante a busca
+            if saturacao[v] >> cor & 1:
+                continue
+            cores[v] = cor
+            anteriores = [saturacao[i] for i in vizinhos]
+            for i in vizinhos:
+                saturacao[i] |= 1 << cor
+            if _buscar(restantes, max(usadas, cor + 1)):
+                return True
+            for i, valor in zip(vizinhos, anteriores):
+                saturacao[i] = valor
+            cores[v] = -1
+        return False
+
+    _buscar((1 << n) - 1, 0)
+    return melhor
+
+
+def _colorir(familias: FrozenSet[int], grafo: GrafoConflitos) -> Tuple[Dict[int, int], int]:
+    # Familias sem restricao entre as presentes cabem em qualquer grupo: vao para o grupo 0.
+    subgrafo = grafo.subgrafo(familias)
+    com_restricao = sorted(fid for fid, vizinhos in subgrafo.items() if vizinhos)
+    if not com_restricao:
+        return {fid: 0 for fid in familias}, 1 if familias else 0
+
+    posicao = {fid: i for i, fid in enumerate(com_restricao)}
+    adjacencia = [sum(1 << posicao[outra] for outra in subgrafo[fid]) for fid in com_restricao]
+    if len(com_restricao) <= LIMITE_COLORACAO_EXATA:
+        cores = coloracao_exata(adjacencia)
+    else:
+        cores = coloracao_dsatur(adjacencia)
+
+    # Renumera os grupos pela ordem da menor familia de cada um (saida estavel entre execucoes).
+    renumeracao: Dict[int, int] = {}
+    for cor in cores:
+        renumeracao.setdefault(cor, len(renumeracao))
+    atribuicoes = {fid: renumeracao[cor] for fid, cor in zip(com_restricao, cores)}
+    for fid in familias:
+        atribuicoes.setdefault(fid, 0)
+    return atribuicoes, len(renumeracao)
+
+
+def particionar_familias(familias: Iterable[int]) -> Tuple[Dict[int, int], int]:
+    """
+    Particiona as familias no menor numero de grupos sem restricoes internas.
+    Retorna ({familia_id: indice_do_grupo}, total_de_grupos), memorizado por
+    (conjunto de familias, versao do grafo de restricoes).
+    """
+    chave_familias = frozenset(fid for fid in familias if fid)
+    grafo = obter_grafo()
+    chave = (chave_familias, grafo.versao)
+    with _trava_memo:
+        memorizado = _memo.get(chave)
+        if memorizado is not None:
+            _memo.move_to_end(chave)
+    if memorizado is None:
+        memorizado = _colorir(chave_familias, grafo)
+        with _trava_memo:
+            _memo[chave] = memorizado
+            if len(_memo) > TAMANHO_MEMO:
+                _memo.popitem(last=False)
+    atribuicoes, total = memorizado
+    return dict(atribuicoes), total
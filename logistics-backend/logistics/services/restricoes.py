@@ -5,64 +5,46 @@ from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
 
 from django.core.exceptions import ValidationError
 from django.db import transaction
-from django.db.models import Q
 
 from logistics.models import (
-    Familia,
     Pedido,
     PedidoRestricaoGrupo,
     Produto,
     ProdutoPedido,
-    RestricaoFamilia,
     Rota,
+    RotaPedido,
 )
+from logistics.services.grafo_restricoes import obter_grafo
+from logistics.services.lotes import criar_em_lote
+from logistics.services.particionamento import particionar_familias
+from logistics.services.totais import calcular_totais, medidas_dos_produtos
 
+ParRestricao = Tuple[int, int]  # (familia_origem_id, familia_restrita_id)
 
-def _buscar_restricoes_relevantes(familia_ids: Iterable[int]) -> List[RestricaoFamilia]:
-    ids = list({fid for fid in familia_ids if fid})
+
+def _buscar_restricoes_relevantes(familia_ids: Iterable[int]) -> List[ParRestricao]:
+    """Restricoes ativas entre as familias informadas, lidas do grafo em memoria (sem consulta)."""
+    ids = {fid for fid in familia_ids if fid}
     if not ids:
         return []
-    return list(
-        RestricaoFamilia.objects.filter(ativo=True).filter(
-            Q(familia_origem_id__in=ids) | Q(familia_restrita_id__in=ids)
-        )
-    )
+    return obter_grafo().pares_em_conflito(ids)
 
 
-def _montar_grafo(restricoes: Sequence[RestricaoFamilia]) -> Dict[int, Set[int]]:
-    grafo: Dict[int, Set[int]] = defaultdict(set)
-    for restricao in restricoes:
-        grafo[restricao.familia_origem_id].add(restricao.familia_restrita_id)
-        grafo[restricao.familia_restrita_id].add(restricao.familia_origem_id)
-    return grafo
+def _descrever_restricoes(restricoes: Sequence[ParRestricao]) -> Set[str]:
+    grafo = obter_grafo()
+    return {grafo.descrever_par(par) for par in restricoes}
 
 
-def _criar_grupos_por_coloring(familias: Set[int], restricoes: Sequence[RestricaoFamilia]):
-    grafo = _montar_grafo(restricoes)
-    if not grafo:
-        return {fid: 0 for fid in familias}, 1
-
-    familias_ordenadas = sorted(
-        familias,
-        key=lambda fid: (len(grafo.get(fid, set())), fid),
-        reverse=True,
-    )
-    atribuicoes: Dict[int, int] = {}
-    grupos: List[Set[int]] = []
-
-    for familia_id in familias_ordenadas:
-        conflitos = grafo.get(familia_id, set())
-        alocado = False
-        for idx, grupo in enumerate(grupos):
-            if not (grupo & conflitos):
-                grupo.add(familia_id)
-                atribuicoes[familia_id] = idx
-                alocado = True
-                break
-        if not alocado:
-            grupos.append({familia_id})
-            atribuicoes[familia_id] = len(grupos) - 1
-    return atribuicoes, len(grupos)
+def conflitos_dentro_dos_grupos(familias_por_grupo: Iterable[Iterable[int]]) -> List[ParRestricao]:
+    """
+    Restricoes violadas dentro de algum grupo de uma divisao (vazio se a divisao e valida).
+    Conferido no grafo em memoria, sem consulta, antes de gravar os pedidos divididos.
+    """
+    grafo = obter_grafo()
+    pares: Set[ParRestricao] = set()
+    for familias in familias_por_grupo:
+        pares.update(grafo.pares_em_conflito(fid for fid in familias if fid))
+    return sorted(pares)
 
 
 def limpar_grupos_restricao(pedido: Pedido):
@@ -80,39 +62,41 @@ def aplicar_restricoes_no_pedido(pedido: Pedido) -> Dict[str, object]:
             limpar_grupos_restricao(pedido)
         return {"possui_reparticao": False, "mensagem": None}
 
-    atribuicoes, total_grupos = _criar_grupos_por_coloring(familias_presentes, restricoes)
+    atribuicoes, total_grupos = particionar_familias(familias_presentes)
     if total_grupos <= 1:
         if pedido.grupos_restricao.exists():
             limpar_grupos_restricao(pedido)
         return {"possui_reparticao": False, "mensagem": None}
 
-    conflitos_texto = {
-        f"{r.familia_origem.nome} x {r.familia_restrita.nome}"
-        for r in restricoes
-        if r.familia_origem_id in familias_presentes and r.familia_restrita_id in familias_presentes
-    }
+    conflitos_texto = _descrever_restricoes(restricoes)
 
     with transaction.atomic():
         limpar_grupos_restricao(pedido)
-        grupos_criados: Dict[int, PedidoRestricaoGrupo] = {}
         familias_map = defaultdict(list)
         for familia_id, idx in atribuicoes.items():
             familias_map[idx].append(familia_id)
 
-        for idx, familia_ids in familias_map.items():
-            grupo = PedidoRestricaoGrupo.objects.create(
-                pedido=pedido,
-                titulo=f"Grupo {idx + 1}",
-                ativo=True,
-            )
-            grupo.familias.set(Familia.objects.filter(id__in=familia_ids))
-            grupos_criados[idx] = grupo
+        indices = sorted(familias_map)
+        grupos = criar_em_lote(
+            PedidoRestricaoGrupo,
+            [PedidoRestricaoGrupo(pedido=pedido, titulo=f"Grupo {idx + 1}", ativo=True) for idx in indices],
+            campos_chave=("pedido", "titulo", "created_at"),
+        )
+        grupos_criados: Dict[int, PedidoRestricaoGrupo] = dict(zip(indices, grupos))
+
+        # As familias vem dos proprios itens, entao existem: insere direto na tabela intermediaria.
+        Vinculo = PedidoRestricaoGrupo.familias.through
+        Vinculo.objects.bulk_create(
+            [
+                Vinculo(pedidorestricaogrupo_id=grupos_criados[idx].id, familia_id=familia_id)
+                for idx in indices
+                for familia_id in familias_map[idx]
+            ]
+        )
 
         for item in itens:
-            grupo_idx = atribuicoes.get(item.produto.familia_id)
-            grupo = grupos_criados.get(grupo_idx)
-            item.grupo_restricao = grupo
-            item.save(update_fields=["grupo_restricao"])
+            item.grupo_restricao = grupos_criados.get(atribuicoes.get(item.produto.familia_id))
+        ProdutoPedido.objects.bulk_update(itens, ["grupo_restricao"], batch_size=500)
 
     mensagem = (
         f"Itens da NF foram repartidos em {total_grupos} grupos "
@@ -125,29 +109,67 @@ def aplicar_restricoes_no_pedido(pedido: Pedido) -> Dict[str, object]:
     }
 
 
-def analisar_restricoes_para_itens_payload(itens_payload: Sequence[Dict[str, Any]]) -> Dict[str, Any]:
-    """
-    Normaliza os itens enviados no payload e identifica restrições
-    entre as famílias envolvidas antes mesmo de persistir o pedido.
-    """
-    analise_base = {
+def _analise_vazia() -> Dict[str, Any]:
+    return {
         "possui_conflito": False,
         "total_grupos": 0,
         "conflitos": [],
         "grupos": [],
         "mensagem": None,
     }
+
+
+def _carregar_produtos(produto_ids: Iterable[int]) -> Dict[int, Produto]:
+    ids = {pid for pid in produto_ids if pid}
+    if not ids:
+        return {}
+    return {produto.id: produto for produto in Produto.objects.filter(id__in=ids).select_related("familia")}
+
+
+def analisar_restricoes_para_itens_payload(itens_payload: Sequence[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Normaliza os itens enviados no payload e identifica restrições
+    entre as famílias envolvidas antes mesmo de persistir o pedido.
+    """
     if not itens_payload:
-        return analise_base
+        return _analise_vazia()
 
     produto_ids = {item.get("produto_id") for item in itens_payload if item.get("produto_id")}
-    produtos_map = {
-        produto.id: produto
-        for produto in Produto.objects.filter(id__in=produto_ids).select_related("familia")
-    }
+    produtos_map = _carregar_produtos(produto_ids)
     if len(produto_ids) != len(produtos_map):
         raise ValidationError("Alguns produtos informados não foram encontrados.")
+    return _analisar_itens(itens_payload, produtos_map)
+
 
+def analisar_restricoes_em_lote(lista_itens: Sequence[Sequence[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """
+    Mesma analise de analisar_restricoes_para_itens_payload para varios pedidos: todos os
+    produtos em uma consulta e o grafo de restricoes uma vez. Um pedido com produto
+    inexistente recebe `erro` na sua posicao, sem afetar os demais.
+    """
+    produtos_map = _carregar_produtos(
+        item.get("produto_id") for itens in lista_itens for item in itens or [] if isinstance(item, dict)
+    )
+    analises: List[Dict[str, Any]] = []
+    for itens in lista_itens:
+        faltantes = sorted({item.get("produto_id") for item in itens or []} - produtos_map.keys(), key=str)
+        if faltantes:
+            analises.append(
+                {
+                    **_analise_vazia(),
+                    "erro": {
+                        "codigo": "produto_nao_encontrado",
+                        "mensagem": f"Produtos não encontrados: {', '.join(str(pid) for pid in faltantes)}.",
+                    },
+                }
+            )
+            continue
+        analises.append(_analisar_itens(itens or [], produtos_map))
+    return analises
+
+
+def _analisar_itens(itens_payload: Sequence[Dict[str, Any]], produtos_map: Dict[int, Produto]) -> Dict[str, Any]:
+    analise_base = _analise_vazia()
     itens_normalizados: List[Dict[str, Any]] = []
     familias_presentes: Set[int] = set()
     for raw in itens_payload:
@@ -173,17 +195,11 @@ def analisar_restricoes_para_itens_payload(itens_payload: Sequence[Dict[str, Any
     if not restricoes or len(familias_presentes) <= 1:
         return analise_base
 
-    atribuicoes, total_grupos = _criar_grupos_por_coloring(familias_presentes, restricoes)
+    atribuicoes, total_grupos = particionar_familias(familias_presentes)
     if total_grupos <= 1:
         return analise_base
 
-    conflitos_texto = sorted(
-        {
-            f"{r.familia_origem.nome} x {r.familia_restrita.nome}"
-            for r in restricoes
-            if r.familia_origem_id in familias_presentes and r.familia_restrita_id in familias_presentes
-        }
-    )
+    conflitos_texto = sorted(_descrever_restricoes(restricoes))
 
     grupos_detalhados: List[Dict[str, Any]] = []
     for idx in sorted(set(atribuicoes.values())):
@@ -227,35 +243,32 @@ def dividir_pedido_validado(dados_pedido: Dict[str, Any], analise: Optional[Dict
         raise ValidationError("Não há restrições suficientes para dividir o pedido.")
 
     campos_base = {k: v for k, v in dados_pedido.items() if k != "itens"}
-    pedidos_criados: List[Pedido] = []
+    grupos = analise.get("grupos", [])
+    itens_por_grupo = [[(item["produto_id"], item["quantidade"]) for item in grupo.get("itens", [])] for grupo in grupos]
+    violados = conflitos_dentro_dos_grupos({item.get("familia_id") for item in grupo.get("itens", [])} for grupo in grupos)
+    if violados:
+        raise ValidationError(
+            f"Divisão inválida: grupos ainda combinam famílias incompatíveis ({', '.join(sorted(_descrever_restricoes(violados)))})."
+        )
+    medidas = medidas_dos_produtos(produto_id for itens in itens_por_grupo for produto_id, _ in itens)
 
     with transaction.atomic():
-        for grupo in analise.get("grupos", []):
-            dados_novos = dict(campos_base)
-            pedido = Pedido.objects.create(**dados_novos)
-            for item in grupo.get("itens", []):
-                ProdutoPedido.objects.create(
-                    pedido=pedido,
-                    produto_id=item["produto_id"],
-                    quantidade=item["quantidade"],
-                )
-            aplicar_restricoes_no_pedido(pedido)
-            pedidos_criados.append(pedido)
-    return pedidos_criados
-
-
-def _buscar_conflito_familias(familias_a: Set[int], familias_b: Set[int]) -> Optional[RestricaoFamilia]:
-    if not familias_a or not familias_b:
-        return None
-    return (
-        RestricaoFamilia.objects.filter(ativo=True)
-        .filter(
-            (Q(familia_origem_id__in=familias_a) & Q(familia_restrita_id__in=familias_b))
-            | (Q(familia_origem_id__in=familias_b) & Q(familia_restrita_id__in=familias_a))
+        pedidos_criados = criar_em_lote(
+            Pedido,
+            [Pedido(**campos_base, **calcular_totais(itens, medidas)) for itens in itens_por_grupo],
+            campos_chave=("nf", "created_at"),
         )
-        .select_related("familia_origem", "familia_restrita")
-        .first()
-    )
+        ProdutoPedido.objects.bulk_create(
+            [
+                ProdutoPedido(pedido=pedido, produto_id=item["produto_id"], quantidade=item["quantidade"])
+                for pedido, grupo in zip(pedidos_criados, grupos)
+                for item in grupo.get("itens", [])
+            ],
+            batch_size=500,
+        )
+    # Cada grupo foi conferido acima (sem familias incompativeis entre si), entao os pedidos
+    # novos nao precisam de grupos de restricao (aplicar_restricoes_no_pedido nao criaria nenhum).
+    return pedidos_criados
 
 
 def obter_familias_do_pedido(
@@ -274,29 +287,136 @@ def obter_familias_do_pedido(
     return familias
 
 
+def _familias_por_pedido_e_grupo(pedido_ids: Iterable[int]) -> Dict[int, Dict[Optional[int], Set[int]]]:
+    """{pedido_id: {grupo_restricao_id: familias}} de todos os itens dos pedidos, em uma consulta."""
+    familias: Dict[int, Dict[Optional[int], Set[int]]] = defaultdict(lambda: defaultdict(set))
+    linhas = ProdutoPedido.objects.filter(pedido_id__in=set(pedido_ids)).values_list(
+        "pedido_id", "grupo_restricao_id", "produto__familia_id"
+    )
+    for pedido_id, grupo_id, familia_id in linhas:
+        if familia_id:
+            familias[pedido_id][grupo_id].add(familia_id)
+    return familias
+
+
+def _familias_do_vinculo(familias_pedido: Dict[Optional[int], Set[int]], grupo_id: Optional[int]) -> Set[int]:
+    if grupo_id:
+        return set(familias_pedido.get(grupo_id, set()))
+    return set().union(*familias_pedido.values()) if familias_pedido else set()
+
+
 def coletar_familias_da_rota(rota: Rota) -> Set[int]:
+    vinculos = list(RotaPedido.objects.filter(rota=rota).values_list("pedido_id", "grupo_restricao_id"))
+    familias_por_pedido = _familias_por_pedido_e_grupo(pedido_id for pedido_id, _ in vinculos)
     familias: Set[int] = set()
-    rota_pedidos = rota.pedidos.select_related("pedido", "grupo_restricao").prefetch_related("pedido__itens__produto__familia")
-    for rel in rota_pedidos:
-        familias_rel = obter_familias_do_pedido(rel.pedido, rel.grupo_restricao, ignorar_validacao_grupo=True)
-        familias.update(familias_rel)
+    for pedido_id, grupo_id in vinculos:
+        familias.update(_familias_do_vinculo(familias_por_pedido.get(pedido_id, {}), grupo_id))
     return familias
 
 
-def validar_novos_vinculos_em_rota(
+def carregar_vinculos_em_lote(
+    pedidos_normalizados: Sequence[Dict[str, Optional[int]]],
+) -> Tuple[List[Tuple[Pedido, Optional[PedidoRestricaoGrupo]]], List[Dict[str, Any]]]:
+    """
+    Resolve pedidos e grupos de restricao de um payload (ver normalizar_payload_pedidos)
+    em duas consultas. Retorna os vinculos validos, na ordem do payload, e a lista de
+    erros encontrados (pedido inexistente, grupo de outro pedido, grupo obrigatorio).
+    """
+    pedido_ids = {entry["pedido_id"] for entry in pedidos_normalizados}
+    pedidos_map = {pedido.id: pedido for pedido in Pedido.objects.filter(id__in=pedido_ids)}
+    grupos_map: Dict[int, PedidoRestricaoGrupo] = {}
+    pedidos_com_grupo_ativo: Set[int] = set()
+    for grupo in PedidoRestricaoGrupo.objects.filter(pedido_id__in=pedido_ids):
+        grupos_map[grupo.id] = grupo
+        if grupo.ativo:
+            pedidos_com_grupo_ativo.add(grupo.pedido_id)
+
+    vinculos: List[Tuple[Pedido, Optional[PedidoRestricaoGrupo]]] = []
+    erros: List[Dict[str, Any]] = []
+    for entry in pedidos_normalizados:
+        pedido_id, grupo_id = entry["pedido_id"], entry.get("grupo_restricao_id")
+        pedido = pedidos_map.get(pedido_id)
+        if pedido is None:
+            erros.append(_erro_vinculo(pedido_id, grupo_id, "pedido_nao_encontrado", f"Pedido {pedido_id} não encontrado."))
+            continue
+        grupo = None
+        if grupo_id:
+            grupo = grupos_map.get(grupo_id)
+            if grupo is None or grupo.pedido_id != pedido_id:
+                erros.append(
+                    _erro_vinculo(pedido_id, grupo_id, "grupo_invalido", f"Grupo inválido informado para o pedido {pedido_id}.")
+                )
+                continue
+        elif pedido_id in pedidos_com_grupo_ativo:
+            erros.append(
+                _erro_vinculo(
+                    pedido_id,
+                    None,
+                    "grupo_obrigatorio",
+                    f"Pedido {pedido_id} está repartido. Informe o grupo correto para roteirizar.",
+                )
+            )
+            continue
+        vinculos.append((pedido, grupo))
+    return vinculos, erros
+
+
+def _erro_vinculo(pedido_id: int, grupo_id: Optional[int], codigo: str, mensagem: str) -> Dict[str, Any]:
+    return {"pedido_id": pedido_id, "grupo_restricao_id": grupo_id, "codigo": codigo, "mensagem": mensagem}
+
+
+def listar_conflitos_em_rota(
     novos_vinculos: Sequence[Tuple[Pedido, Optional[PedidoRestricaoGrupo]]],
     familias_iniciais: Optional[Set[int]] = None,
-) -> None:
+) -> List[Dict[str, Any]]:
+    """
+    Todos os conflitos de familia dos novos vinculos entre si e com `familias_iniciais`
+    (familias ja presentes na rota), em uma consulta e checagens no grafo em memoria.
+    Os vinculos ja devem vir de carregar_vinculos_em_lote, que valida pedidos e grupos.
+    Um vinculo em conflito nao entra na base usada para checar os seguintes.
+    """
+    if not novos_vinculos:
+        return []
+    familias_por_pedido = _familias_por_pedido_e_grupo({pedido.id for pedido, _ in novos_vinculos})
+    grafo = obter_grafo()
+
     familias_base = set(familias_iniciais or set())
+    erros: List[Dict[str, Any]] = []
     for pedido, grupo in novos_vinculos:
-        familias_novas = obter_familias_do_pedido(pedido, grupo)
-        conflito = _buscar_conflito_familias(familias_base, familias_novas)
-        if conflito:
-            raise ValidationError(
-                f"Não é permitido combinar '{conflito.familia_origem.nome}' com "
-                f"'{conflito.familia_restrita.nome}' na mesma rota."
-            )
+        grupo_id = grupo.id if grupo else None
+        familias_novas = _familias_do_vinculo(familias_por_pedido.get(pedido.id, {}), grupo_id)
+        pares = [
+            par
+            for par in grafo.pares_em_conflito(familias_base | familias_novas)
+            if (par[0] in familias_base and par[1] in familias_novas)
+            or (par[1] in familias_base and par[0] in familias_novas)
+        ]
+        if pares:
+            for origem_id, restrita_id in pares:
+                erros.append(
+                    {
+                        **_erro_vinculo(
+                            pedido.id,
+                            grupo_id,
+                            "familias_incompativeis",
+                            f"Não é permitido combinar '{grafo.nome(origem_id)}' com "
+                            f"'{grafo.nome(restrita_id)}' na mesma rota (pedido {pedido.id}).",
+                        ),
+                        "familias": [origem_id, restrita_id],
+                    }
+                )
+            continue
         familias_base.update(familias_novas)
+    return erros
+
+
+def validar_novos_vinculos_em_rota(
+    novos_vinculos: Sequence[Tuple[Pedido, Optional[PedidoRestricaoGrupo]]],
+    familias_iniciais: Optional[Set[int]] = None,
+) -> None:
+    erros = listar_conflitos_em_rota(novos_vinculos, familias_iniciais)
+    if erros:
+        raise ValidationError([erro["mensagem"] for erro in erros])
 
 
 def normalizar_payload_pedidos(payload: Sequence[object]) -> List[Dict[str, Optional[int]]]:
@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+from decimal import Decimal
+from typing import Dict, Iterable, Optional, Tuple
+
+from django.db import transaction
+from django.db.models import DecimalField, F, IntegerField, OuterRef, Q, QuerySet, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from logistics.models import Pedido, Produto, ProdutoPedido, Rota, RotaPedido
+
+CAMPOS_TOTAIS = Pedido.CAMPOS_DESNORMALIZADOS
+CAMPOS_ESTATISTICAS_ROTA = Rota.CAMPOS_DESNORMALIZADOS
+
+# (peso, volume) de um produto; volume pode ser nulo.
+MedidasProduto = Tuple[Decimal, Optional[Decimal]]
+
+
+def _soma_correlacionada(linhas: QuerySet, campo_grupo: str, expressao, output_field) -> Coalesce:
+    # SUM por linha externa (OuterRef) em subconsulta: imune aos JOINs do queryset externo.
+    agrupadas = linhas.order_by().values(campo_grupo)
+    soma = Subquery(agrupadas.annotate(total=Sum(expressao, output_field=output_field)).values("total")[:1])
+    return Coalesce(soma, Value(0, output_field=output_field), output_field=output_field)
+
+
+def expressoes_totais() -> Dict[str, Coalesce]:
+    """Totais de cada pedido calculados a partir dos itens (subconsultas correlacionadas)."""
+    itens = ProdutoPedido.objects.filter(pedido=OuterRef("pk"))
+    decimal = DecimalField(max_digits=14, decimal_places=3)
+    return {
+        "peso_total": _soma_correlacionada(itens, "pedido", F("quantidade") * F("produto__peso"), decimal),
+        "volume_total": _soma_correlacionada(itens, "pedido", F("quantidade") * F("produto__volume"), decimal),
+        "total_itens": _soma_correlacionada(itens, "pedido", F("quantidade"), IntegerField()),
+    }
+
+
+def expressoes_estatisticas_rota() -> Dict[str, Coalesce]:
+    """Paradas, entregues e carga (peso gravado dos pedidos) de cada rota, a partir dos RotaPedido."""
+    vinculos = RotaPedido.objects.filter(rota=OuterRef("pk"))
+    return {
+        "total_pedidos": _soma_correlacionada(vinculos, "rota", Value(1), IntegerField()),
+        "pedidos_entregues": _soma_correlacionada(
+            vinculos.filter(entregue=True), "rota", Value(1), IntegerField()
+        ),
+        "peso_total_pedidos": _soma_correlacionada(
+            vinculos, "rota", F("pedido__peso_total"), DecimalField(max_digits=14, decimal_places=3)
+        ),
+    }
+
+
+def medidas_dos_produtos(produto_ids: Iterable[int]) -> Dict[int, MedidasProduto]:
+    return {
+        produto_id: (peso, volume)
+        for produto_id, peso, volume in Produto.objects.filter(id__in=set(produto_ids)).values_list("id", "peso", "volume")
+    }
+
+
+def calcular_totais(itens: Iterable[Tuple[int, int]], medidas: Dict[int, MedidasProduto]) -> Dict[str, object]:
+    """Totais de (produto_id, quantidade) em memoria, para gravar junto com o bulk_create dos pedidos."""
+    peso, volume, quantidade_total = Decimal("0"), Decimal("0"), 0
+    for produto_id, quantidade in itens:
+        peso_produto, volume_produto = medidas[produto_id]
+        peso += peso_produto * quantidade
+        if volume_produto:
+            volume += volume_produto * quantidade
+        quantidade_total += quantidade
+    return {"peso_total": peso, "volume_total": volume, "total_itens": quantidade_total}
+
+
+def recalcular_totais(pedidos: Optional[QuerySet] = None, pedido_ids: Optional[Iterable[int]] = None) -> int:
+    """
+    Regrava os totais a partir dos itens, em um UPDATE, e a carga das rotas que contem
+    esses pedidos. Retorna o numero de pedidos atualizados.
+    """
+    if pedidos is None:
+        pedidos = Pedido.objects.all()
+    if pedido_ids is not None:
+        pedidos = pedidos.filter(id__in=set(pedido_ids))
+    with transaction.atomic():
+        atualizados = pedidos.order_by().update(**expressoes_totais())
+        rota_ids = RotaPedido.objects.filter(pedido__in=pedidos.order_by().values("pk")).values("rota_id")
+        recalcular_estatisticas_rotas(Rota.objects.filter(id__in=rota_ids))
+    return atualizados
+
+
+def recalcular_estatisticas_rotas(rotas: Optional[QuerySet] = None, rota_ids: Optional[Iterable[int]] = None) -> int:
+    """Regrava total_pedidos, pedidos_entregues e peso_total_pedidos das rotas, em um UPDATE."""
+    if rotas is None:
+        rotas = Rota.objects.all()
+    if rota_ids is not None:
+        rotas = rotas.filter(id__in=set(rota_ids))
+    return rotas.order_by().update(**expressoes_estatisticas_rota())
+
+
+def atualizar_totais_do_pedido(pedido: Pedido) -> None:
+    """Recalcula no banco e atualiza a instancia (usado apos recriar os itens de um pedido)."""
+    recalcular_totais(pedido_ids=[pedido.id])
+    pedido.refresh_from_db(fields=CAMPOS_TOTAIS)
+
+
+def pedidos_com_totais_divergentes(pedidos: Optional[QuerySet] = None) -> QuerySet:
+    """Pedidos cujos totais gravados diferem dos calculados a partir dos itens."""
+    if pedidos is None:
+        pedidos = Pedido.objects.all()
+    calculados = {f"{campo}_calculado": expressao for campo, expressao in expressoes_totais().items()}
+    divergente = Q()
+    for campo in CAMPOS_TOTAIS:
+        divergente |= ~Q(**{campo: F(f"{campo}_calculado")})
+    return pedidos.annotate(**calculados).filter(divergente)
+
+
+def rotas_com_estatisticas_divergentes(rotas: Optional[QuerySet] = None) -> QuerySet:
+    if rotas is None:
+        rotas = Rota.objects.all()
+    calculados = {f"{campo}_calculado": expressao for campo, expressao in expressoes_estatisticas_rota().items()}
+    divergente = Q()
+    for campo in CAMPOS_ESTATISTICAS_ROTA:
+        divergente |= ~Q(**{campo: F(f"{campo}_calculado")})
+    return rotas.annotate(**calculados).filter(divergente)
@@ -0,0 +1,44 @@
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+
+from logistics.models import Familia, Pedido, Produto, ProdutoPedido, RestricaoFamilia
+from logistics.services.grafo_restricoes import invalidar_grafo_por_sinal
+from logistics.services.totais import recalcular_totais
+
+for _modelo in (RestricaoFamilia, Familia):
+    post_save.connect(invalidar_grafo_por_sinal, sender=_modelo, dispatch_uid=f"grafo_restricoes_save_{_modelo.__name__}")
+    post_delete.connect(
+        invalidar_grafo_por_sinal, sender=_modelo, dispatch_uid=f"grafo_restricoes_delete_{_modelo.__name__}"
+    )
+
+
+def guardar_medidas_do_produto(sender, instance, update_fields=None, **kwargs):
+    # Peso/volume gravados antes do save, para o post_save so recalcular quando mudarem.
+    instance._medidas_anteriores = None
+    if instance._state.adding or (update_fields is not None and not {"peso", "volume"} & set(update_fields)):
+        return
+    instance._medidas_anteriores = Produto.objects.filter(pk=instance.pk).values_list("peso", "volume").first()
+
+
+def recalcular_totais_por_produto(sender, instance, created=False, **kwargs):
+    # Peso/volume do produto entram nos totais gravados de todos os pedidos que o contem.
+    anteriores = getattr(instance, "_medidas_anteriores", None)
+    if created or anteriores is None or anteriores == (instance.peso, instance.volume):
+        return
+    recalcular_totais(Pedido.objects.filter(itens__produto=instance))
+
+
+def guardar_pedidos_do_produto(sender, instance, **kwargs):
+    # Os itens do produto sao apagados em cascata: os pedidos afetados sao lidos antes.
+    instance._pedidos_afetados = set(ProdutoPedido.objects.filter(produto=instance).values_list("pedido_id", flat=True))
+
+
+def recalcular_totais_sem_produto(sender, instance, **kwargs):
+    pedido_ids = getattr(instance, "_pedidos_afetados", None)
+    if pedido_ids:
+        recalcular_totais(pedido_ids=pedido_ids)
+
+
+pre_save.connect(guardar_medidas_do_produto, sender=Produto, dispatch_uid="totais_pedido_produto_medidas")
+post_save.connect(recalcular_totais_por_produto, sender=Produto, dispatch_uid="totais_pedido_produto")
+pre_delete.connect(guardar_pedidos_do_produto, sender=Produto, dispatch_uid="totais_pedido_produto_pedidos")
+post_delete.connect(recalcular_totais_sem_produto, sender=Produto, dispatch_uid="totais_pedido_produto_delete")
@@ -1,12 +1,54 @@
 
+import io
+import itertools
+import json
+import os
+import pickle
 import random
+import tempfile
+from unittest import mock
 
-from django.test import TestCase
+from django.contrib import admin
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework.test import APIClient
+from rest_framework.utils.encoders import JSONEncoder
 
-from logistics.models import Familia, Pedido, Produto, RestricaoFamilia
-from logistics.ia.genetic_algorithm import algoritmo_genetico, otimizar_rota_pedidos
+from accounts.models import User
+from logistics import otimizacao_views
+from logistics.models import Familia, OtimizacaoExecucao, Pedido, Produto, ProdutoPedido, RestricaoFamilia, Rota, RotaPedido
+from logistics.ia import colonia_formigas, genetic_algorithm
+from logistics.ia.armazem_distancias import ArmazemDistancias, abrir_armazem_padrao
+from logistics.ia.genetic_algorithm import (
+    _preparar_parametros,
+    algoritmo_genetico,
+    avaliar_rota,
+    otimizar_rota_pedidos,
+)
+from logistics.ia.heuristicas import busca_local, construir_vizinho_mais_proximo
+from logistics.ia.indice_espacial import IndiceEspacial
+from logistics.ia.limite_inferior import limite_inferior_held_karp
+from logistics.ia.matriz_distancias import MatrizDistancias
+from logistics.ia.parametros_ajustados import ENV_CAMINHO as ENV_PARAMETROS, gravar_tabela
+from logistics.ia.utils import calcular_distancia, criar_distancia_fn_coordenadas
+from logistics.serializers import PedidoCreateSerializer, PedidoSerializer
+from logistics.services import particionamento
+from logistics.services.importacao import importar_pedidos, ler_registros_csv
+from logistics.services.grafo_restricoes import invalidar_grafo, obter_grafo, versao_grafo
+from logistics.services.totais import recalcular_estatisticas_rotas, recalcular_totais
+from logistics.services.restricoes import (
+    aplicar_restricoes_no_pedido,
+    analisar_restricoes_para_itens_payload,
+    carregar_vinculos_em_lote,
+    dividir_pedido_validado,
+    listar_conflitos_em_rota,
+    validar_novos_vinculos_em_rota,
+)
 
 
 class GeneticAlgorithmTests(TestCase):
@@ -33,6 +75,37 @@ class GeneticAlgorithmTests(TestCase):
         self.assertGreater(resultado["distancia_total_km"], 0)
         self.assertGreaterEqual(resultado["num_geracoes"], 1)
 
+    def test_buffers_alternados_preservam_elite_e_reproduzem_execucao(self):
+        rng = random.Random(2)
+        pedidos = [(-27.0 + rng.random(), -53.5 + rng.random()) for _ in range(15)]
+        deposito = (-27.3586, -53.3958)
+        kwargs = dict(tamanho_pop=20, num_geracoes=80, elitismo=3, random_seed=9, calcular_limite_inferior=False)
+
+        primeira = algoritmo_genetico(pedidos, deposito, **kwargs)
+        segunda = algoritmo_genetico(pedidos, deposito, **kwargs)
+
+        self.assertEqual(primeira["rota_otimizada"], segunda["rota_otimizada"])
+        self.assertEqual(primeira["historico_melhor"], segunda["historico_melhor"])
+        # A elite e copiada para o outro buffer antes da troca: o melhor de cada geracao nunca piora.
+        historico = primeira["historico_melhor"]
+        self.assertTrue(all(atual <= anterior for anterior, atual in zip(historico, historico[1:])))
+        self.assertAlmostEqual(
+            avaliar_rota(primeira["rota_otimizada"], pedidos, deposito), min(historico)
+        )
+
+    def test_cache_fitness_nao_altera_resultado(self):
+        pedidos = [(-27.0 + i * 0.05, -53.0 - (i % 3) * 0.07) for i in range(8)]
+        deposito = (-27.3586, -53.3958)
+
+        com_cache = algoritmo_genetico(pedidos, deposito, tamanho_pop=30, num_geracoes=60, random_seed=7)
+        sem_cache = algoritmo_genetico(
+            pedidos, deposito, tamanho_pop=30, num_geracoes=60, random_seed=7, usar_cache_fitness=False
+        )
+
+        self.assertEqual(com_cache["rota_otimizada"], sem_cache["rota_otimizada"])
+        self.assertGreater(com_cache["cache_fitness"]["hits"], 0)
+        self.assertIsNone(sem_cache["cache_fitness"])
+
     def test_parametros_sao_normalizados(self):
         pedidos = [
             {"id": 1, "latitude": -23.55, "longitude": -46.63},
@@ -57,6 +130,606 @@ class GeneticAlgorithmTests(TestCase):
         self.assertGreaterEqual(usados["taxa_mutacao"], 0)
         self.assertLessEqual(usados["elitismo"], usados["tamanho_pop"])
 
+    def test_tabela_ajustada_define_defaults_por_faixa(self):
+        with tempfile.TemporaryDirectory() as pasta:
+            caminho = os.path.join(pasta, "parametros.json")
+            gravar_tabela(
+                caminho,
+                [
+                    {"ate": None, "parametros": {"tamanho_pop": 300, "taxa_mutacao": 0.35}},
+                    {"ate": 50, "parametros": {"tamanho_pop": 40, "num_geracoes": 150, "ignorado": 1}},
+                ],
+            )
+            with mock.patch.dict(os.environ, {ENV_PARAMETROS: caminho}):
+                pequeno = _preparar_parametros({}, num_pedidos=30)
+                grande = _preparar_parametros({"tamanho_pop": 120}, num_pedidos=80)
+
+        self.assertEqual((pequeno["tamanho_pop"], pequeno["num_geracoes"]), (40, 150))
+        self.assertNotIn("ignorado", pequeno)
+        # O valor da requisicao prevalece sobre a tabela; o resto da faixa e aplicado.
+        self.assertEqual((grande["tamanho_pop"], grande["taxa_mutacao"]), (120, 0.35))
+
+    def test_tabela_ajustada_passa_pelos_mesmos_limites_da_requisicao(self):
+        with tempfile.TemporaryDirectory() as pasta:
+            caminho = os.path.join(pasta, "parametros.json")
+            gravar_tabela(
+                caminho,
+                [{"ate": None, "parametros": {"tamanho_pop": 5000, "num_geracoes": 3, "taxa_mutacao": 4.0, "elitismo": 0}}],
+            )
+            with mock.patch.dict(os.environ, {ENV_PARAMETROS: caminho}):
+                acima = _preparar_parametros({}, num_pedidos=30)
+            gravar_tabela(caminho, [{"ate": None, "parametros": {"tamanho_pop": 2}}])
+            os.utime(caminho, ns=(0, os.stat(caminho).st_mtime_ns + 1))
+            with mock.patch.dict(os.environ, {ENV_PARAMETROS: caminho}):
+                abaixo = _preparar_parametros({}, num_pedidos=30)
+
+        self.assertEqual(
+            (acima["tamanho_pop"], acima["num_geracoes"], acima["taxa_mutacao"], acima["elitismo"]), (500, 10, 1.0, 1)
+        )
+        self.assertEqual(abaixo["tamanho_pop"], 30)
+
+    def test_checkpoint_retomado_reproduz_execucao_sem_interrupcao(self):
+        rng = random.Random(1)
+        pedidos = [(-27 + rng.uniform(-1, 1), -53 + rng.uniform(-1, 1)) for _ in range(30)]
+        deposito = (-27.0, -53.0)
+        parametros = dict(tamanho_pop=24, num_geracoes=60, random_seed=7, operadores_adaptativos=True)
+        esperado = algoritmo_genetico(pedidos, deposito, **parametros)
+
+        selecao_original = genetic_algorithm.selecao_torneio_lote
+        chamadas = []
+
+        def selecao_que_falha(*args, **kwargs):
+            chamadas.append(1)
+            if len(chamadas) == 37:
+                raise RuntimeError("worker reciclado")
+            return selecao_original(*args, **kwargs)
+
+        with tempfile.TemporaryDirectory() as pasta:
+            caminho = os.path.join(pasta, "ga.ckpt")
+            with mock.patch.object(genetic_algorithm, "selecao_torneio_lote", selecao_que_falha):
+                with self.assertRaises(RuntimeError):
+                    algoritmo_genetico(pedidos, deposito, checkpoint_caminho=caminho, intervalo_checkpoint=10, **parametros)
+            self.assertTrue(os.path.exists(caminho))
+
+            retomado = algoritmo_genetico(pedidos, deposito, checkpoint_caminho=caminho, intervalo_checkpoint=10, **parametros)
+            self.assertFalse(os.path.exists(caminho))
+
+        self.assertEqual(retomado["rota_otimizada"], esperado["rota_otimizada"])
+        self.assertEqual(retomado["historico_melhor"], esperado["historico_melhor"])
+        self.assertEqual(retomado["operadores"], esperado["operadores"])
+
+    def test_limite_inferior_e_parada_por_gap(self):
+        rng = random.Random(5)
+        pedidos = [(-27.0 + rng.random(), -53.5 + rng.random()) for _ in range(7)]
+        deposito = (-27.3586, -53.3958)
+        otimo = min(avaliar_rota(list(p), pedidos, deposito) for p in itertools.permutations(range(7)))
+
+        resultado = algoritmo_genetico(pedidos, deposito, tamanho_pop=30, num_geracoes=300, random_seed=1, gap_parada=5)
+
+        self.assertLessEqual(resultado["limite_inferior_km"], round(otimo, 2) + 0.01)
+        self.assertEqual(resultado["criterio_parada"], "gap")
+        self.assertLessEqual(resultado["gap_percentual"], 5)
+        self.assertLess(resultado["num_geracoes"], 300)
+
+    def test_operadores_adaptativos_reponderam_probabilidades(self):
+        rng = random.Random(8)
+        pedidos = [(-27.0 + rng.random(), -53.5 + rng.random()) for _ in range(40)]
+        deposito = (-27.3586, -53.3958)
+        kwargs = dict(tamanho_pop=40, num_geracoes=150, random_seed=3, calcular_limite_inferior=False)
+
+        fixo = algoritmo_genetico(pedidos, deposito, **kwargs)
+        adaptativo = algoritmo_genetico(pedidos, deposito, operadores_adaptativos=True, **kwargs)
+
+        self.assertEqual(sorted(adaptativo["rota_otimizada"]), list(range(40)))
+        operadores = adaptativo["operadores"]
+        self.assertAlmostEqual(sum(op["probabilidade"] for op in operadores.values()), 1.0, places=3)
+        self.assertTrue(any(op["sucessos"] > 0 for op in operadores.values()))
+        self.assertLess(adaptativo["distancia_total_km"], fixo["distancia_total_km"])
+        self.assertIsNone(fixo["operadores"])
+
+    def test_motores_alternativos_seguem_o_formato_do_ga(self):
+        rng = random.Random(12)
+        pedidos = [
+            {"id": 10 + i, "latitude": -27.0 + rng.random(), "longitude": -53.5 + rng.random()} for i in range(40)
+        ]
+        deposito = {"latitude": -27.3586, "longitude": -53.3958}
+        coords = [(p["latitude"], p["longitude"]) for p in pedidos]
+        deposito_coords = (deposito["latitude"], deposito["longitude"])
+        distancia_vmp = avaliar_rota(construir_vizinho_mais_proximo(coords, deposito_coords), coords, deposito_coords)
+
+        for algoritmo in ("recozimento", "tabu", "colonia_formigas"):
+            resultado = otimizar_rota_pedidos(
+                pedidos, deposito, {"algoritmo": algoritmo, "usar_osrm": False, "seed": 4, "num_geracoes": 30}
+            )
+            self.assertEqual(resultado["parametros_utilizados"]["algoritmo"], algoritmo)
+            self.assertEqual(sorted(resultado["pedidos_ordem"]), [p["id"] for p in pedidos])
+            self.assertLessEqual(resultado["distancia_total_km"], round(distancia_vmp, 2))
+            self.assertIn(resultado["criterio_parada"], ("geracoes", "estagnacao", "sem_movimentos"))
+
+    def test_colonia_formigas_respeita_metrica_assimetrica(self):
+        rng = random.Random(21)
+        coords = [(-27.0 + rng.random(), -53.5 + rng.random()) for _ in range(25)]
+        pontos = coords + [(-27.3586, -53.3958)]
+
+        def subida_custa_mais(i, j):
+            # Ir para o norte custa o dobro de voltar: a->b e b->a diferem.
+            base = calcular_distancia(pontos[i], pontos[j])
+            return base * 2 if pontos[j][0] > pontos[i][0] else base
+
+        with mock.patch.object(colonia_formigas, "busca_local", wraps=colonia_formigas.busca_local) as busca:
+            resultado = colonia_formigas.colonia_formigas(
+                coords, pontos[-1], num_geracoes=15, distancia_fn=subida_custa_mais, deposito_idx=25, random_seed=2
+            )
+
+        self.assertTrue(busca.call_args_list)
+        self.assertTrue(all(chamada.kwargs["simetrica"] is False for chamada in busca.call_args_list))
+        rota = resultado["rota_otimizada"]
+        self.assertEqual(sorted(rota), list(range(25)))
+        caminho = [25] + rota + [25]
+        custo = sum(subida_custa_mais(a, b) for a, b in zip(caminho, caminho[1:]))
+        self.assertAlmostEqual(resultado["distancia_total_km"], round(custo, 2))
+        self.assertLessEqual(custo, resultado["historico_melhor"][0] + 1e-9)
+
+    def test_modo_decomposicao_visita_todos_os_pedidos(self):
+        rng = random.Random(3)
+        pedidos = [
+            {"id": 100 + i, "latitude": -27.3586 + rng.uniform(-1, 1), "longitude": -53.3958 + rng.uniform(-1, 1)}
+            for i in range(90)
+        ]
+        deposito = {"latitude": -27.3586, "longitude": -53.3958}
+
+        resultado = otimizar_rota_pedidos(
+            pedidos,
+            deposito,
+            {"modo": "decomposicao", "tamanho_cluster": 30, "processos": 1, "num_geracoes": 10, "usar_osrm": False},
+        )
+
+        self.assertEqual(resultado["num_clusters"], 3)
+        self.assertEqual(sorted(resultado["pedidos_ordem"]), [p["id"] for p in pedidos])
+        self.assertEqual(resultado["criterio_parada"], "decomposicao")
+
+    def test_decomposicao_cancelada_entre_setores_completa_com_vizinho_mais_proximo(self):
+        from logistics.ia import decomposicao
+        from logistics.ia.cancelamento import TokenCancelamento
+
+        rng = random.Random(4)
+        pedidos = [(-27.3586 + rng.uniform(-1, 1), -53.3958 + rng.uniform(-1, 1)) for _ in range(60)]
+        token = TokenCancelamento()
+        otimizar_original = decomposicao._otimizar_cluster
+
+        def otimizar_e_cancelar(tarefa, cancelamento=None):
+            resultado = otimizar_original(tarefa, cancelamento)
+            token.cancelar()
+            return resultado
+
+        with mock.patch.object(decomposicao, "_otimizar_cluster", side_effect=otimizar_e_cancelar) as otimizar:
+            resultado = decomposicao.otimizar_por_decomposicao(
+                pedidos, (-27.3586, -53.3958), {"num_geracoes": 10}, tamanho_cluster=20, processos=1, cancelamento=token
+            )
+
+        self.assertEqual(otimizar.call_count, 1)
+        self.assertEqual(resultado["criterio_parada"], "cancelado")
+        self.assertEqual(sorted(resultado["rota_otimizada"]), list(range(60)))
+        with mock.patch.dict(os.environ, {decomposicao.ENV_MAX_PROCESSOS: "1"}):
+            self.assertEqual(decomposicao.limite_processos(), 1)
+
+    def test_pedidos_no_mesmo_endereco_viram_uma_parada(self):
+        pedidos = [
+            {"id": 1, "latitude": -27.10, "longitude": -53.20},
+            {"id": 2, "latitude": -27.50, "longitude": -53.60},
+            {"id": 3, "latitude": -27.100001, "longitude": -53.200001},
+            {"id": 4, "latitude": -27.80, "longitude": -53.10},
+            {"id": 5, "latitude": -27.50, "longitude": -53.60},
+        ]
+        deposito = {"latitude": -27.3586, "longitude": -53.3958}
+
+        resultado = otimizar_rota_pedidos(pedidos, deposito, {"usar_osrm": False, "seed": 1, "num_geracoes": 20})
+
+        ordem = resultado["pedidos_ordem"]
+        self.assertEqual(resultado["paradas_unicas"], 3)
+        self.assertEqual(sorted(ordem), [1, 2, 3, 4, 5])
+        self.assertEqual(abs(ordem.index(1) - ordem.index(3)), 1)
+        self.assertEqual(abs(ordem.index(2) - ordem.index(5)), 1)
+
+    def test_parametros_preparados_uma_vez_e_matriz_liberada_em_falha(self):
+        pedidos = [
+            {"id": 1, "latitude": -27.1, "longitude": -53.2},
+            {"id": 2, "latitude": -27.1, "longitude": -53.2},
+            {"id": 3, "latitude": -27.5, "longitude": -53.6},
+        ]
+        deposito = {"latitude": -27.3586, "longitude": -53.3958}
+        matriz = MatrizDistancias.criar(3)
+
+        with mock.patch.object(genetic_algorithm, "abrir_armazem_padrao", return_value=None), mock.patch.object(
+            genetic_algorithm, "_construir_matriz_osrm", return_value=matriz
+        ), mock.patch.object(
+            genetic_algorithm, "_preparar_parametros", wraps=_preparar_parametros
+        ) as preparar, mock.patch.object(
+            genetic_algorithm, "algoritmo_genetico", side_effect=RuntimeError("falha no motor")
+        ):
+            with self.assertRaises(RuntimeError):
+                otimizar_rota_pedidos(pedidos, deposito, {"usar_osrm": True})
+
+        preparar.assert_called_once_with({"usar_osrm": True}, num_pedidos=2)
+        self.assertFalse(matriz.dono)
+
+
+class HeuristicasTests(TestCase):
+    def setUp(self):
+        rng = random.Random(11)
+        self.pedidos = [(-27.0 + rng.random(), -53.5 + rng.random()) for _ in range(120)]
+        self.deposito = (-27.3586, -53.3958)
+
+    def test_indice_espacial_retorna_vizinhos_mais_proximos(self):
+        indice = IndiceEspacial(self.pedidos)
+        candidatos = indice.listas_candidatas(5)
+        for idx in (0, 17, 64):
+            esperado = sorted(
+                (j for j in range(len(self.pedidos)) if j != idx),
+                key=lambda j: calcular_distancia(self.pedidos[idx], self.pedidos[j]),
+            )[:5]
+            self.assertEqual(set(candidatos[idx]), set(esperado))
+
+    def test_indice_espacial_com_pontos_colineares_ou_coincidentes_e_deposito_distante(self):
+        casos = [
+            [(-27.0, -53.0 + i * 0.001) for i in range(40)],  # colineares
+            [(-27.0 + (i % 2) * 0.0001, -53.0 + (i // 2) * 0.0001) for i in range(40)],  # bloco 2x20 de ~11 m
+            [(-27.0 + i * 1e-8, -53.0) for i in range(40)],  # praticamente coincidentes
+        ]
+        for pontos in casos:
+            indice = IndiceEspacial(pontos)
+            # A grade nao explode em celulas vazias quando a area do conjunto e ~0.
+            self.assertLessEqual(indice._colunas * indice._linhas, len(pontos))
+            x, y = indice._projetar(*self.deposito)
+            esperado = sorted(range(len(pontos)), key=lambda j: (indice._xy[j][0] - x) ** 2 + (indice._xy[j][1] - y) ** 2)
+            obtido = indice.k_mais_proximos_do_ponto(*self.deposito, 5)
+            self.assertEqual(
+                [indice._xy[j] for j in obtido],
+                [indice._xy[j] for j in esperado[:5]],
+            )
+            self.assertEqual(len(construir_vizinho_mais_proximo(pontos, self.deposito, indice)), len(pontos))
+
+    def test_busca_local_melhora_vizinho_mais_proximo(self):
+        indice = IndiceEspacial(self.pedidos)
+        candidatos = indice.listas_candidatas(8)
+        rota_inicial = construir_vizinho_mais_proximo(self.pedidos, self.deposito, indice)
+        distancia_fn = criar_distancia_fn_coordenadas(self.pedidos, self.deposito)
+
+        rota = busca_local(rota_inicial, distancia_fn, len(self.pedidos), candidatos)
+
+        self.assertEqual(sorted(rota), list(range(len(self.pedidos))))
+        self.assertLess(
+            avaliar_rota(rota, self.pedidos, self.deposito),
+            avaliar_rota(rota_inicial, self.pedidos, self.deposito),
+        )
+
+
+class MatrizDistanciasTests(TestCase):
+    def setUp(self):
+        rng = random.Random(11)
+        self.pedidos = [(-27.0 + rng.random(), -53.5 + rng.random()) for _ in range(60)]
+        self.deposito = (-27.3586, -53.3958)
+
+    def test_matriz_compartilhada_anexa_sem_copiar(self):
+        pontos = self.pedidos[:6] + [self.deposito]
+        linhas = [[calcular_distancia(a, b) for b in pontos] for a in pontos]
+        with MatrizDistancias.de_linhas(linhas) as matriz:
+            anexada = pickle.loads(pickle.dumps(matriz))
+            self.assertFalse(anexada.dono)
+            self.assertEqual(anexada.nome, matriz.nome)
+            self.assertEqual(anexada.linha(2), matriz.linha(2))
+
+            rota = [3, 1, 0, 5, 2, 4]
+            self.assertAlmostEqual(
+                avaliar_rota(rota, pontos[:6], self.deposito, matriz.funcao_distancia(), 6),
+                avaliar_rota(rota, pontos[:6], self.deposito),
+            )
+
+            matriz.definir_linha(0, [0.0] * len(pontos))
+            self.assertEqual(anexada(0, 3), 0.0)
+            anexada.fechar()
+
+    def test_anexar_nao_deixa_registro_no_rastreador_e_dono_remove_o_bloco(self):
+        from multiprocessing import resource_tracker, shared_memory
+
+        from logistics.ia import matriz_distancias
+
+        matriz = MatrizDistancias.de_linhas([[0.0, 1.0], [2.0, 0.0]])
+        with mock.patch.object(resource_tracker, "unregister", wraps=resource_tracker.unregister) as unregister:
+            anexada = MatrizDistancias.anexar(matriz.nome, 2)
+            self.assertEqual(anexada(1, 0), 2.0)
+            anexada.fechar()
+            if not matriz_distancias.RASTREIO_OPCIONAL:
+                unregister.assert_called_once_with(f"/{matriz.nome}", "shared_memory")
+            matriz.liberar()
+
+        with self.assertRaises(FileNotFoundError):
+            shared_memory.SharedMemory(name=matriz.nome)
+
+    def test_armazem_de_distancias_cresce_e_fatia_submatriz(self):
+        from logistics.management.commands.precomputar_distancias import tabela_haversine
+
+        with tempfile.TemporaryDirectory() as pasta:
+            caminho = os.path.join(pasta, "distancias.bin")
+            armazem = ArmazemDistancias.criar(caminho, capacidade=4, metrica="haversine")
+            self.assertEqual(armazem.adicionar(self.pedidos[:3] + [self.deposito], tabela_haversine, bloco=2), 4)
+            self.assertEqual(armazem.adicionar(self.pedidos[:10], tabela_haversine, bloco=3), 7)
+            self.assertGreaterEqual(armazem.capacidade, 11)
+            armazem.fechar()
+
+            pontos = [self.pedidos[9], self.pedidos[0], self.pedidos[5], self.deposito]
+            leitura = ArmazemDistancias(caminho)
+            with leitura.submatriz(pontos) as matriz:
+                for i, a in enumerate(pontos):
+                    for j, b in enumerate(pontos):
+                        self.assertAlmostEqual(matriz(i, j), calcular_distancia(a, b), places=3)
+            self.assertIsNone(leitura.submatriz([self.pedidos[50], self.deposito]))
+
+            pedidos = [{"id": i, "latitude": lat, "longitude": lon} for i, (lat, lon) in enumerate(self.pedidos[:10])]
+            deposito = {"latitude": self.deposito[0], "longitude": self.deposito[1]}
+            with mock.patch.dict(os.environ, {"LOGISTICS_DISTANCIAS_PATH": caminho}):
+                resultado = otimizar_rota_pedidos(pedidos, deposito, {"usar_osrm": True, "num_geracoes": 10})
+            self.assertTrue(resultado["armazem_distancias"])
+            self.assertEqual(resultado["metrica_utilizada"], "haversine")
+            leitura.fechar()
+
+            with mock.patch.dict(os.environ, {"LOGISTICS_DISTANCIAS_PATH": caminho}):
+                anterior = abrir_armazem_padrao()
+                escrita = ArmazemDistancias(caminho, somente_leitura=False)
+                escrita.adicionar(self.pedidos[10:12], tabela_haversine)
+                escrita.fechar()
+                os.utime(f"{caminho}.json", ns=(0, os.stat(f"{caminho}.json").st_mtime_ns + 1))
+                recarregado = abrir_armazem_padrao()
+            self.assertIsNot(recarregado, anterior)
+            self.assertIsNone(anterior._valores)
+            recarregado.fechar()
+
+    def test_setores_da_decomposicao_e_limite_inferior_leem_a_mesma_matriz(self):
+        from logistics.management.commands.precomputar_distancias import tabela_haversine
+
+        pedidos = [{"id": i, "latitude": lat, "longitude": lon} for i, (lat, lon) in enumerate(self.pedidos)]
+        deposito = {"latitude": self.deposito[0], "longitude": self.deposito[1]}
+        with tempfile.TemporaryDirectory() as pasta:
+            caminho = os.path.join(pasta, "distancias.bin")
+            armazem = ArmazemDistancias.criar(caminho, capacidade=64, metrica="haversine")
+            armazem.adicionar(self.pedidos + [self.deposito], tabela_haversine)
+            armazem.fechar()
+            with mock.patch.dict(os.environ, {"LOGISTICS_DISTANCIAS_PATH": caminho}), mock.patch.object(
+                MatrizDistancias, "anexar", wraps=MatrizDistancias.anexar
+            ) as anexar:
+                resultado = otimizar_rota_pedidos(
+                    pedidos,
+                    deposito,
+                    {"modo": "decomposicao", "tamanho_cluster": 20, "processos": 1, "num_geracoes": 10, "usar_osrm": True},
+                )
+
+        self.assertTrue(resultado["armazem_distancias"])
+        self.assertEqual(anexar.call_count, resultado["num_clusters"])
+        self.assertEqual(sorted(resultado["pedidos_ordem"]), list(range(len(pedidos))))
+
+        pontos = self.pedidos[:12] + [self.deposito]
+        with MatrizDistancias.de_linhas([[calcular_distancia(a, b) for b in pontos] for a in pontos]) as matriz:
+            with mock.patch.object(MatrizDistancias, "criar", wraps=MatrizDistancias.criar) as criar:
+                limite = limite_inferior_held_karp(list(range(13)), matriz)
+            self.assertEqual(criar.call_count, 0)
+            self.assertAlmostEqual(limite, limite_inferior_held_karp(list(range(13)), matriz.funcao_distancia()))
+
+    def test_decomposicao_com_matriz_costura_nela_e_ignora_setores_triviais_no_flag_osrm(self):
+        from logistics.ia import decomposicao
+
+        pedidos = self.pedidos[:8]
+        pontos = pedidos + [self.deposito]
+        linhas = [[calcular_distancia(a, b) for b in pontos] for a in pontos]
+        with MatrizDistancias.de_linhas(linhas) as matriz, mock.patch.object(
+            decomposicao, "criar_distancia_fn_coordenadas", side_effect=AssertionError("Haversine usado")
+        ):
+            resultado = decomposicao.otimizar_por_decomposicao(
+                pedidos, self.deposito, {"num_geracoes": 5}, tamanho_cluster=3, processos=1, matriz=matriz, matriz_osrm=True
+            )
+        self.assertEqual(resultado["num_clusters"], 3)
+        self.assertTrue(resultado["osrm_usado"])
+        self.assertEqual(sorted(resultado["rota_otimizada"]), list(range(8)))
+
+        def matriz_do_setor(pontos, deposito, **_):
+            todos = pontos + [deposito]
+            return MatrizDistancias.de_linhas([[calcular_distancia(a, b) for b in todos] for a in todos])
+
+        with mock.patch.object(decomposicao, "_construir_matriz_osrm", side_effect=matriz_do_setor):
+            resultado = decomposicao.otimizar_por_decomposicao(
+                pedidos, self.deposito, {"num_geracoes": 5}, tamanho_cluster=3, processos=1, osrm={"base_url": "x"}
+            )
+        self.assertTrue(resultado["osrm_usado"])
+
+        # Na matriz assimetrica o sentido do setor pesa tambem no custo interno, nao so na emenda.
+        custos = {(3, 0): 1.0, (3, 2): 2.0, (0, 1): 50.0, (1, 2): 50.0, (2, 1): 1.0, (1, 0): 1.0}
+
+        def distancia(a, b):
+            return custos.get((a, b), 0.0)
+
+        self.assertEqual(decomposicao._costurar([[0, 1, 2]], distancia, 3), [0, 1, 2])
+        self.assertEqual(decomposicao._costurar([[0, 1, 2]], distancia, 3, simetrica=False), [2, 1, 0])
+
+
+class GrafoRestricoesTests(TestCase):
+    def setUp(self):
+        invalidar_grafo()
+        self.quimicos = Familia.objects.create(nome="Quimicos")
+        self.alimentos = Familia.objects.create(nome="Alimentos")
+        self.racao = Familia.objects.create(nome="Racao")
+        RestricaoFamilia.objects.create(familia_origem=self.quimicos, familia_restrita=self.alimentos)
+
+    def test_grafo_compila_uma_vez_e_invalida_por_sinal(self):
+        with self.assertNumQueries(1):
+            grafo = obter_grafo()
+            self.assertIs(obter_grafo(), grafo)
+            self.assertEqual(grafo.primeiro_conflito({self.alimentos.id}, {self.quimicos.id}), (self.quimicos.id, self.alimentos.id))
+            self.assertFalse(grafo.conflitam({self.racao.id}, {self.quimicos.id, self.alimentos.id}))
+
+        versao = versao_grafo()
+        RestricaoFamilia.objects.create(familia_origem=self.racao, familia_restrita=self.quimicos)
+        self.assertGreater(versao_grafo(), versao)
+        self.assertEqual(obter_grafo().vizinhos(self.quimicos.id), {self.alimentos.id, self.racao.id})
+
+    @override_settings(LOGISTICS_GRAFO_RESTRICOES_VALIDADE_S=0)
+    def test_expiracao_recompila_mas_so_muda_versao_se_as_restricoes_mudarem(self):
+        obter_grafo()
+        versao = versao_grafo()
+        with self.assertNumQueries(2):
+            obter_grafo()
+            obter_grafo()
+        self.assertEqual(versao_grafo(), versao)
+
+        # .update() em lote nao dispara sinal; a expiracao percebe a diferenca.
+        RestricaoFamilia.objects.update(ativo=False)
+        grafo = obter_grafo()
+        self.assertGreater(versao_grafo(), versao)
+        self.assertEqual(grafo.versao, versao_grafo())
+        self.assertFalse(grafo.conflitam({self.quimicos.id}, {self.alimentos.id}))
+
+    def test_validacao_de_rota_usa_o_grafo_em_memoria(self):
+        produtos = {
+            familia.id: Produto.objects.create(nome=familia.nome, peso=1, familia=familia)
+            for familia in (self.quimicos, self.alimentos)
+        }
+        pedidos = []
+        for nf, familia in ((1, self.quimicos), (2, self.alimentos)):
+            pedido = Pedido.objects.create(nf=nf, dtpedido="2024-05-01", latitude=-27, longitude=-53)
+            pedido.itens.create(produto=produtos[familia.id], quantidade=1)
+            pedidos.append(pedido)
+
+        obter_grafo()
+        with self.assertRaisesMessage(Exception, "'Quimicos' com 'Alimentos'"):
+            validar_novos_vinculos_em_rota([(pedido, None) for pedido in pedidos])
+
+    def test_validacao_em_lote_tem_numero_fixo_de_consultas_e_lista_todos_os_conflitos(self):
+        produtos = {
+            familia.id: Produto.objects.create(nome=familia.nome, peso=1, familia=familia)
+            for familia in (self.quimicos, self.alimentos, self.racao)
+        }
+        familias = [self.quimicos, self.racao] + [self.alimentos, self.racao] * 20
+        pedidos = []
+        for nf, familia in enumerate(familias, 1):
+            pedido = Pedido.objects.create(nf=nf, dtpedido="2024-05-01", latitude=-27, longitude=-53)
+            pedido.itens.create(produto=produtos[familia.id], quantidade=1)
+            pedidos.append(pedido)
+        obter_grafo()
+
+        def validar(lote):
+            vinculos, erros = carregar_vinculos_em_lote([{"pedido_id": p.id, "grupo_restricao_id": None} for p in lote])
+            return erros + listar_conflitos_em_rota(vinculos)
+
+        # Pedidos, grupos e itens: tres consultas com 4 ou 42 pedidos.
+        with self.assertNumQueries(3):
+            validar(pedidos[:4])
+        with self.assertNumQueries(3):
+            erros = validar(pedidos)
+
+        conflitantes = [p.id for p, f in zip(pedidos, familias) if f == self.alimentos]
+        self.assertEqual([erro["pedido_id"] for erro in erros], conflitantes)
+        self.assertEqual({erro["codigo"] for erro in erros}, {"familias_incompativeis"})
+
+    def test_divisao_e_reparticao_de_nf_grande_usam_escritas_em_lote(self):
+        produtos = [
+            Produto.objects.create(nome=f"{familia.nome} {n}", peso=1, familia=familia)
+            for n in range(50)
+            for familia in (self.quimicos, self.alimentos)
+        ]
+        itens = [{"produto_id": produto.id, "quantidade": 2} for produto in produtos]
+        analise = analisar_restricoes_para_itens_payload(itens)
+        dados = {"nf": 900, "cliente": "Cooperativa", "dtpedido": "2024-05-01", "latitude": -27, "longitude": -53, "itens": itens}
+
+        with CaptureQueriesContext(connection) as consultas:
+            criados = dividir_pedido_validado(dados, analise)
+        self.assertLessEqual(len(consultas), 5)
+        self.assertEqual(sorted(p.itens.count() for p in criados), [50, 50])
+
+        pedido = Pedido.objects.create(nf=901, dtpedido="2024-05-01", latitude=-27, longitude=-53)
+        ProdutoPedido.objects.bulk_create(ProdutoPedido(pedido=pedido, produto=produto, quantidade=1) for produto in produtos)
+        with CaptureQueriesContext(connection) as consultas:
+            resultado = aplicar_restricoes_no_pedido(pedido)
+        self.assertLessEqual(len(consultas), 8)
+        self.assertEqual(resultado["total_grupos"], 2)
+        for grupo in pedido.grupos_restricao.all():
+            familias = set(grupo.familias.values_list("id", flat=True))
+            self.assertEqual(len(familias), 1)
+            self.assertEqual(set(grupo.itens.values_list("produto__familia_id", flat=True)), familias)
+
+    def test_escritas_em_lote_recuperam_pks_sem_returning_do_banco(self):
+        # Como no MySQL: o INSERT em lote nao devolve as PKs, recuperadas depois com uma consulta.
+        produtos = [Produto.objects.create(nome=familia.nome, peso=1, familia=familia) for familia in (self.quimicos, self.alimentos)]
+        itens = [{"produto_id": produto.id, "quantidade": 2} for produto in produtos]
+        dados = {"nf": 900, "cliente": "Cooperativa", "dtpedido": "2024-05-01", "latitude": -27, "longitude": -53, "itens": itens}
+        pedido = Pedido.objects.create(nf=901, dtpedido="2024-05-01", latitude=-27, longitude=-53)
+        ProdutoPedido.objects.bulk_create(ProdutoPedido(pedido=pedido, produto=produto, quantidade=1) for produto in produtos)
+
+        with mock.patch.object(type(connection.features), "can_return_rows_from_bulk_insert", False):
+            with CaptureQueriesContext(connection) as consultas:
+                criados = dividir_pedido_validado(dados, analisar_restricoes_para_itens_payload(itens))
+            inserts = [q["sql"] for q in consultas if q["sql"].startswith('INSERT INTO "logistics_pedido"')]
+            self.assertEqual(len(inserts), 1)
+            aplicar_restricoes_no_pedido(pedido)
+
+        self.assertEqual(sorted(p.itens.get().produto_id for p in criados), sorted(p.id for p in produtos))
+        self.assertEqual([p.nf for p in criados], [900, 900])
+        for grupo in pedido.grupos_restricao.all():
+            self.assertEqual(set(grupo.itens.values_list("produto__familia_id", flat=True)), set(grupo.familias.values_list("id", flat=True)))
+
+    def test_coloracao_exata_e_valida_e_minima_contra_forca_bruta(self):
+        def valida(adjacencia, cores):
+            return all(cores[i] != cores[j] for i, mascara in enumerate(adjacencia) for j in range(len(adjacencia)) if mascara >> j & 1)
+
+        def numero_cromatico(adjacencia):
+            n = len(adjacencia)
+            return next(k for k in range(1, n + 1) if any(valida(adjacencia, c) for c in itertools.product(range(k), repeat=n)))
+
+        rng = random.Random(5)
+        grafos = [[4, 72, 65, 18, 40, 80, 38]]  # contem um ciclo impar de 5: precisa de 3 cores
+        for _ in range(150):
+            n = rng.randint(2, 7)
+            adjacencia = [0] * n
+            for i, j in itertools.combinations(range(n), 2):
+                if rng.random() < 0.5:
+                    adjacencia[i] |= 1 << j
+                    adjacencia[j] |= 1 << i
+            grafos.append(adjacencia)
+        for adjacencia in grafos:
+            cores = particionamento.coloracao_exata(adjacencia)
+            self.assertTrue(valida(adjacencia, cores), adjacencia)
+            self.assertEqual(max(cores) + 1, numero_cromatico(adjacencia), adjacencia)
+
+        # Ciclo F1 x F2 x ... x F5 x F1 entre familias: tres grupos, nenhum com par restrito.
+        ciclo = [Familia.objects.create(nome=f"F{i}") for i in range(1, 6)]
+        for a, b in zip(ciclo, ciclo[1:] + ciclo[:1]):
+            RestricaoFamilia.objects.create(familia_origem=a, familia_restrita=b)
+        atribuicoes, total = particionamento.particionar_familias(f.id for f in ciclo)
+        self.assertEqual(total, 3)
+        for grupo in range(total):
+            self.assertEqual(obter_grafo().pares_em_conflito(f for f, g in atribuicoes.items() if g == grupo), [])
+
+    def test_particao_minima_e_memorizada_por_versao_do_grafo(self):
+        # Grafo coroa (u_i x v_j para i != j): bipartido, mas a ordem gulosa pode gastar 3 cores.
+        lado_u = [Familia.objects.create(nome=f"U{i}") for i in range(3)]
+        lado_v = [Familia.objects.create(nome=f"V{i}") for i in range(3)]
+        for i, u in enumerate(lado_u):
+            for j, v in enumerate(lado_v):
+                if i != j:
+                    RestricaoFamilia.objects.create(familia_origem=u, familia_restrita=v)
+        familias = [f.id for f in lado_u + lado_v] + [self.racao.id]
+
+        with mock.patch.object(particionamento, "_colorir", wraps=particionamento._colorir) as colorir:
+            atribuicoes, total = particionamento.particionar_familias(familias)
+            self.assertEqual(particionamento.particionar_familias(reversed(familias)), (atribuicoes, total))
+            self.assertEqual(colorir.call_count, 1)
+
+            self.assertEqual(total, 2)
+            grafo = obter_grafo()
+            for origem, restrita in grafo.pares_em_conflito(familias):
+                self.assertNotEqual(atribuicoes[origem], atribuicoes[restrita])
+
+            RestricaoFamilia.objects.create(familia_origem=self.racao, familia_restrita=lado_u[0])
+            particionamento.particionar_familias(familias)
+            self.assertEqual(colorir.call_count, 2)
+
 
 class PedidoRestricoesTests(TestCase):
     def setUp(self):
@@ -114,3 +787,343 @@ class PedidoRestricoesTests(TestCase):
         self.assertTrue(body.get("dividido"))
         self.assertEqual(body.get("nf"), 777)
         self.assertEqual(Pedido.objects.filter(nf=777).count(), 2)
+
+    def test_analise_em_lote_resolve_produtos_em_uma_consulta(self):
+        self.client.force_authenticate(user=User.objects.create(name="ERP", email="erp@example.com"))
+        conflito = self._payload()["itens"]
+        simples = [{"produto_id": self.produto_outros.id, "quantidade": 1}]
+        pedidos = [{"nf": nf, "itens": conflito if nf % 2 else simples} for nf in range(30)]
+        pedidos.append({"nf": 99, "itens": [{"produto_id": 999999, "quantidade": 1}]})
+        obter_grafo()
+
+        with self.assertNumQueries(1):
+            resp = self.client.post(reverse("pedido-admin-analisar-restricoes"), {"pedidos": pedidos}, format="json")
+        self.assertEqual(resp.status_code, 200)
+        dados = resp.json()["data"]
+        self.assertEqual((dados["total_pedidos"], dados["total_com_conflito"], dados["total_com_erro"]), (31, 15, 1))
+
+        individual = analisar_restricoes_para_itens_payload(conflito)
+        self.assertEqual({k: dados["analises"][1][k] for k in individual}, individual)
+        self.assertFalse(dados["analises"][0]["possui_conflito"])
+        self.assertEqual(dados["analises"][-1]["erro"]["codigo"], "produto_nao_encontrado")
+
+    def test_listagem_de_pedidos_tem_consultas_constantes(self):
+        self.client.force_authenticate(user=User.objects.create(name="Listagem", email="listagem@example.com"))
+        rota = Rota.objects.create(data_rota="2024-05-02", capacidade_max=1000)
+        for nf in range(20):
+            pedido = Pedido.objects.create(nf=nf, dtpedido="2024-05-01", latitude=-27, longitude=-53)
+            pedido.itens.create(produto=self.produto_agro, quantidade=nf + 1)
+            pedido.itens.create(produto=self.produto_outros, quantidade=2)
+            if nf % 3 == 0:
+                aplicar_restricoes_no_pedido(pedido)
+                RotaPedido.objects.create(rota=rota, pedido=pedido, ordem_entrega=nf, grupo_restricao=pedido.grupos_restricao.first())
+
+        url = reverse("pedido-list")
+        for limite in (2, 20):
+            with CaptureQueriesContext(connection) as consultas:
+                resp = self.client.get(url, {"limit": limite, "familias": f"{self.familia_agro.id},{self.familia_outros.id}"})
+            self.assertEqual(len(resp.json()["data"]["results"]), limite)
+            self.assertLessEqual(len(consultas), 8)
+
+        # Mesmo conteudo do serializer sem anotacoes nem prefetch.
+        esperado = json.loads(json.dumps(PedidoSerializer(Pedido.objects.all(), many=True).data, cls=JSONEncoder))
+        obtido = resp.json()["data"]["results"]
+        self.assertEqual(sorted(obtido, key=lambda p: p["id"]), sorted(esperado, key=lambda p: p["id"]))
+
+    def test_totais_do_pedido_sao_mantidos_nas_escritas_e_reparados_pelo_comando(self):
+        self.client.force_authenticate(user=User.objects.create(name="Totais", email="totais@example.com"))
+        payload = self._payload()
+        payload["itens"] = [{"produto_id": self.produto_agro.id, "quantidade": 3}]
+        resp = self.client.post(self.pedidos_url, data=payload, format="json")
+        self.assertEqual(resp.status_code, 201)
+        pedido = Pedido.objects.get(nf=777)
+        self.assertEqual((pedido.peso_total, pedido.volume_total, pedido.total_itens), (3, 3, 3))
+
+        divididos = dividir_pedido_validado({**self._payload(), "nf": 778}, None)
+        self.assertEqual(sorted(p.peso_total for p in divididos), [2, 3])
+        self.assertEqual(sorted(Pedido.objects.filter(nf=778).values_list("total_itens", flat=True)), [2, 3])
+
+        self.produto_agro.peso = 2
+        self.produto_agro.save()
+        pedido.refresh_from_db()
+        self.assertEqual(pedido.peso_total, 6)
+        self.assertEqual(self.client.get(reverse("pedido-list"), {"peso_min": 5}).json()["data"]["count"], 2)
+
+        Pedido.objects.filter(pk=pedido.pk).update(peso_total=0, total_itens=0)
+        call_command("recalcular_totais_pedidos", stdout=io.StringIO())
+        pedido.refresh_from_db()
+        self.assertEqual((pedido.peso_total, pedido.total_itens), (6, 3))
+
+        # Editar o pedido a partir de uma instancia lida antes do recalculo nao regrava totais antigos.
+        ProdutoPedido.objects.filter(pedido=pedido).update(quantidade=4)
+        recalcular_totais(pedido_ids=[pedido.pk])
+        serializer = PedidoCreateSerializer(pedido, data={"cliente": "Cliente novo"}, partial=True)
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        serializer.save()
+        pedido.refresh_from_db()
+        self.assertEqual((pedido.cliente, pedido.peso_total, pedido.total_itens), ("Cliente novo", 8, 4))
+
+        # Salvar o produto sem mudar peso/volume nao recalcula; apagar zera os itens em cascata.
+        produto = Produto.objects.get(pk=self.produto_agro.pk)
+        with self.assertNumQueries(2):
+            produto.save()
+        self.produto_agro.delete()
+        pedido.refresh_from_db()
+        self.assertEqual((pedido.peso_total, pedido.total_itens), (0, 0))
+
+    def test_importacao_em_lote_divide_conflitos_e_reporta_erros_por_linha(self):
+        self.client.force_authenticate(user=User.objects.create(name="Importador", email="importador@example.com"))
+        Pedido.objects.create(nf=500, dtpedido="2024-05-01", latitude=-27, longitude=-53)
+        linhas = ["nf;cliente;cidade;dtpedido;latitude;longitude;observacao;produto_id;quantidade"]
+        for nf in range(1000, 1040):
+            linhas.append(f"{nf};Cliente {nf};Ijui;01/05/2024;-27,1;-53,9;;{self.produto_outros.id};2")
+        linhas += [
+            f"777;Fazenda Modelo;Ijui;2024-05-01;-27;-53;;{self.produto_agro.id};3",
+            f"777;Fazenda Modelo;Ijui;2024-05-01;-27;-53;;{self.produto_outros.id};2",
+            f"500;Ja existe;Ijui;2024-05-01;-27;-53;;{self.produto_agro.id};1",
+            f"1000;Repetida;Ijui;2024-05-01;-27;-53;;{self.produto_agro.id};1",
+            f"901;Data ruim;Ijui;31/02/2024;-27;-53;;{self.produto_agro.id};1",
+            "902;Sem produto;Ijui;2024-05-01;-27;-53;;999999;1",
+        ]
+        arquivo = SimpleUploadedFile("pedidos.csv", "\n".join(linhas).encode("utf-8"), content_type="text/csv")
+
+        with CaptureQueriesContext(connection) as consultas:
+            resp = self.client.post(reverse("pedido-admin-importar"), {"arquivo": arquivo}, format="multipart")
+        self.assertEqual(resp.status_code, 201)
+        # NFs, produtos, grafo, savepoint, pedidos e itens: nao cresce com o numero de linhas.
+        self.assertLessEqual(len(consultas), 8)
+
+        resumo = resp.json()["data"]
+        self.assertEqual((resumo["pedidos_lidos"], resumo["pedidos_importados"], resumo["pedidos_criados"]), (45, 41, 42))
+        self.assertEqual(resumo["pedidos_divididos"], 1)
+        self.assertEqual(
+            [(erro["linha"], erro["codigo"]) for erro in resumo["erros"]],
+            [(45, "nf_duplicada_no_arquivo"), (46, "campo_invalido"), (44, "nf_ja_cadastrada"), (47, "produto_nao_encontrado")],
+        )
+        divididos = Pedido.objects.filter(nf=777)
+        self.assertEqual(sorted(p.itens.get().produto_id for p in divididos), sorted([self.produto_agro.id, self.produto_outros.id]))
+        self.assertEqual(Pedido.objects.get(nf=1039).itens.get().quantidade, 2)
+
+    def test_divisao_com_particao_invalida_e_recusada_antes_de_gravar(self):
+        # Particao quebrada: as duas familias incompativeis no mesmo grupo.
+        invalida = ({self.familia_agro.id: 0, self.familia_outros.id: 0}, 2)
+        linhas = [
+            "nf;dtpedido;latitude;longitude;produto_id;quantidade",
+            f"600;2024-05-01;-27;-53;{self.produto_agro.id};1",
+            f"600;2024-05-01;-27;-53;{self.produto_outros.id};1",
+        ]
+        with mock.patch("logistics.services.restricoes.particionar_familias", return_value=invalida), mock.patch(
+            "logistics.services.importacao.particionar_familias", return_value=invalida
+        ):
+            with self.assertRaisesMessage(ValidationError, "Divisão inválida"):
+                dividir_pedido_validado({**self._payload(), "nf": 599})
+            resumo = importar_pedidos(ler_registros_csv(linhas))
+
+        self.assertEqual([erro["codigo"] for erro in resumo["erros"]], ["divisao_invalida"])
+        self.assertFalse(Pedido.objects.filter(nf__in=[599, 600]).exists())
+
+    def test_importacao_vincula_itens_aos_pedidos_sem_returning_do_banco(self):
+        linhas = ["nf;cliente;dtpedido;latitude;longitude;produto_id;quantidade"]
+        linhas += [f"{nf};Cliente {nf};2024-05-01;-27;-53;{self.produto_outros.id};{nf - 1000}" for nf in range(1001, 1011)]
+        linhas += [f"777;Fazenda;2024-05-01;-27;-53;{produto.id};3" for produto in (self.produto_agro, self.produto_outros)]
+
+        # Como no MySQL: sem PKs no INSERT em lote, recuperadas com uma consulta por lote.
+        with mock.patch.object(type(connection.features), "can_return_rows_from_bulk_insert", False):
+            with CaptureQueriesContext(connection) as consultas:
+                resumo = importar_pedidos(ler_registros_csv(linhas), tamanho_lote=6)
+        inserts = [q["sql"] for q in consultas if q["sql"].startswith('INSERT INTO "logistics_pedido"')]
+        self.assertEqual(len(inserts), 2)
+
+        self.assertEqual((resumo["pedidos_importados"], resumo["pedidos_criados"]), (11, 12))
+        for nf in range(1001, 1011):
+            self.assertEqual(Pedido.objects.get(nf=nf).itens.get().quantidade, nf - 1000)
+        self.assertEqual(
+            sorted(p.itens.get().produto_id for p in Pedido.objects.filter(nf=777)),
+            sorted([self.produto_agro.id, self.produto_outros.id]),
+        )
+
+
+@override_settings(LOGISTICS_EXECUCOES_ASSINCRONAS=False)
+class OtimizacaoExecucaoTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.usuario = User.objects.create(name="Operador", email="operador@example.com")
+        self.client.force_authenticate(user=self.usuario)
+        rng = random.Random(3)
+        self.pedidos = [
+            Pedido.objects.create(
+                nf=100 + idx,
+                dtpedido="2024-05-01",
+                latitude=round(-27.0 + rng.uniform(-0.5, 0.5), 6),
+                longitude=round(-53.0 + rng.uniform(-0.5, 0.5), 6),
+            )
+            for idx in range(8)
+        ]
+
+    def test_estatisticas_da_rota_acompanham_os_vinculos_e_o_status(self):
+        produto = Produto.objects.create(nome="Saco", peso=2, familia=Familia.objects.create(nome="Graos"))
+        ProdutoPedido.objects.bulk_create(ProdutoPedido(pedido=p, produto=produto, quantidade=5) for p in self.pedidos)
+        recalcular_totais()
+        ids = [p.id for p in self.pedidos]
+
+        resp = self.client.post(
+            reverse("salvar-rota-otimizada"),
+            {"data_rota": "2024-05-02", "capacidade_max": 500, "pedidos_ordem": ids[:3]},
+            format="json",
+        )
+        rota = Rota.objects.get(pk=resp.json()["data"]["rota_id"])
+        self.assertEqual((rota.total_pedidos, rota.pedidos_entregues, rota.peso_total_pedidos), (3, 0, 30))
+
+        self.client.post(reverse("atribuir-pedidos-rota"), {"rota_id": rota.id, "pedidos_ids": ids[3:5]}, format="json")
+        self.client.patch(reverse("rota-admin-detail", args=[rota.id]), {"status": "CONCLUIDA"}, format="json")
+        rota.refresh_from_db()
+        self.assertEqual((rota.total_pedidos, rota.pedidos_entregues, rota.percentual_entrega), (5, 5, 100))
+
+        self.client.post(reverse("remover-pedido-rota", args=[ids[0]]))
+        ProdutoPedido.objects.filter(pedido_id=ids[1]).update(quantidade=10)
+        recalcular_totais(pedido_ids=[ids[1]])
+        rota.refresh_from_db()
+        self.assertEqual((rota.total_pedidos, rota.pedidos_entregues, rota.peso_total_pedidos), (4, 4, 50))
+
+        self.client.post(reverse("rota-admin-list"), {"data_rota": "2024-05-03", "capacidade_max": 100, "pedidos_ids": ids[5:]}, format="json")
+        with self.assertNumQueries(2):
+            dados = self.client.get(reverse("rota-list"), {"limit": 10}).json()["data"]["results"]
+        self.assertEqual(sorted(r["total_pedidos"] for r in dados), [3, 4])
+
+    def test_comando_repara_estatisticas_sem_update_com_subconsulta_na_propria_rota(self):
+        rotas = [Rota.objects.create(data_rota="2024-05-02", capacidade_max=100) for _ in range(3)]
+        RotaPedido.objects.bulk_create(
+            RotaPedido(rota=rotas[i % 3], pedido=p, ordem_entrega=i) for i, p in enumerate(self.pedidos, start=1)
+        )
+        with CaptureQueriesContext(connection) as consultas:
+            call_command("recalcular_totais_pedidos", "--lote", "2", stdout=io.StringIO())
+
+        self.assertEqual(sorted(Rota.objects.values_list("total_pedidos", flat=True)), [2, 3, 3])
+        # MySQL recusa UPDATE cuja subconsulta le a mesma tabela (erro 1093).
+        updates = [q["sql"] for q in consultas if q["sql"].startswith('UPDATE "logistics_rota"')]
+        self.assertEqual(len(updates), 2)
+        self.assertFalse(any('FROM "logistics_rota"' in sql for sql in updates))
+
+    def test_exclusao_de_pedidos_no_admin_atualiza_estatisticas_da_rota(self):
+        rota = Rota.objects.create(data_rota="2024-05-02", capacidade_max=100)
+        RotaPedido.objects.bulk_create(
+            RotaPedido(rota=rota, pedido=p, ordem_entrega=i) for i, p in enumerate(self.pedidos, start=1)
+        )
+        recalcular_estatisticas_rotas(rota_ids=[rota.id])
+        pedido_admin = admin.site._registry[Pedido]
+
+        pedido_admin.delete_model(None, self.pedidos[0])
+        rota.refresh_from_db()
+        self.assertEqual(rota.total_pedidos, 7)
+
+        pedido_admin.delete_queryset(None, Pedido.objects.filter(id__in=[p.id for p in self.pedidos[1:4]]))
+        rota.refresh_from_db()
+        self.assertEqual(rota.total_pedidos, 4)
+
+    def test_atribuicao_de_pedidos_insere_em_lote_e_ignora_vinculos_existentes(self):
+        rotas = [Rota.objects.create(data_rota="2024-05-02", capacidade_max=100) for _ in range(2)]
+        ids = [p.id for p in self.pedidos]
+        obter_grafo()  # compilado antes, para nao contar a consulta do grafo so na primeira chamada
+
+        consultas = []
+        for rota, lote in ((rotas[0], ids[:2]), (rotas[1], ids)):
+            with CaptureQueriesContext(connection) as contexto:
+                resp = self.client.post(reverse("atribuir-pedidos-rota"), {"rota_id": rota.id, "pedidos_ids": lote}, format="json")
+            self.assertEqual(resp.status_code, 200)
+            consultas.append(len(contexto))
+        self.assertEqual(consultas[0], consultas[1])
+
+        resp = self.client.post(
+            reverse("atribuir-pedidos-rota"), {"rota_id": rotas[0].id, "pedidos_ids": ids[:5] + ids[4:5]}, format="json"
+        )
+        self.assertEqual(resp.json()["data"]["mensagem"], f"3 pedidos atribuidos a rota {rotas[0].id}.")
+        ordens = list(RotaPedido.objects.filter(rota=rotas[0]).order_by("ordem_entrega").values_list("pedido_id", flat=True))
+        self.assertEqual(ordens, ids[:5])
+
+    def test_listagem_de_rotas_compacta_com_fields_e_expand(self):
+        rota = Rota.objects.create(data_rota="2024-05-02", capacidade_max=100)
+        RotaPedido.objects.bulk_create(
+            RotaPedido(rota=rota, pedido=p, ordem_entrega=i) for i, p in enumerate(self.pedidos, start=1)
+        )
+
+        compacta = self.client.get(reverse("rota-list")).json()["data"]["results"][0]
+        self.assertNotIn("pedidos", compacta)
+        self.assertNotIn("trajetos", compacta)
+        self.assertIn("percentual_entrega", compacta)
+
+        with self.assertNumQueries(3):
+            resp = self.client.get(reverse("rota-list"), {"expand": "pedidos", "fields": "id,status"})
+        dados = resp.json()["data"]["results"][0]
+        self.assertEqual(set(dados), {"id", "status", "pedidos"})
+        self.assertEqual(len(dados["pedidos"]), len(self.pedidos))
+
+        detalhe = self.client.get(reverse("rota-detail", args=[rota.id])).json()["data"]
+        self.assertIn("pedidos", detalhe)
+        self.assertIn("trajetos", detalhe)
+
+        with self.assertNumQueries(2):
+            resp = self.client.get(reverse("pedido-list"), {"fields": "id,nf,peso_total"})
+        self.assertEqual(set(resp.json()["data"]["results"][0]), {"id", "nf", "peso_total"})
+
+    def test_otimizacao_registra_execucao_e_alimenta_estatisticas(self):
+        resp = self.client.post(
+            reverse("otimizar-rota-genetico"),
+            data={
+                "pedidos_ids": [p.id for p in self.pedidos],
+                "deposito": {"latitude": -27.0, "longitude": -53.0},
+                "parametros": {"usar_osrm": False, "seed": 5, "num_geracoes": 20, "algoritmo": "tabu"},
+            },
+            format="json",
+        )
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json()["data"]["algoritmo"], "tabu")
+
+        execucao = OtimizacaoExecucao.objects.get()
+        self.assertEqual(execucao.usuario, self.usuario)
+        self.assertEqual((execucao.num_pedidos, execucao.num_paradas), (8, 8))
+        self.assertEqual((execucao.algoritmo, execucao.metrica, execucao.seed), ("tabu", "haversine", 5))
+        self.assertEqual(set(execucao.tempos_fases), {"preparacao", "matriz", "busca", "montagem"})
+        self.assertGreater(execucao.distancia_km, 0)
+
+        resp = self.client.get(reverse("otimizacoes-estatisticas"))
+        self.assertEqual(resp.status_code, 200)
+        faixas = resp.json()["data"]["faixas"]
+        self.assertEqual([f["faixa"] for f in faixas], ["ate_25"])
+        self.assertEqual(faixas[0]["total_execucoes"], 1)
+        self.assertEqual(faixas[0]["latencia_s"]["p99"], execucao.tempo_total_s)
+        self.assertEqual(len(resp.json()["data"]["tendencia_diaria"]), 1)
+
+    def test_cancelamento_devolve_melhor_rota_ate_o_momento(self):
+        # Sem execucao em andamento o pedido e recusado e nao afeta uma execucao futura com o mesmo id.
+        resp = self.client.delete(reverse("cancelar-otimizacao", args=["plano-42"]))
+        self.assertEqual(resp.status_code, 404)
+
+        payload = {
+            "pedidos_ids": [p.id for p in self.pedidos],
+            "deposito": {"latitude": -27.0, "longitude": -53.0},
+            "parametros": {"usar_osrm": False, "seed": 5, "num_geracoes": 500},
+            "execucao_id": "plano-42",
+        }
+        respostas = []
+        otimizar_original = otimizacao_views.otimizar_rota_pedidos
+
+        def cancelar_durante(*args, **kwargs):
+            respostas.append(self.client.delete(reverse("cancelar-otimizacao", args=["plano-42"])))
+            respostas.append(self.client.post(reverse("otimizar-rota-genetico"), data=payload, format="json"))
+            return otimizar_original(*args, **kwargs)
+
+        with mock.patch.object(otimizacao_views, "otimizar_rota_pedidos", side_effect=cancelar_durante):
+            resp = self.client.post(reverse("otimizar-rota-genetico"), data=payload, format="json")
+
+        self.assertEqual([r.status_code for r in respostas], [202, 409])
+        self.assertEqual(resp.status_code, 200)
+        data = resp.json()["data"]
+        self.assertTrue(data["cancelado"])
+        self.assertEqual(data["resultado"]["criterio_parada"], "cancelado")
+        self.assertEqual(data["num_geracoes"], 1)
+        self.assertEqual(sorted(data["resultado"]["pedidos_ordem"]), sorted(p.id for p in self.pedidos))
+
+        # Encerrada a execucao, o id volta a ficar livre e sem pedido de cancelamento pendente.
+        payload["parametros"]["num_geracoes"] = 20
+        resp = self.client.post(reverse("otimizar-rota-genetico"), data=payload, format="json")
+        self.assertFalse(resp.json()["data"]["cancelado"])
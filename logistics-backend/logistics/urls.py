@@ -3,7 +3,9 @@ from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
 from .otimizacao_views import (
+    CancelarOtimizacaoView,
     CompararAlgoritmosView,
+    EstatisticasOtimizacaoView,
     GerarRelatorioRotaPDFView,
     OtimizarRotaGeneticoView,
     SalvarRotaOtimizadaView,
@@ -43,6 +45,12 @@ urlpatterns = [
     path("pedidos/<int:pedido_id>/remover-rota/", RemoverPedidoRotaView.as_view(), name="remover-pedido-rota"),
     path("dashboard/resumo/", DashboardResumoView.as_view(), name="dashboard-resumo"),
     path("otimizar-rota-genetico/", OtimizarRotaGeneticoView.as_view(), name="otimizar-rota-genetico"),
+    path(
+        "otimizar-rota-genetico/<str:execucao_id>/",
+        CancelarOtimizacaoView.as_view(),
+        name="cancelar-otimizacao",
+    ),
+    path("otimizacoes/estatisticas/", EstatisticasOtimizacaoView.as_view(), name="otimizacoes-estatisticas"),
     path("salvar-rota-otimizada/", SalvarRotaOtimizadaView.as_view(), name="salvar-rota-otimizada"),
     path("comparar-algoritmos/", CompararAlgoritmosView.as_view(), name="comparar-algoritmos"),
     path("rotas/relatorio-pdf/", GerarRelatorioRotaPDFView.as_view(), name="relatorio-rota-pdf"),
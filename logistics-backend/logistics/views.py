@@ -1,9 +1,11 @@
 # logistics/views.py
 from datetime import datetime
+import codecs
 import io
 
 from django.core.exceptions import ValidationError
-from django.db.models import Max, Sum, Q
+from django.db import transaction
+from django.db.models import Count, Max, Sum, Q
 from django.http import HttpResponse
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
@@ -17,6 +19,7 @@ from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer, Table, Tabl
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
 from rest_framework.exceptions import PermissionDenied
+from rest_framework.parsers import FormParser, MultiPartParser
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
@@ -26,8 +29,9 @@ from accounts.constants import ADMIN_PROFILE_NAME
 from .filters import FamiliaFilter, PedidoFilter, ProdutoFilter
 from .ia.genetic_algorithm import calcular_distancia, otimizar_rota_pedidos
 from .constants import DEFAULT_DEPOSITO
-from .models import Familia, Pedido, PedidoRestricaoGrupo, Produto, RestricaoFamilia, Rota, RotaPedido
+from .models import Familia, Pedido, Produto, RestricaoFamilia, Rota, RotaPedido
 from .serializers import (
+    AnaliseRestricoesLoteSerializer,
     FamiliaSerializer,
     PedidoCreateSerializer,
     PedidoSerializer,
@@ -36,12 +40,16 @@ from .serializers import (
     RotaCreateSerializer,
     RotaSerializer,
 )
+from .services.importacao import FORMATOS as FORMATOS_IMPORTACAO, importar_pedidos, ler_registros
+from .services.totais import recalcular_estatisticas_rotas
 from .services.restricoes import (
+    analisar_restricoes_em_lote,
     analisar_restricoes_para_itens_payload,
+    carregar_vinculos_em_lote,
     coletar_familias_da_rota,
     dividir_pedido_validado,
+    listar_conflitos_em_rota,
     normalizar_payload_pedidos,
-    validar_novos_vinculos_em_rota,
 )
 
 
@@ -58,6 +66,13 @@ class FamiliaViewSet(viewsets.ModelViewSet):
     ordering_fields = ["nome", "created_at"]
     http_method_names = ["get", "post", "put", "patch", "head", "options"]
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if "total_produtos" in FamiliaSerializer.campos_selecionados(self.get_serializer_context()):
+            # Uma contagem agregada no lugar de um COUNT por familia em get_total_produtos.
+            queryset = queryset.annotate(total_produtos_anotado=Count("produtos", filter=Q(produtos__ativo=True)))
+        return queryset
+
 
 class RestricaoFamiliaViewSet(viewsets.ModelViewSet):
     queryset = RestricaoFamilia.objects.select_related("familia_origem", "familia_restrita").order_by("familia_origem__nome")
@@ -89,6 +104,10 @@ class PedidoViewSet(viewsets.ReadOnlyModelViewSet):
     filter_backends = [DjangoFilterBackend]
     filterset_class = PedidoFilter
 
+    def get_queryset(self):
+        campos = PedidoSerializer.campos_selecionados(self.get_serializer_context())
+        return PedidoSerializer.preparar_queryset(super().get_queryset(), campos)
+
 
 # ====================================================
 # ViewSet para Rotas
@@ -97,6 +116,14 @@ class RotaViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Rota.objects.all()
     serializer_class = RotaSerializer
 
+    def get_serializer_context(self):
+        # Listagem compacta (pedidos/trajetos via ?expand=); o detalhe traz tudo.
+        return {**super().get_serializer_context(), "expandir_tudo": self.action == "retrieve"}
+
+    def get_queryset(self):
+        campos = RotaSerializer.campos_selecionados(self.get_serializer_context())
+        return RotaSerializer.preparar_queryset(super().get_queryset(), campos)
+
 
 # ====================================================
 # CRUD de Pedidos e Rotas
@@ -105,6 +132,13 @@ class PedidoCreateViewSet(viewsets.ModelViewSet):
     queryset = Pedido.objects.all()
     serializer_class = PedidoCreateSerializer
 
+    def perform_destroy(self, instance):
+        # Os RotaPedido do pedido caem em cascata: as rotas afetadas perdem a parada e a carga.
+        with transaction.atomic():
+            rota_ids = set(instance.rotas.values_list("rota_id", flat=True))
+            instance.delete()
+            recalcular_estatisticas_rotas(rota_ids=rota_ids)
+
     @action(detail=False, methods=["post"], url_path="dividir")
     def dividir(self, request, *args, **kwargs):
         context = {**self.get_serializer_context(), "allow_family_conflicts": True}
@@ -130,6 +164,64 @@ class PedidoCreateViewSet(viewsets.ModelViewSet):
             status=status.HTTP_201_CREATED,
         )
 
+    @action(detail=False, methods=["post"], url_path="analisar-restricoes")
+    def analisar_restricoes(self, request, *args, **kwargs):
+        """
+        Pre-validacao de varios pedidos de uma vez: devolve, na ordem recebida, a mesma
+        analise do cadastro (`possui_conflito`, `grupos`...) sem gravar nada.
+        """
+        serializer = AnaliseRestricoesLoteSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        pedidos = serializer.validated_data["pedidos"]
+        analises = analisar_restricoes_em_lote([pedido["itens"] for pedido in pedidos])
+        resultado = [
+            {"indice": indice, "nf": pedido.get("nf"), **analise}
+            for indice, (pedido, analise) in enumerate(zip(pedidos, analises))
+        ]
+        return Response(
+            {
+                "total_pedidos": len(resultado),
+                "total_com_conflito": sum(1 for analise in analises if analise["possui_conflito"]),
+                "total_com_erro": sum(1 for analise in analises if analise.get("erro")),
+                "analises": resultado,
+            }
+        )
+
+    @action(detail=False, methods=["post"], url_path="importar", parser_classes=[MultiPartParser, FormParser])
+    def importar(self, request, *args, **kwargs):
+        """
+        Importa o arquivo `arquivo` (CSV com uma linha por item ou JSON Lines com um pedido
+        por linha) em lotes. `dividir=false` rejeita pedidos com familias incompativeis em vez
+        de dividi-los; `simular=true` valida tudo sem gravar.
+        """
+        arquivo = request.FILES.get("arquivo")
+        if not arquivo:
+            return Response({"detail": "Envie o arquivo no campo 'arquivo'."}, status=status.HTTP_400_BAD_REQUEST)
+        formato = (request.data.get("formato") or arquivo.name.rsplit(".", 1)[-1]).lower()
+        if formato not in FORMATOS_IMPORTACAO:
+            return Response(
+                {"detail": f"Formato inválido. Use: {', '.join(FORMATOS_IMPORTACAO)}."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        # O upload e lido linha a linha: o arquivo inteiro nunca fica em memoria como texto.
+        linhas = codecs.iterdecode(arquivo, "utf-8-sig")
+        try:
+            resumo = importar_pedidos(
+                ler_registros(linhas, formato),
+                usuario_id=request.user.id if request.user.is_authenticated else None,
+                dividir_conflitos=str(request.data.get("dividir", "true")).lower() not in ("false", "0"),
+                simular=str(request.data.get("simular", "false")).lower() in ("true", "1"),
+            )
+        except UnicodeDecodeError:
+            # Lotes anteriores ao trecho invalido ja foram gravados; o cliente reenvia o restante.
+            return Response(
+                {"detail": "Arquivo deve estar em UTF-8."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        criou = resumo["pedidos_criados"] and not resumo["simulado"]
+        return Response(resumo, status=status.HTTP_201_CREATED if criou else status.HTTP_200_OK)
+
 
 class RotaCreateViewSet(viewsets.ModelViewSet):
     queryset = Rota.objects.all()
@@ -180,6 +272,7 @@ class RotaCreateViewSet(viewsets.ModelViewSet):
         self._ensure_delete_allowed(request, rota)
         return super().destroy(request, *args, **kwargs)
 
+    @transaction.atomic
     def perform_update(self, serializer):
         rota_anterior = serializer.instance
         status_anterior = rota_anterior.status if rota_anterior else None
@@ -191,6 +284,9 @@ class RotaCreateViewSet(viewsets.ModelViewSet):
             rota.pedidos.update(entregue=True, data_entrega=timezone.now())
         elif status_anterior == "CONCLUIDA":
             rota.pedidos.update(entregue=False, data_entrega=None)
+        else:
+            return
+        recalcular_estatisticas_rotas(rota_ids=[rota.id])
 
 
 class AtribuirPedidosRotaView(APIView):
@@ -209,48 +305,43 @@ class AtribuirPedidosRotaView(APIView):
         except ValidationError as exc:
             return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
 
-        pedidos_ids = [p["pedido_id"] for p in pedidos_normalizados]
-        pedidos_map = {p.id: p for p in Pedido.objects.filter(id__in=pedidos_ids)}
-        if len(set(pedidos_ids)) != len(pedidos_map):
-            return Response({"detail": "Alguns pedidos nao foram encontrados."}, status=status.HTTP_400_BAD_REQUEST)
-
-        vinculos = []
-        for entry in pedidos_normalizados:
-            pedido = pedidos_map[entry["pedido_id"]]
-            grupo = None
-            grupo_id = entry.get("grupo_restricao_id")
-            if grupo_id:
-                grupo = get_object_or_404(PedidoRestricaoGrupo, pk=grupo_id, pedido=pedido)
-            elif pedido.grupos_restricao.filter(ativo=True).exists():
-                return Response(
-                    {"detail": f"Pedido {pedido.id} foi repartido. Informe o grupo antes de adicionar na rota."},
-                    status=status.HTTP_400_BAD_REQUEST,
-                )
-            vinculos.append((pedido, grupo))
+        vinculos, erros = carregar_vinculos_em_lote(pedidos_normalizados)
+        codigos = {erro["codigo"] for erro in erros}
+        if "pedido_nao_encontrado" in codigos:
+            return Response(
+                {"detail": "Alguns pedidos nao foram encontrados.", "erros": erros},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if "grupo_invalido" in codigos:
+            return Response(
+                {"detail": ", ".join(erro["mensagem"] for erro in erros), "erros": erros},
+                status=status.HTTP_404_NOT_FOUND,
+            )
 
-        familias_existentes = coletar_familias_da_rota(rota)
-        try:
-            validar_novos_vinculos_em_rota(vinculos, familias_iniciais=familias_existentes)
-        except ValidationError as exc:
-            mensagem = ", ".join(exc.messages) if hasattr(exc, "messages") else str(exc)
-            return Response({"detail": mensagem}, status=status.HTTP_400_BAD_REQUEST)
-
-        ultima_ordem = RotaPedido.objects.filter(rota=rota).aggregate(Max("ordem_entrega")).get("ordem_entrega__max") or 0
-        criados = 0
-        for idx, (pedido, grupo) in enumerate(vinculos, start=1):
-            if RotaPedido.objects.filter(
-                rota=rota,
-                pedido=pedido,
-                grupo_restricao=grupo,
-            ).exists():
-                continue
-            RotaPedido.objects.create(
-                rota=rota,
-                pedido=pedido,
-                grupo_restricao=grupo,
-                ordem_entrega=ultima_ordem + idx,
+        erros.extend(listar_conflitos_em_rota(vinculos, familias_iniciais=coletar_familias_da_rota(rota)))
+        if erros:
+            return Response(
+                {"detail": ", ".join(erro["mensagem"] for erro in erros), "erros": erros},
+                status=status.HTTP_400_BAD_REQUEST,
             )
-            criados += 1
+
+        with transaction.atomic():
+            ultima_ordem = RotaPedido.objects.filter(rota=rota).aggregate(Max("ordem_entrega")).get("ordem_entrega__max") or 0
+            # Vinculos ja existentes na rota carregados de uma vez; o resto entra em um unico INSERT.
+            existentes = set(RotaPedido.objects.filter(rota=rota).values_list("pedido_id", "grupo_restricao_id"))
+            novos = []
+            for idx, (pedido, grupo) in enumerate(vinculos, start=1):
+                chave = (pedido.id, grupo.id if grupo else None)
+                if chave in existentes:
+                    continue
+                existentes.add(chave)
+                novos.append(
+                    RotaPedido(rota=rota, pedido=pedido, grupo_restricao=grupo, ordem_entrega=ultima_ordem + idx)
+                )
+            RotaPedido.objects.bulk_create(novos)
+            criados = len(novos)
+            if criados:
+                recalcular_estatisticas_rotas(rota_ids=[rota.id])
 
         return Response(
             {
@@ -266,7 +357,11 @@ class RemoverPedidoRotaView(APIView):
 
     def post(self, request, pedido_id):
         pedido = get_object_or_404(Pedido, pk=pedido_id)
-        removidos, _ = RotaPedido.objects.filter(pedido=pedido).delete()
+        with transaction.atomic():
+            vinculos = RotaPedido.objects.filter(pedido=pedido)
+            rota_ids = set(vinculos.values_list("rota_id", flat=True))
+            removidos, _ = vinculos.delete()
+            recalcular_estatisticas_rotas(rota_ids=rota_ids)
         return Response(
             {"success": True, "mensagem": f"{removidos} vinculos removidos do pedido {pedido.id}."},
             status=status.HTTP_200_OK,
@@ -419,7 +514,7 @@ class GerarPDFRotaView(APIView):
 
             for ordem, pid in enumerate(rota_ids, start=1):
                 p = pedidos_dict[pid]
-                peso_total = sum(i.produto.peso * i.quantidade for i in p.itens.all())
+                peso_total = p.peso_total
                 produtos = ", ".join([f"{i.produto.nome} ({i.quantidade}x)" for i in p.itens.all()])
                 dados_entregas.append(
                     [